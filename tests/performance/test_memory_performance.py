@@ -66,14 +66,35 @@ class TestMemoryPerformance:
         benchmark(batch_save_insights)
         
         # Verify insights were saved (benchmark runs multiple times, so just check file exists)
-        insights_file = os.path.join(temp_memory_dir, "learning_memory", "session_insights.json")
-        assert os.path.exists(insights_file)
+        assert list((Path(temp_memory_dir) / "learning_memory" / "insights").glob("*.jsonl"))
         
-        with open(insights_file, 'r') as f:
-            all_insights = json.load(f)
+        all_insights = memory_utils.load_session_insights()
         # Benchmark runs multiple times, so we have more than 100 insights
         assert len(all_insights["insights"]) >= 100
     
+    def test_session_insights_batch_api_performance(self, benchmark, memory_utils_module, temp_memory_dir):
+        """Benchmark saving 100 insights through the batch API."""
+        memory_utils = memory_utils_module
+        
+        insights = [
+            (f"Performance insight {i}: Optimization technique {i} works well", f"category_{i % 10}")
+            for i in range(100)
+        ]
+        
+        benchmark(memory_utils.save_session_insights, insights)
+        
+        assert len(memory_utils.load_session_insights()["insights"]) >= 100
+    
+    def test_active_memory_batch_update_performance(self, benchmark, memory_utils_module, temp_memory_dir):
+        """Benchmark updating 100 active memory keys through the batch API."""
+        memory_utils = memory_utils_module
+        
+        updates = {f"key_{i}": f"value_{i}" for i in range(100)}
+        
+        benchmark(memory_utils.update_active_memory_many, updates)
+        
+        assert memory_utils.get_active_memory("key_99") == "value_99"
+    
     def test_memory_overview_performance(self, benchmark, memory_utils_module, temp_memory_dir):
         """Benchmark memory system overview generation."""
         memory_utils = memory_utils_module
@@ -125,11 +146,9 @@ class TestMemoryScalability:
                 memory_utils.save_session_insight(insight, category)
         
         # Test that file was created and contains data
-        insights_file = os.path.join(temp_memory_dir, "learning_memory", "session_insights.json")
-        assert os.path.exists(insights_file)
+        assert list((Path(temp_memory_dir) / "learning_memory" / "insights").glob("*.jsonl"))
         
-        with open(insights_file, 'r') as f:
-            all_insights = json.load(f)
+        all_insights = memory_utils.load_session_insights()
         assert len(all_insights["insights"]) == 1000
     
     def test_concurrent_memory_operations(self, memory_utils_module, temp_memory_dir):
@@ -150,11 +169,100 @@ class TestMemoryScalability:
             assert active_memory[f"concurrent_key_{i}"] == f"value_{i}"
         
         # Verify insights were saved
-        insights_file = os.path.join(temp_memory_dir, "learning_memory", "session_insights.json")
-        with open(insights_file, 'r') as f:
-            insights_data = json.load(f)
+        insights_data = memory_utils.load_session_insights()
         assert len(insights_data["insights"]) == 100
 
+    
+    def test_batch_per_item_cost_falls_with_batch_size(self, memory_utils_module, temp_memory_dir):
+        """Test that batching amortises the per-write cost across items."""
+        import time
+        memory_utils = memory_utils_module
+        total = 1000
+        
+        per_item = {}
+        for batch_size in (1, 10, 100, 1000):
+            start = time.perf_counter()
+            for first in range(0, total, batch_size):
+                memory_utils.save_session_insights(
+                    [f"Batch {batch_size} insight {i}" for i in range(first, first + batch_size)]
+                )
+                memory_utils.update_active_memory_many(
+                    {f"batch_key_{i}": i for i in range(first, first + batch_size)}
+                )
+            per_item[batch_size] = (time.perf_counter() - start) / total
+        
+        assert per_item[1000] < per_item[10] < per_item[1]
+        assert len(memory_utils.load_session_insights()["insights"]) == 4 * total
+
+    
+    def test_search_insights_scales(self, memory_utils_module, temp_memory_dir):
+        """Test that searches stay fast on a large insight history."""
+        import random
+        import time
+        memory_utils = memory_utils_module
+        
+        rng = random.Random(42)
+        vocabulary = [f"term{i}" for i in range(2000)]
+        for batch in range(10):
+            memory_utils.save_session_insights([
+                (" ".join(rng.choices(vocabulary, k=12)), f"category_{i % 5}")
+                for i in range(2000)
+            ])
+        memory_utils.search_insights("warm up")  # load the index once
+        
+        start = time.perf_counter()
+        for _ in range(20):
+            results = memory_utils.search_insights("term7 term42 term1999", k=10)
+        elapsed = (time.perf_counter() - start) / 20
+        
+        assert results
+        assert elapsed < 0.05
+    
+    def test_deep_pages_cost_the_same_as_early_ones(self, memory_utils_module, temp_memory_dir):
+        """Test that paging uses the offset index instead of scanning."""
+        import time
+        memory_utils = memory_utils_module
+        
+        for batch in range(20):
+            memory_utils.save_session_insights([f"Insight {batch}-{i}" for i in range(5000)], "bulk")
+        
+        def page_time(offset):
+            start = time.perf_counter()
+            for _ in range(20):
+                memory_utils.get_session_insights(offset=offset, limit=20)
+            return (time.perf_counter() - start) / 20
+        
+        page_time(0)
+        early, deep = page_time(0), page_time(99_000)
+        
+        assert memory_utils.get_insight(99_999)["insight"] == "Insight 19-4999"
+        assert deep < early * 5 + 0.001
+    
+    def test_summary_of_idle_tree_is_cheap(self, memory_utils_module, temp_memory_dir):
+        """Test that an unchanged tree is summarised without listing it again."""
+        import time
+        memory_utils = memory_utils_module
+        
+        project_dir = os.path.join(temp_memory_dir, "project_memory")
+        for i in range(5000):
+            with open(os.path.join(project_dir, f"project_{i}.json"), "w") as f:
+                f.write("{}")
+        past = time.time() - 3600
+        for name in memory_utils.SUMMARY_DIRECTORIES:
+            os.utime(os.path.join(temp_memory_dir, name), (past, past))
+        
+        start = time.perf_counter()
+        memory_utils.memory_summary(fields=["directories"])
+        first = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        for _ in range(20):
+            summary = memory_utils.memory_summary(fields=["directories"])
+        cached = (time.perf_counter() - start) / 20
+        
+        assert summary["directories"]["project_memory"]["count"] == 5000
+        assert cached < first / 3
+
 
 class TestMemoryEfficiency:
     """Test memory usage efficiency of the system."""
@@ -0,0 +1,246 @@
+"""
+Scaling benchmarks: every public memory operation at data sizes from 1e2 up.
+
+Each operation is timed at every size in SIZES and reported as p50/p95/p99
+latency, throughput and bytes read and written per call. Results are written
+as JSON for comparison between runs. Configuration comes from the environment:
+
+- ``AI_MEMORY_BENCH_MAX_SIZE``: largest size to run (default 10000; the full
+  sweep goes to 1000000 and needs several GB of disk and some minutes)
+- ``AI_MEMORY_BENCH_RESULTS``: where to write the results
+  (default ``.benchmarks/scaling.json``)
+- ``AI_MEMORY_BENCH_BASELINE``: results of an earlier run; an operation fails
+  if its p50 latency at some size is more than the tolerance above it
+- ``AI_MEMORY_BENCH_TOLERANCE``: allowed regression in percent (default 25)
+
+Independently of any baseline, operations expected to take constant time may
+not slow down more than FLAT_GROWTH times from the smallest to a larger size,
+which catches accidental O(n) behaviour.
+
+The timing gates depend on a quiet machine, so the suite only runs when
+``AI_MEMORY_BENCH_SCALING=1`` is set; CI runs it as a separate step.
+"""
+import itertools
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+SIZES = [n for n in (100, 1_000, 10_000, 100_000, 1_000_000)
+         if n <= int(os.environ.get("AI_MEMORY_BENCH_MAX_SIZE", "10000"))]
+RESULTS_FILE = Path(os.environ.get("AI_MEMORY_BENCH_RESULTS", ".benchmarks/scaling.json"))
+BASELINE_FILE = os.environ.get("AI_MEMORY_BENCH_BASELINE")
+TOLERANCE = float(os.environ.get("AI_MEMORY_BENCH_TOLERANCE", "25"))
+# Latency growth allowed for constant-time operations, and changes too small to judge
+FLAT_GROWTH = 10
+NOISE_MS = 0.05
+
+CATEGORIES = ["architecture", "performance", "testing", "deployment", "caching",
+              "security", "database", "frontend", "tooling", "process"]
+VOCABULARY = [f"term{i}" for i in range(5000)]
+START = datetime(2024, 1, 1)
+
+pytestmark = pytest.mark.skipif(os.environ.get("AI_MEMORY_BENCH_SCALING") != "1",
+                                reason="set AI_MEMORY_BENCH_SCALING=1 to run the scaling benchmarks")
+
+_results = []
+
+
+def _io_counters():
+    """Bytes read and written by this process through system calls (Linux only)."""
+    try:
+        with open("/proc/self/io") as f:
+            fields = dict(line.split(": ") for line in f.read().splitlines())
+        return int(fields["rchar"]), int(fields["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def _measure(operation, size, call, repeats):
+    """Time ``repeats`` calls of ``call(i)`` and record the statistics."""
+    call(0)  # warm caches and derived indexes outside the timing
+    latencies = []
+    io_before = _io_counters()
+    start = time.perf_counter()
+    for i in range(1, repeats + 1):
+        t0 = time.perf_counter()
+        call(i)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    elapsed = time.perf_counter() - start
+    io_after = _io_counters()
+    latencies.sort()
+    result = {
+        "operation": operation,
+        "size": size,
+        "calls": repeats,
+        "p50_ms": _percentile(latencies, 0.50),
+        "p95_ms": _percentile(latencies, 0.95),
+        "p99_ms": _percentile(latencies, 0.99),
+        "ops_per_sec": repeats / elapsed if elapsed else None,
+        "bytes_read": (io_after[0] - io_before[0]) // repeats if io_before and io_after else None,
+        "bytes_written": (io_after[1] - io_before[1]) // repeats if io_before and io_after else None,
+    }
+    _results.append(result)
+    return result
+
+
+def _baseline():
+    if not BASELINE_FILE:
+        return {}
+    with open(BASELINE_FILE) as f:
+        return {(r["operation"], r["size"]): r for r in json.load(f)["results"]}
+
+
+@pytest.fixture(scope="module", autouse=True)
+def results_file():
+    """Write every recorded result once the module has run."""
+    yield
+    if _results:
+        RESULTS_FILE.parent.mkdir(parents=True, exist_ok=True)
+        with open(RESULTS_FILE, "w") as f:
+            json.dump({
+                "created": datetime.now().isoformat(),
+                "sizes": SIZES,
+                "results": _results,
+            }, f, indent=2)
+
+
+@pytest.fixture(scope="module", params=SIZES, ids=lambda n: f"n={n}")
+def workload(request, tmp_path_factory):
+    """A memory directory holding ``n`` active keys, insights and projects."""
+    import utils.memory_utils as memory_utils
+
+    n = request.param
+    memory_dir = tmp_path_factory.mktemp(f"scaling_{n}")
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(memory_utils, "MEMORY_DIR", memory_dir)
+        rng = random.Random(n)
+
+        for first in range(0, n, 10_000):
+            memory_utils.update_active_memory_many(
+                {f"key_{i}": f"value_{i}" for i in range(first, min(first + 10_000, n))})
+
+        step = timedelta(days=365) / n
+        backend = memory_utils.get_backend()
+        for first in range(0, n, 10_000):
+            backend.append_insights([
+                {
+                    "timestamp": (START + step * i).isoformat(),
+                    "category": CATEGORIES[i % len(CATEGORIES)],
+                    "insight": " ".join(rng.choices(VOCABULARY, k=12)),
+                }
+                for i in range(first, min(first + 10_000, n))
+            ])
+
+        project_dir = memory_dir / "project_memory"
+        project_dir.mkdir(exist_ok=True)
+        for i in range(n):
+            with open(project_dir / f"project_{i}.json", "w") as f:
+                json.dump({"project_name": f"Project {i}", "status": "active",
+                           "architecture": {"frontend": "React", "backend": f"service_{i}"}}, f)
+
+        memory_utils.update_active_memory("current_session", {"project": "project_0"})
+        yield memory_utils, n
+        memory_utils.flush_session_logs()
+        for log in memory_utils._session_logs.values():
+            log.close()
+        memory_utils._session_logs.clear()
+
+
+def _orc_history(m, n):
+    """Write the category-partitioned ORC dataset read_orc_data() is timed on."""
+    m.create_orc_data(({"id": i, "category": CATEGORIES[i % len(CATEGORIES)], "score": i / n} for i in range(n)),
+                      "history", partition_by=("category",))
+    return lambda i: m.read_orc_data("history", columns=["id", "score"],
+                                     filters=[("category", "==", CATEGORIES[i % len(CATEGORIES)]),
+                                              ("id", ">=", (i * 7919) % n), ("id", "<", (i * 7919) % n + 100)])
+
+
+def _day(i):
+    """An ISO date inside the insight history, different for each call."""
+    return (START + timedelta(days=(i * 37) % 360)).date().isoformat()
+
+
+# operation: (call factory, repeats, expected complexity). Constant-time
+# operations are held to FLAT_GROWTH; "n" ones are only compared to a baseline.
+OPERATIONS = {
+    "update_active_memory": (lambda m, n: lambda i: m.update_active_memory(f"key_{i % n}", i), 200, "1"),
+    "update_active_memory_many": (
+        lambda m, n: lambda i: m.update_active_memory_many({f"key_{(i * 10 + j) % n}": i for j in range(10)}),
+        100, "1"),
+    "patch_active_memory": (lambda m, n: lambda i: m.patch_active_memory("current_session", {"step": i}), 200, "1"),
+    "get_active_memory": (lambda m, n: lambda i: m.get_active_memory(f"key_{i % n}"), 500, "1"),
+    "save_session_insight": (lambda m, n: lambda i: m.save_session_insight(f"Scaling note {i}", "testing"), 200, "1"),
+    "save_session_insights": (
+        lambda m, n: lambda i: m.save_session_insights([(f"Batch note {i}-{j}", "testing") for j in range(100)]),
+        50, "1"),
+    "get_insight": (lambda m, n: lambda i: m.get_insight((i * 7919) % n), 500, "1"),
+    "get_session_insights_page": (
+        lambda m, n: lambda i: m.get_session_insights(offset=(i * 7919) % n, limit=20), 200, "1"),
+    "get_session_insights_category": (
+        lambda m, n: lambda i: m.get_session_insights(CATEGORIES[i % len(CATEGORIES)], limit=20), 200, "1"),
+    "get_session_insights_range": (
+        lambda m, n: lambda i: m.get_session_insights(since=_day(i), until=_day(i) + "T12", limit=20),
+        200, "1"),
+    "search_insights": (lambda m, n: lambda i: m.search_insights(f"term{i} term{i * 13 % 5000}", k=10), 50, "n"),
+    "recall": (lambda m, n: lambda i: m.recall(f"term{i} caching latency", k=10), 20, "n"),
+    # Project reads cycle through a working set of 100 projects, like an agent would
+    "get_project_context": (lambda m, n: lambda i: m.get_project_context(f"project_{(i * 7919) % min(n, 100)}"),
+                            500, "1"),
+    "get_project_context_path": (
+        lambda m, n: lambda i: m.get_project_context(f"project_{(i * 7919) % min(n, 100)}",
+                                                     path="architecture.backend"),
+        500, "1"),
+    "save_project_context": (
+        lambda m, n: lambda i: m.save_project_context(f"project_{i % n}", {"project_name": f"Project {i}"}), 200, "1"),
+    "load_all_projects": (lambda m, n: lambda i: sum(1 for _ in m.load_all_projects()), 3, "n"),
+    "build_agent_context": (lambda m, n: lambda i: m.build_agent_context(1000, query=f"term{i}"), 20, "n"),
+    "memory_summary": (lambda m, n: lambda i: m.memory_summary(), 50, "n"),
+    "log_session_activity": (lambda m, n: lambda i: m.log_session_activity(f"Step {i}", "scaling.md"), 500, "1"),
+    "iter_session_insights_first": (
+        lambda m, n: lambda i: sum(1 for _ in itertools.islice(m.iter_session_insights(), 20)), 200, "1"),
+    "iter_session_insights": (lambda m, n: lambda i: sum(1 for _ in m.iter_session_insights()), 5, "n"),
+    "load_session_insights": (lambda m, n: lambda i: m.load_session_insights(), 5, "n"),
+    # One category partition and a narrow id range, so most stripes are skipped
+    "read_orc_data": (_orc_history, 20, "n"),
+    # With nothing to merge or archive these measure the scan that decides so
+    "compact_insights": (lambda m, n: lambda i: m.compact_insights(), 5, "n"),
+    "tier_memory": (lambda m, n: lambda i: m.tier_memory(max_idle_days=3650), 5, "n"),
+    "export_pretty": (lambda m, n: lambda i: m.export_pretty(m.MEMORY_DIR / "export"), 2, "n"),
+}
+
+# Optional dependencies of some operations
+REQUIRES = {"recall": "numpy", "read_orc_data": "pyarrow.orc"}
+
+
+@pytest.mark.parametrize("operation", sorted(OPERATIONS))
+def test_operation_scaling(workload, operation):
+    """Time one operation at one size and check it against its expectations."""
+    memory_utils, n = workload
+    if operation in REQUIRES:
+        pytest.importorskip(REQUIRES[operation])
+    factory, repeats, complexity = OPERATIONS[operation]
+    result = _measure(operation, n, factory(memory_utils, n), repeats)
+
+    baseline = _baseline().get((operation, n))
+    if baseline is not None:
+        limit = baseline["p50_ms"] * (1 + TOLERANCE / 100)
+        assert result["p50_ms"] <= max(limit, baseline["p50_ms"] + NOISE_MS), (
+            f"{operation} at n={n}: p50 {result['p50_ms']:.3f} ms regressed more than "
+            f"{TOLERANCE:g}% from the baseline {baseline['p50_ms']:.3f} ms"
+        )
+
+    smallest = next((r for r in _results if r["operation"] == operation and r["size"] == SIZES[0]), None)
+    if complexity == "1" and smallest is not None and n > SIZES[0]:
+        assert result["p50_ms"] <= max(smallest["p50_ms"] * FLAT_GROWTH, smallest["p50_ms"] + NOISE_MS), (
+            f"{operation} should not depend on data size: p50 {smallest['p50_ms']:.3f} ms at "
+            f"n={SIZES[0]} but {result['p50_ms']:.3f} ms at n={n}"
+        )
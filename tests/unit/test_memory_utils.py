@@ -1,7 +1,9 @@
 """
 Unit tests for memory_utils.py module.
 """
+import itertools
 import os
+import sys
 import json
 import pytest
 from unittest.mock import patch
@@ -53,12 +55,11 @@ class TestMemoryUtils:
         memory_utils.save_session_insight("Test insight", "testing")
         
         # Verify file was created
-        insights_file = os.path.join(temp_memory_dir, "learning_memory", "session_insights.json")
+        insights_file = os.path.join(temp_memory_dir, "learning_memory", "insights", "2024-08.jsonl")
         assert os.path.exists(insights_file)
         
         # Verify content
-        with open(insights_file, "r") as f:
-            data = json.load(f)
+        data = memory_utils.load_session_insights()
         
         assert "insights" in data
         assert len(data["insights"]) == 1
@@ -129,6 +130,1908 @@ class TestMemoryUtils:
             assert saved_data == test_data
 
 
+class TestOrcData:
+    """Test streaming writes to orc_data datasets."""
+    
+    @staticmethod
+    def rows(count, start=0):
+        for i in range(start, start + count):
+            yield {"id": i, "category": "perf" if i % 2 else "test", "score": i / 10}
+    
+    def test_generator_is_written_in_batches(self, memory_utils_module, temp_memory_dir):
+        """Test that a generator streams into a single ORC file."""
+        orc = pytest.importorskip("pyarrow.orc")
+        memory_utils_module.create_orc_data(self.rows(25), "scores", chunk_size=10)
+        
+        table = orc.ORCFile(os.path.join(temp_memory_dir, "orc_data", "scores.orc")).read()
+        assert table.num_rows == 25
+        assert table.column_names == ["id", "category", "score"]
+        assert table.to_pylist()[24] == {"id": 24, "category": "test", "score": 2.4}
+    
+    def test_append_adds_parts_with_the_same_schema(self, memory_utils_module, temp_memory_dir):
+        """Test that appending turns the dataset into part files."""
+        orc = pytest.importorskip("pyarrow.orc")
+        memory_utils_module.create_orc_data(self.rows(5), "scores")
+        memory_utils_module.create_orc_data(({"id": 99} for _ in range(2)), "scores", append=True)
+        
+        dataset = os.path.join(temp_memory_dir, "orc_data", "scores")
+        assert not os.path.exists(dataset + ".orc")
+        assert sorted(os.listdir(dataset)) == ["part-00000.orc", "part-00000.stats.json",
+                                               "part-00001.orc", "part-00001.stats.json"]
+        appended = orc.ORCFile(os.path.join(dataset, "part-00001.orc")).read().to_pylist()
+        assert appended == [{"id": 99, "category": None, "score": None}] * 2
+        
+        memory_utils_module.create_orc_data(self.rows(3), "scores")
+        assert not os.path.exists(dataset)
+        assert orc.ORCFile(dataset + ".orc").read().num_rows == 3
+    
+    def test_schema_covers_every_key_of_the_first_chunk(self, memory_utils_module):
+        """Test that keys missing from the first row still become columns."""
+        pytest.importorskip("pyarrow.orc")
+        memory_utils_module.create_orc_data([{"a": 1}, {"a": 2, "b": "x"}], "sparse")
+        
+        assert memory_utils_module.read_orc_data("sparse") == [{"a": 1, "b": None}, {"a": 2, "b": "x"}]
+    
+    def test_chunk_size_must_be_positive(self, memory_utils_module, temp_memory_dir):
+        """Test that a chunk size below 1 is an error rather than an empty dataset."""
+        for chunk_size in (0, -5):
+            with pytest.raises(ValueError, match="chunk_size"):
+                memory_utils_module.create_orc_data(self.rows(5), "scores", chunk_size=chunk_size)
+        assert os.listdir(os.path.join(temp_memory_dir, "orc_data")) == []
+    
+    def test_unknown_columns_are_rejected(self, memory_utils_module):
+        """Test that later rows cannot silently drop columns the schema lacks."""
+        pytest.importorskip("pyarrow.orc")
+        memory_utils_module.create_orc_data(self.rows(5), "scores")
+        
+        with pytest.raises(ValueError, match="extra"):
+            memory_utils_module.create_orc_data([{"id": 99, "extra": True}], "scores", append=True)
+        with pytest.raises(ValueError, match="late"):
+            memory_utils_module.create_orc_data(itertools.chain(self.rows(3), [{"id": 3, "late": 1}]),
+                                                "other", chunk_size=3)
+        assert memory_utils_module.read_orc_data("scores") == list(self.rows(5))
+    
+    @staticmethod
+    def history(count, start=0):
+        for i in range(start, start + count):
+            yield {"id": i, "category": "perf" if i % 2 else "test", "month": f"2024-0{1 + i // 100}", "score": i / 10}
+    
+    def test_partitioned_dataset_layout(self, memory_utils_module, temp_memory_dir):
+        """Test Hive-style partition directories with stripe statistics."""
+        pytest.importorskip("pyarrow.orc")
+        memory_utils_module.create_orc_data(self.history(300), "history", partition_by=("category", "month"))
+        
+        dataset = os.path.join(temp_memory_dir, "orc_data", "history")
+        assert sorted(os.listdir(dataset)) == ["_partition_types.json", "category=perf", "category=test"]
+        assert sorted(os.listdir(os.path.join(dataset, "category=perf", "month=2024-02"))) == [
+            "part-00000.orc", "part-00000.stats.json"]
+        with open(os.path.join(dataset, "category=perf", "month=2024-02", "part-00000.stats.json")) as f:
+            assert json.load(f)["stripes"][0]["columns"]["id"] == [101, 199, 0]
+    
+    def test_read_prunes_partitions_and_stripes(self, memory_utils_module, monkeypatch):
+        """Test that filtered reads open only matching partitions and stripes."""
+        orc = pytest.importorskip("pyarrow.orc")
+        monkeypatch.setattr(memory_utils_module, "ORC_STRIPE_BYTES", 1024)
+        memory_utils_module.create_orc_data(self.history(300), "history", chunk_size=50,
+                                            partition_by=("category", "month"))
+        
+        opened, stripes = [], []
+        original_init, original_read = orc.ORCFile.__init__, orc.ORCFile.read_stripe
+        monkeypatch.setattr(orc.ORCFile, "__init__", lambda self, source: (opened.append(source), original_init(self, source))[1])
+        monkeypatch.setattr(orc.ORCFile, "read_stripe",
+                            lambda self, i, columns=None: (stripes.append(i), original_read(self, i, columns=columns))[1])
+        
+        rows = memory_utils_module.read_orc_data("history", columns=["id", "month"],
+                                                  filters=[("category", "==", "perf"), ("id", ">=", 297)])
+        
+        assert rows == [{"id": 297, "month": "2024-03"}, {"id": 299, "month": "2024-03"}]
+        assert len(opened) == 3  # only category=perf partitions
+        assert len(stripes) == 1  # stripes below id 297 are skipped
+    
+    def test_numeric_partitions_keep_their_type(self, memory_utils_module):
+        """Test that partition values are read back typed and filtered by value."""
+        pytest.importorskip("pyarrow.orc")
+        rows = [{"id": i, "year": year} for i, year in enumerate([999, 1000, 2024, 2025])]
+        memory_utils_module.create_orc_data(rows[:3], "years", partition_by=("year",))
+        memory_utils_module.create_orc_data(rows[3:], "years", partition_by=("year",), append=True)
+        read = memory_utils_module.read_orc_data
+        
+        assert read("years", filters=[("year", ">", 1000)]) == [{"id": 2, "year": 2024}, {"id": 3, "year": 2025}]
+        assert read("years", filters=[("year", "in", [999])]) == [{"id": 0, "year": 999}]
+        assert read("years", filters=[("year", "==", "2024")]) == [{"id": 2, "year": 2024}]
+    
+    def test_read_projection_and_filters(self, memory_utils_module):
+        """Test column projection and each filter operator."""
+        pytest.importorskip("pyarrow.orc")
+        memory_utils_module.create_orc_data(self.history(20), "history")
+        read = memory_utils_module.read_orc_data
+        
+        assert len(read("history")) == 20
+        assert read("history", columns=["score"], filters=[("id", "==", 3)]) == [{"score": 0.3}]
+        assert [r["id"] for r in read("history", filters=[("id", "in", [1, 2, 50])])] == [1, 2]
+        assert len(read("history", filters=[("category", "!=", "perf"), ("id", "<", 10)])) == 5
+        assert len(read("history", filters=[("id", "not in", [0])])) == 19
+        assert read("history", filters=[("missing", "==", 1)]) == []
+        with pytest.raises(ValueError):
+            read("history", filters=[("id", "~", 1)])
+        with pytest.raises(FileNotFoundError):
+            read("nothing")
+    
+    def test_json_fallback_reads_partitions(self, memory_utils_module, temp_memory_dir, monkeypatch):
+        """Test that the JSON fallback is partitioned and filtered the same way."""
+        monkeypatch.setitem(sys.modules, "pyarrow", None)
+        memory_utils_module.create_orc_data(self.history(300), "history", partition_by=("category", "month"))
+        memory_utils_module.create_orc_data(self.history(10, start=300), "history", append=True,
+                                            partition_by=("category", "month"))
+        
+        dataset = os.path.join(temp_memory_dir, "orc_data", "history_fallback")
+        assert os.path.exists(os.path.join(dataset, "category=test", "month=2024-04", "data.json"))
+        rows = memory_utils_module.read_orc_data("history", columns=["id"],
+                                                  filters=[("month", ">=", "2024-03"), ("id", "in", [250, 251, 305])])
+        assert sorted(r["id"] for r in rows) == [250, 251, 305]
+        
+        memory_utils_module.create_orc_data(({"id": i, "year": 998 + i} for i in range(4)), "years",
+                                            partition_by=("year",))
+        assert [r["id"] for r in memory_utils_module.read_orc_data("years", filters=[("year", ">", 999)])] == [2, 3]
+    
+    def test_json_fallback_streams_and_appends(self, memory_utils_module, temp_memory_dir, monkeypatch):
+        """Test the JSON fallback used when pyarrow is missing."""
+        monkeypatch.setitem(sys.modules, "pyarrow", None)
+        memory_utils_module.create_orc_data(self.rows(25), "scores", chunk_size=10)
+        memory_utils_module.create_orc_data(iter([]), "scores", append=True)
+        memory_utils_module.create_orc_data(self.rows(5, start=25), "scores", append=True)
+        
+        with open(os.path.join(temp_memory_dir, "orc_data", "scores_fallback.json")) as f:
+            saved = json.load(f)
+        assert saved == list(self.rows(30))
+
+
+class TestSessionInsightLog:
+    """Test the append-only session insight log."""
+    
+    def test_insights_are_appended_as_lines(self, memory_utils_module, temp_memory_dir):
+        """Test that each saved insight adds exactly one line to the log."""
+        memory_utils = memory_utils_module
+        
+        memory_utils.save_session_insight("First insight", "testing")
+        memory_utils.save_session_insight("Second insight", "architecture")
+        
+        log_files = list((Path(temp_memory_dir) / "learning_memory" / "insights").glob("*.jsonl"))
+        assert len(log_files) == 1
+        with open(log_files[0], "r") as f:
+            lines = f.read().splitlines()
+        
+        assert len(lines) == 2
+        assert json.loads(lines[1])["insight"] == "Second insight"
+    
+    def test_legacy_insights_file_is_migrated(self, memory_utils_module, temp_memory_dir):
+        """Test that an existing session_insights.json is folded into the log."""
+        memory_utils = memory_utils_module
+        
+        learning_dir = os.path.join(temp_memory_dir, "learning_memory")
+        legacy = {"insights": [
+            {"timestamp": "2024-08-01T09:00:00", "category": "legacy", "insight": "Old insight"}
+        ]}
+        with open(os.path.join(learning_dir, "session_insights.json"), "w") as f:
+            json.dump(legacy, f, indent=2)
+        
+        memory_utils.save_session_insight("New insight", "testing")
+        
+        data = memory_utils.load_session_insights()
+        assert [i["insight"] for i in data["insights"]] == ["Old insight", "New insight"]
+        assert not os.path.exists(os.path.join(learning_dir, "session_insights.json"))
+        assert os.path.exists(os.path.join(learning_dir, "session_insights.json.bak"))
+    
+    def test_legacy_check_runs_once_per_backend(self, memory_utils_module, monkeypatch):
+        """Test that saves do not look for legacy files again and again."""
+        memory_utils = memory_utils_module
+        checks = []
+        original = memory_utils._migrate_legacy_insights
+        monkeypatch.setattr(memory_utils, "_migrate_legacy_insights",
+                            lambda *args: checks.append(args) or original(*args))
+        
+        for i in range(3):
+            memory_utils.save_session_insight(f"Insight {i}", "testing")
+        
+        assert len(checks) == 1
+    
+    def test_partial_trailing_line_is_ignored(self, memory_utils_module, temp_memory_dir):
+        """Test that a torn final record does not break readers."""
+        memory_utils = memory_utils_module
+        
+        memory_utils.save_session_insight("Complete insight", "testing")
+        log_file, = (Path(temp_memory_dir) / "learning_memory" / "insights").glob("*.jsonl")
+        with open(log_file, "a") as f:
+            f.write('{"timestamp": "2024-08-21T12:00:00", "categ')
+        
+        data = memory_utils.load_session_insights()
+        assert len(data["insights"]) == 1
+        
+        # The next append must not be glued onto the partial record
+        memory_utils.save_session_insight("Next insight", "testing")
+        data = memory_utils.load_session_insights()
+        assert [i["insight"] for i in data["insights"]] == ["Complete insight", "Next insight"]
+
+
+class TestMemoryStore:
+    """Test the write-back active memory store."""
+    
+    def test_deferred_flush_on_context_exit(self, memory_utils_module, temp_memory_dir):
+        """Test that writes stay in RAM until the store is closed."""
+        memory_utils = memory_utils_module
+        active_file = Path(temp_memory_dir) / "active_memory.json"
+        
+        with memory_utils.MemoryStore(active_file, flush_every=None) as store:
+            store.set("a", 1)
+            store.set("b", 2)
+            assert store.get("a") == 1
+            assert store.dirty_keys == {"a", "b", "last_updated"}
+            assert not active_file.exists()
+        
+        with open(active_file, "r") as f:
+            data = json.load(f)
+        assert data["a"] == 1 and data["b"] == 2
+    
+    def test_reads_are_copies(self, memory_utils_module, temp_memory_dir):
+        """Test that changing a returned value does not change the store."""
+        memory_utils = memory_utils_module
+        active_file = Path(temp_memory_dir) / "active_memory.json"
+        
+        with memory_utils.MemoryStore(active_file) as store:
+            store.set("session", {"tasks": ["a"]})
+            store.get("session")["tasks"].append("b")
+            store.get()["session"]["tasks"].append("c")
+            assert store.get("session") == {"tasks": ["a"]}
+        
+        memory_utils.update_active_memory("preferences", {"style": "pep8"})
+        memory_utils.get_active_memory("preferences")["style"] = "mutated"
+        memory_utils.get_active_memory()["preferences"]["style"] = "mutated"
+        assert memory_utils.get_active_memory("preferences") == {"style": "pep8"}
+    
+    def test_flush_every_n_operations(self, memory_utils_module, temp_memory_dir):
+        """Test count-based flushing."""
+        memory_utils = memory_utils_module
+        active_file = Path(temp_memory_dir) / "active_memory.json"
+        
+        store = memory_utils.MemoryStore(active_file, flush_every=3)
+        store.set("k1", "v1")
+        store.set("k2", "v2")
+        assert not active_file.exists()
+        store.set("k3", "v3")
+        assert active_file.exists()
+        assert store.dirty_keys == set()
+    
+    def test_flush_interval(self, memory_utils_module, temp_memory_dir):
+        """Test time-based flushing."""
+        import time
+        memory_utils = memory_utils_module
+        active_file = Path(temp_memory_dir) / "active_memory.json"
+        
+        store = memory_utils.MemoryStore(active_file, flush_every=None, flush_interval_ms=20)
+        store.set("k", "v")
+        deadline = time.monotonic() + 2
+        while not active_file.exists() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert active_file.exists()
+        store.close()
+    
+    def test_external_change_is_reloaded(self, memory_utils_module, temp_memory_dir):
+        """Test that a replaced file is re-read instead of served stale."""
+        memory_utils = memory_utils_module
+        memory_utils.update_active_memory("key", "old")
+        assert memory_utils.get_active_memory("key") == "old"
+        
+        active_file = os.path.join(temp_memory_dir, "active_memory.json")
+        tmp_file = active_file + ".new"
+        with open(tmp_file, "w") as f:
+            json.dump({"key": "new", "other": True}, f)
+        os.replace(tmp_file, active_file)
+        
+        assert memory_utils.get_active_memory("key") == "new"
+    
+    def test_flush_merges_dirty_keys_over_external_writes(self, memory_utils_module, temp_memory_dir):
+        """Test that flushing only overwrites the keys this store changed."""
+        memory_utils = memory_utils_module
+        active_file = Path(temp_memory_dir) / "active_memory.json"
+        
+        store = memory_utils.MemoryStore(active_file, flush_every=None)
+        store.set("mine", 1)
+        other = memory_utils.MemoryStore(active_file)
+        other.set("theirs", 2)
+        store.flush()
+        memory_utils.checkpoint_active_memory()
+        
+        with open(active_file, "r") as f:
+            data = json.load(f)
+        assert data["mine"] == 1
+        assert data["theirs"] == 2
+    
+    def test_configure_memory_store_defers_module_writes(self, memory_utils_module, temp_memory_dir):
+        """Test that the module-level wrappers follow the configured policy."""
+        memory_utils = memory_utils_module
+        active_file = Path(temp_memory_dir) / "active_memory.json"
+        
+        memory_utils.configure_memory_store(flush_every=None)
+        try:
+            memory_utils.update_active_memory("key", "value")
+            assert memory_utils.get_active_memory("key") == "value"
+            assert not active_file.exists()
+            memory_utils.flush_memory()
+            assert active_file.exists()
+        finally:
+            memory_utils.configure_memory_store()
+
+
+class TestActiveMemoryJournal:
+    """Test the snapshot plus operation journal behind active memory."""
+    
+    @staticmethod
+    def read(path):
+        with open(path, "r") as f:
+            return f.read()
+    
+    def test_writes_append_to_the_journal(self, memory_utils_module, temp_memory_dir):
+        """Test that updates after the first one are small appends."""
+        memory_utils = memory_utils_module
+        snapshot = os.path.join(temp_memory_dir, "active_memory.json")
+        journal = os.path.join(temp_memory_dir, "active_memory.journal")
+        memory_utils.update_active_memory("notes", "x" * 1000)
+        before = self.read(snapshot)
+        
+        for i in range(5):
+            memory_utils.update_active_memory("counter", i)
+        memory_utils.get_memory_store().delete("notes")
+        
+        assert self.read(snapshot) == before
+        lines = self.read(journal).splitlines()
+        assert len(lines) == 6
+        assert json.loads(lines[0])["ops"][0] == ["set", "counter", 0]
+        assert json.loads(lines[-1])["ops"][1] == ["del", "notes"]
+        assert all(len(line) < 200 for line in lines)
+        
+        fresh = memory_utils.JSONFileBackend(Path(temp_memory_dir)).load_active()
+        assert fresh["counter"] == 4 and "notes" not in fresh
+    
+    def test_patch_journals_only_the_changed_fields(self, memory_utils_module, temp_memory_dir):
+        """Test patching one field of a nested dict."""
+        memory_utils = memory_utils_module
+        memory_utils.update_active_memory("current_session", {"project": "A", "focus": "tests", "notes": "n" * 500})
+        
+        memory_utils.patch_active_memory("current_session", {"focus": "benchmarks"})
+        
+        assert memory_utils.get_active_memory("current_session") == {"project": "A", "focus": "benchmarks", "notes": "n" * 500}
+        line = self.read(os.path.join(temp_memory_dir, "active_memory.journal")).splitlines()[-1]
+        assert json.loads(line)["ops"] == [["patch", "current_session", {"focus": "benchmarks"}],
+                                           ["set", "last_updated", memory_utils.get_active_memory("last_updated")]]
+    
+    def test_replay_reads_only_new_journal_bytes(self, memory_utils_module, temp_memory_dir):
+        """Test that a reader replays the journal tail incrementally."""
+        memory_utils = memory_utils_module
+        memory_utils.update_active_memory("a", 1)
+        memory_utils.update_active_memory("b", 2)
+        reader = memory_utils.JSONFileBackend(Path(temp_memory_dir))
+        assert reader.load_active()["b"] == 2
+        replayed = reader._replayed["pos"]
+        
+        with open(os.path.join(temp_memory_dir, "active_memory.journal"), "ab") as f:
+            f.write(b'{"ops": [["set", "torn"')  # a writer that died mid-line
+        memory_utils.update_active_memory("c", 3)
+        
+        memory = reader.load_active()
+        assert (memory["a"], memory["b"], memory["c"]) == (1, 2, 3)
+        assert "torn" not in memory
+        assert reader._replayed["pos"] > replayed
+    
+    def test_checkpoint_bounds_the_journal(self, memory_utils_module, temp_memory_dir, monkeypatch):
+        """Test that a large journal is folded into a new snapshot."""
+        memory_utils = memory_utils_module
+        monkeypatch.setattr(memory_utils, "ACTIVE_JOURNAL_MAX_BYTES", 1024)
+        journal = os.path.join(temp_memory_dir, "active_memory.journal")
+        memory_utils.update_active_memory("start", True)
+        
+        for i in range(100):
+            memory_utils.update_active_memory(f"key_{i}", i)
+            assert not os.path.exists(journal) or os.path.getsize(journal) <= 1024
+        
+        snapshot = json.loads(self.read(os.path.join(temp_memory_dir, "active_memory.json")))
+        assert snapshot["key_0"] == 0
+        memory_utils.checkpoint_active_memory()
+        assert not os.path.exists(journal)
+        assert json.loads(self.read(os.path.join(temp_memory_dir, "active_memory.json")))["key_99"] == 99
+        assert memory_utils.get_active_memory("key_99") == 99
+
+
+class TestBatchWrites:
+    """Test the batch write entry points."""
+    
+    def test_update_active_memory_many(self, memory_utils_module, temp_memory_dir):
+        """Test that several keys are written in one go."""
+        memory_utils = memory_utils_module
+        
+        memory_utils.update_active_memory_many({"a": 1, "b": 2, "c": 3})
+        
+        with open(os.path.join(temp_memory_dir, "active_memory.json"), "r") as f:
+            data = json.load(f)
+        assert (data["a"], data["b"], data["c"]) == (1, 2, 3)
+        assert "last_updated" in data
+    
+    def test_update_active_memory_many_is_atomic(self, memory_utils_module, temp_memory_dir):
+        """Test that a batch with an unserialisable value changes nothing."""
+        memory_utils = memory_utils_module
+        memory_utils.update_active_memory("a", "original")
+        
+        with pytest.raises(TypeError):
+            memory_utils.update_active_memory_many({"a": "changed", "bad": object()})
+        
+        assert memory_utils.get_active_memory("a") == "original"
+        assert memory_utils.get_active_memory("bad") is None
+        with open(os.path.join(temp_memory_dir, "active_memory.json"), "r") as f:
+            assert json.load(f)["a"] == "original"
+        assert not [name for name in os.listdir(temp_memory_dir) if name.endswith(".tmp")]
+    
+    def test_save_session_insights(self, memory_utils_module, temp_memory_dir):
+        """Test saving strings and (insight, category) pairs together."""
+        memory_utils = memory_utils_module
+        
+        memory_utils.save_session_insights(
+            ["Plain insight", ("Categorised insight", "architecture")], category="testing"
+        )
+        
+        insights = memory_utils.load_session_insights()["insights"]
+        assert [(i["insight"], i["category"]) for i in insights] == [
+            ("Plain insight", "testing"),
+            ("Categorised insight", "architecture"),
+        ]
+    
+    def test_save_session_insights_is_atomic(self, memory_utils_module, temp_memory_dir):
+        """Test that one bad insight keeps the whole batch out of the log."""
+        memory_utils = memory_utils_module
+        memory_utils.save_session_insight("Existing insight", "testing")
+        
+        with pytest.raises(TypeError):
+            memory_utils.save_session_insights(["Good insight", (object(), "testing")])
+        
+        insights = memory_utils.load_session_insights()["insights"]
+        assert [i["insight"] for i in insights] == ["Existing insight"]
+
+
+class TestSerializers:
+    """Test the pluggable serializer layer."""
+    
+    def test_default_writes_compact_json(self, memory_utils_module, temp_memory_dir):
+        """Test that documents are no longer pretty-printed on every write."""
+        memory_utils = memory_utils_module
+        memory_utils.update_active_memory("nested", {"a": [1, 2, 3]})
+        
+        with open(os.path.join(temp_memory_dir, "active_memory.json"), "r") as f:
+            content = f.read()
+        assert "\n" not in content
+        assert json.loads(content)["nested"] == {"a": [1, 2, 3]}
+    
+    def test_orjson_output_is_plain_json(self, memory_utils_module, temp_memory_dir, monkeypatch):
+        """Test that orjson-written files stay readable by the stdlib."""
+        pytest.importorskip("orjson")
+        memory_utils = memory_utils_module
+        monkeypatch.setattr("utils.memory_utils.MEMORY_SERIALIZER", "orjson")
+        
+        memory_utils.update_active_memory("key", "välue")
+        memory_utils.save_session_insight("orjson line", "serialization")
+        
+        with open(os.path.join(temp_memory_dir, "active_memory.json"), "r", encoding="utf-8") as f:
+            assert json.load(f)["key"] == "välue"
+        assert memory_utils.load_session_insights()["insights"][0]["insight"] == "orjson line"
+    
+    def test_msgpack_files_are_detected_by_marker(self, memory_utils_module, temp_memory_dir, monkeypatch):
+        """Test that readers recognise MessagePack files whatever is configured."""
+        pytest.importorskip("msgpack")
+        memory_utils = memory_utils_module
+        monkeypatch.setattr("utils.memory_utils.MEMORY_SERIALIZER", "msgpack")
+        memory_utils.save_project_context("Packed", {"status": "binary"})
+        memory_utils.save_session_insight("Logs stay JSON lines", "serialization")
+        
+        project_file = os.path.join(temp_memory_dir, "project_memory", "packed.json")
+        with open(project_file, "rb") as f:
+            assert f.read().startswith(memory_utils.MSGPACK_MAGIC)
+        
+        monkeypatch.setattr("utils.memory_utils.MEMORY_SERIALIZER", "json")
+        assert memory_utils.get_project_context("Packed") == {"status": "binary"}
+        assert memory_utils.load_session_insights()["insights"][0]["insight"] == "Logs stay JSON lines"
+    
+    def test_missing_optional_serializer_falls_back(self, memory_utils_module, temp_memory_dir, monkeypatch):
+        """Test that selecting an uninstalled serializer writes JSON instead."""
+        memory_utils = memory_utils_module
+        monkeypatch.setattr("utils.memory_utils.msgpack", None)
+        monkeypatch.setattr("utils.memory_utils.MEMORY_SERIALIZER", "msgpack")
+        
+        with pytest.warns(UserWarning):
+            memory_utils.update_active_memory("key", "value")
+        
+        with open(os.path.join(temp_memory_dir, "active_memory.json"), "r") as f:
+            assert json.load(f)["key"] == "value"
+    
+    def test_export_pretty(self, memory_utils_module, populated_memory_dir, tmp_path):
+        """Test the human-readable export."""
+        memory_utils = memory_utils_module
+        memory_utils.save_session_insight("Exported insight", "debugging")
+        
+        dest = memory_utils.export_pretty(tmp_path / "export")
+        
+        with open(dest / "active_memory.json", "r") as f:
+            content = f.read()
+        assert content.startswith("{\n  ")
+        assert json.loads(content)["current_session"]["project"] == "Test Project"
+        with open(dest / "project_memory" / "test_project.json", "r") as f:
+            assert json.load(f)["project_name"] == "Test Application"
+        with open(dest / "learning_memory" / "session_insights.json", "r") as f:
+            assert json.load(f)["insights"][0]["insight"] == "Exported insight"
+
+
+class TestReadCache:
+    """Test the stat-validated document read cache."""
+    
+    @pytest.fixture
+    def project_file(self, memory_utils_module, temp_memory_dir):
+        memory_utils_module.clear_read_cache()
+        path = os.path.join(temp_memory_dir, "project_memory", "cached.json")
+        with open(path, "w") as f:
+            json.dump({"status": "v1", "architecture": {"database": "SQLite"}}, f)
+        return path
+    
+    def test_unchanged_file_is_a_hit(self, memory_utils_module, project_file):
+        """Test that repeated reads of an unchanged file skip parsing."""
+        memory_utils = memory_utils_module
+        
+        for _ in range(5):
+            assert memory_utils.get_project_context("cached")["status"] == "v1"
+        
+        stats = memory_utils.read_cache_stats()
+        assert stats["misses"] == 1
+        assert stats["hits"] == 4
+    
+    def test_replaced_file_is_reparsed(self, memory_utils_module, project_file):
+        """Test that a rewritten file invalidates the cached copy."""
+        memory_utils = memory_utils_module
+        assert memory_utils.get_project_context("cached")["status"] == "v1"
+        
+        memory_utils.save_project_context("cached", {"status": "v2"})
+        
+        assert memory_utils.get_project_context("cached")["status"] == "v2"
+        assert memory_utils.read_cache_stats()["misses"] == 2
+    
+    def test_callers_cannot_corrupt_the_cache(self, memory_utils_module, project_file):
+        """Test that changes to a returned context, nested ones included, are not cached."""
+        memory_utils = memory_utils_module
+        
+        context = memory_utils.get_project_context("cached")
+        context["status"] = "mutated"
+        context["architecture"]["database"] = "mutated"
+        
+        assert memory_utils.get_project_context("cached") == {"status": "v1", "architecture": {"database": "SQLite"}}
+    
+    def test_lru_eviction(self, memory_utils_module, temp_memory_dir):
+        """Test that the cache stays within its bound."""
+        memory_utils = memory_utils_module
+        memory_utils.clear_read_cache()
+        memory_utils.configure_read_cache(max_entries=3)
+        try:
+            for i in range(5):
+                memory_utils.save_project_context(f"project {i}", {"index": i})
+                memory_utils.get_project_context(f"project {i}")
+            
+            stats = memory_utils.read_cache_stats()
+            assert stats["entries"] == 3
+            assert stats["evictions"] == 2
+            
+            # The most recently used project is still cached
+            memory_utils.get_project_context("project 4")
+            assert memory_utils.read_cache_stats()["hits"] == 1
+        finally:
+            memory_utils.configure_read_cache()
+
+
+class TestGetSessionInsights:
+    """Test category lookups and pagination of session insights."""
+    
+    @pytest.fixture
+    def insights(self, memory_utils_module, temp_memory_dir):
+        memory_utils_module.save_session_insights(
+            [(f"Insight {i}", ["performance", "testing", "architecture"][i % 3]) for i in range(30)]
+        )
+        return memory_utils_module
+    
+    def test_grouped_by_category(self, insights):
+        """Test the all-categories view used by the demo."""
+        grouped = insights.get_session_insights()
+        
+        assert set(grouped) == {"performance", "testing", "architecture"}
+        assert len(grouped["performance"]) == 10
+        assert grouped["testing"][0]["insight"] == "Insight 1"
+    
+    def test_single_category(self, insights):
+        """Test reading one category through the index."""
+        result = insights.get_session_insights("performance")
+        
+        assert list(result) == ["performance"]
+        assert [r["insight"] for r in result["performance"]] == [f"Insight {i}" for i in range(0, 30, 3)]
+        assert insights.get_session_insights("unknown") == {"unknown": []}
+    
+    def test_pagination(self, insights):
+        """Test limit/offset within a category and across the history."""
+        page = insights.get_session_insights("testing", limit=3, offset=2)
+        assert [r["insight"] for r in page["testing"]] == ["Insight 7", "Insight 10", "Insight 13"]
+        
+        page = insights.get_session_insights(limit=4, offset=26)
+        assert sum(len(records) for records in page.values()) == 4
+        assert page["architecture"][0]["insight"] == "Insight 26"
+    
+    def test_category_index_reads_only_matching_records(self, insights, monkeypatch):
+        """Test that a category lookup fetches just its own records."""
+        backend = insights.get_backend()
+        requested = []
+        original = backend.get_insights
+        monkeypatch.setattr(backend, "get_insights", lambda ids: requested.extend(ids) or original(ids))
+        monkeypatch.setattr(backend, "iter_insight_entries", None)
+        
+        insights.get_session_insights("architecture", limit=2)
+        
+        assert requested == [2, 5]
+    
+    def test_index_follows_new_insights(self, insights):
+        """Test that later saves show up in category lookups."""
+        insights.save_session_insight("Brand new category", "security")
+        insights.save_session_insight("Another performance insight", "performance")
+        
+        assert [r["insight"] for r in insights.get_session_insights("security")["security"]] == ["Brand new category"]
+        assert len(insights.get_session_insights("performance")["performance"]) == 11
+
+
+class TestInsightRandomAccess:
+    """Test id lookups and pagination through the mapped offset index."""
+    
+    @pytest.fixture
+    def insights(self, memory_utils_module, temp_memory_dir):
+        memory_utils_module.save_session_insights([f"Insight {i}" for i in range(1000)], "bulk")
+        return memory_utils_module
+    
+    def test_get_insight(self, insights):
+        """Test fetching single insights by id."""
+        assert insights.get_insight(0)["insight"] == "Insight 0"
+        assert insights.get_insight(999)["insight"] == "Insight 999"
+        assert insights.get_insight(1000) is None
+        assert insights.get_insight(-1) is None
+    
+    def test_page_decodes_only_its_records(self, insights, monkeypatch):
+        """Test that a deep page decodes just the records on it."""
+        insights.get_session_insights(limit=1)  # map the log
+        decoded = []
+        original = insights._json_loads
+        monkeypatch.setattr(insights, "_json_loads", lambda data: decoded.append(data) or original(data))
+        
+        page = insights.get_session_insights(offset=500, limit=20)
+        
+        assert [r["insight"] for r in page["bulk"]] == [f"Insight {i}" for i in range(500, 520)]
+        assert len(decoded) == 20
+    
+    def test_offsets_are_memory_mapped(self, insights, temp_memory_dir):
+        """Test that readers use the offsets sidecar in place."""
+        import sys
+        segment_file, = (Path(temp_memory_dir) / "learning_memory" / "insights").glob("*.jsonl")
+        segment = insights._LogSegment(segment_file)
+        
+        offsets = segment.sync()
+        
+        assert len(offsets) == 1000
+        if sys.byteorder == "little":
+            assert isinstance(offsets, memoryview)
+        assert segment.read_many([3])[0]["insight"] == "Insight 3"
+    
+    def test_appends_after_mapping_are_visible(self, insights):
+        """Test that a mapped segment picks up records appended later."""
+        assert insights.get_insight(1000) is None
+        insights.save_session_insight("Late insight", "bulk")
+        assert insights.get_insight(1000)["insight"] == "Late insight"
+
+
+class TestInsightSegments:
+    """Test the time-partitioned insight log and range queries."""
+    
+    @pytest.fixture
+    def clock(self, memory_utils_module, monkeypatch):
+        from datetime import datetime
+        
+        class Clock:
+            now_value = datetime(2024, 6, 1, 12, 0, 0)
+            
+            @classmethod
+            def utcnow(cls):
+                return cls.now_value
+            
+            now = utcnow
+        
+        monkeypatch.setattr("utils.memory_utils.datetime", Clock)
+        return Clock
+    
+    @pytest.fixture
+    def history(self, memory_utils_module, clock):
+        from datetime import datetime
+        for month in (6, 7, 8):
+            for day in (1, 10, 20):
+                clock.now_value = datetime(2024, month, day, 12, 0, 0)
+                memory_utils_module.save_session_insight(
+                    f"Insight 2024-{month:02d}-{day:02d}", "even" if day % 20 == 0 else "odd"
+                )
+        return memory_utils_module
+    
+    def test_one_segment_per_month(self, history, temp_memory_dir):
+        """Test that insights are split by month and keep dense ids."""
+        insights_dir = Path(temp_memory_dir) / "learning_memory" / "insights"
+        assert sorted(p.name for p in insights_dir.glob("*.jsonl")) == ["2024-06.jsonl", "2024-07.jsonl", "2024-08.jsonl"]
+        
+        manifest = json.loads((insights_dir / "manifest.json").read_text())
+        assert [(s["first_id"], s["count"]) for s in manifest["segments"]] == [(0, 3), (3, 3), (6, None)]
+        
+        backend = history.get_backend()
+        assert backend.next_insight_id() == 9
+        assert backend.get_insights([4, 9])[0]["insight"] == "Insight 2024-07-10"
+        assert [r["insight"] for r in history.iter_session_insights()][5:7] == ["Insight 2024-07-20", "Insight 2024-08-01"]
+    
+    def test_range_query(self, history):
+        """Test since (inclusive) and until (exclusive) with strings and datetimes."""
+        from datetime import datetime
+        result = history.get_session_insights(since="2024-07-10T12:00:00", until=datetime(2024, 8, 10, 12))
+        
+        assert [r["insight"] for r in result["odd"]] == ["Insight 2024-07-10", "Insight 2024-08-01"]
+        assert [r["insight"] for r in result["even"]] == ["Insight 2024-07-20"]
+        
+        page = history.get_session_insights(since="2024-07", limit=2, offset=1)
+        assert sum(len(records) for records in page.values()) == 2
+        assert page["even"][0]["insight"] == "Insight 2024-07-20"
+    
+    def test_range_query_with_category(self, history):
+        """Test that a category lookup combines with a time range."""
+        result = history.get_session_insights("even", since="2024-07-01", until="2024-09-01")
+        assert [r["insight"] for r in result["even"]] == ["Insight 2024-07-20", "Insight 2024-08-20"]
+        assert history.get_session_insights("even", since="2025-01-01") == {"even": []}
+    
+    def test_range_query_skips_other_segments(self, history, monkeypatch):
+        """Test that sealed segments outside the range are never opened."""
+        opened = []
+        original = history._LogSegment.sync
+        
+        def sync(segment):
+            opened.append(segment.path.name)
+            return original(segment)
+        
+        monkeypatch.setattr(history._LogSegment, "sync", sync)
+        history.get_session_insights(since="2024-07-05", until="2024-07-25")
+        
+        assert "2024-06.jsonl" not in opened
+        assert "2024-07.jsonl" in opened
+    
+    def test_out_of_order_timestamps(self, history, clock):
+        """Test that a late-arriving older insight is still found by range queries."""
+        from datetime import datetime
+        clock.now_value = datetime(2024, 7, 15, 8, 0, 0)
+        history.save_session_insight("Late insight", "odd")
+        
+        result = history.get_session_insights("odd", since="2024-07-12", until="2024-07-18")
+        assert [r["insight"] for r in result["odd"]] == ["Late insight"]
+        assert history.get_backend().next_insight_id() == 10
+    
+    def test_single_file_log_is_migrated(self, memory_utils_module, temp_memory_dir, clock):
+        """Test that a session_insights.jsonl from earlier versions is split into segments."""
+        learning_dir = Path(temp_memory_dir) / "learning_memory"
+        with open(learning_dir / "session_insights.jsonl", "w") as f:
+            for month in (3, 4):
+                f.write(json.dumps({"timestamp": f"2024-{month:02d}-01T00:00:00", "category": "old", "insight": f"Month {month}"}) + "\n")
+        
+        memory_utils_module.save_session_insight("Current insight", "new")
+        
+        assert [r["insight"] for r in memory_utils_module.iter_session_insights()] == ["Month 3", "Month 4", "Current insight"]
+        assert memory_utils_module.get_session_insights(until="2024-04-01")["old"][0]["insight"] == "Month 3"
+        assert (learning_dir / "session_insights.jsonl.bak").exists()
+        assert len(list((learning_dir / "insights").glob("*.jsonl"))) == 3
+    
+    def test_range_query_with_sqlite_backend(self, history, monkeypatch):
+        """Test range queries against the SQLite insights table."""
+        history.migrate_to_sqlite()
+        monkeypatch.setattr("utils.memory_utils.MEMORY_BACKEND", "sqlite")
+        
+        result = history.get_session_insights(since="2024-08-01", until="2024-08-15")
+        assert [r["insight"] for r in result["odd"]] == ["Insight 2024-08-01", "Insight 2024-08-10"]
+
+
+class TestInsightCompaction:
+    """Test segment rotation, retention and compaction of the insight log."""
+    
+    @pytest.fixture
+    def background(self, memory_utils_module, monkeypatch):
+        started = []
+        monkeypatch.setattr("utils.memory_utils._compact_in_background", started.append)
+        return started
+    
+    @pytest.fixture
+    def history(self, memory_utils_module, background, monkeypatch):
+        from datetime import datetime
+        
+        class Clock:
+            now_value = datetime(2024, 8, 21, 12, 0, 0)
+            
+            @classmethod
+            def utcnow(cls):
+                return cls.now_value
+        
+        monkeypatch.setattr("utils.memory_utils.datetime", Clock)
+        for month in (6, 7, 8):
+            for day in (1, 10, 20):
+                Clock.now_value = datetime(2024, month, day, 12, 0, 0)
+                memory_utils_module.save_session_insight(
+                    f"Redis note 2024-{month:02d}-{day:02d}", "cache" if day == 1 else "general"
+                )
+        Clock.now_value = datetime(2024, 8, 21, 12, 0, 0)
+        return memory_utils_module
+    
+    def _segment_names(self, temp_memory_dir):
+        manifest = json.loads((Path(temp_memory_dir) / "learning_memory" / "insights" / "manifest.json").read_text())
+        return [entry["name"] for entry in manifest["segments"]]
+    
+    def test_active_segment_rotates_at_size_threshold(self, memory_utils_module, temp_memory_dir,
+                                                       background, mock_datetime, monkeypatch):
+        """Test that a full active segment is sealed and a new one started."""
+        monkeypatch.setattr("utils.memory_utils.INSIGHT_SEGMENT_MAX_BYTES", 200)
+        for i in range(6):
+            memory_utils_module.save_session_insight(f"Insight {i} " + "x" * 60, "testing")
+        
+        assert self._segment_names(temp_memory_dir) == ["2024-08", "2024-08.1", "2024-08.2"]
+        assert [r["insight"][:9] for r in memory_utils_module.iter_session_insights()] == [f"Insight {i}" for i in range(6)]
+        assert len(background) == 2
+    
+    def test_daily_segments_are_merged_per_month(self, memory_utils_module, temp_memory_dir,
+                                                 background, monkeypatch):
+        """Test that compaction folds small daily segments into one per month."""
+        monkeypatch.setattr("utils.memory_utils.INSIGHT_PARTITION", "day")
+        backend = memory_utils_module.get_backend()
+        backend.append_insights([
+            {"timestamp": f"2024-{month:02d}-{day:02d}T08:00:00", "category": "general", "insight": f"{month}/{day}"}
+            for month in (6, 7) for day in (1, 2, 3)
+        ])
+        assert len(self._segment_names(temp_memory_dir)) == 6
+        
+        stats = memory_utils_module.compact_insights()
+        
+        assert stats["records_removed"] == 0
+        assert stats["segments_merged"] == 5
+        assert len(self._segment_names(temp_memory_dir)) == 3
+        assert [r["insight"] for r in memory_utils_module.iter_session_insights()] == [
+            f"{month}/{day}" for month in (6, 7) for day in (1, 2, 3)
+        ]
+        result = memory_utils_module.get_session_insights(since="2024-06-02", until="2024-06-03")
+        assert [r["insight"] for r in result["general"]] == ["6/2"]
+    
+    def test_max_age_retention(self, history, temp_memory_dir):
+        """Test that old sealed insights are dropped and the active segment is kept."""
+        assert history.search_insights("redis", k=20)[0]["id"] >= 0
+        
+        stats = history.compact_insights(max_age_days=45)
+        
+        assert stats["records_removed"] == 4
+        remaining = [r["insight"] for r in history.iter_session_insights()]
+        assert remaining[0] == "Redis note 2024-07-10"
+        assert len(remaining) == 5
+        assert stats["bytes_reclaimed"] > 0
+        # Derived indexes notice the rewrite and follow the new ids
+        assert sorted(r["id"] for r in history.search_insights("redis", k=20)) == list(range(5))
+    
+    def test_max_per_category_from_config(self, history, temp_memory_dir):
+        """Test that per-category limits keep the newest records of each category."""
+        with open(os.path.join(temp_memory_dir, "memory_config.json"), "w") as f:
+            json.dump({"insight_retention": {"max_per_category": 2}}, f)
+        
+        stats = history.compact_insights()
+        
+        assert stats["records_removed"] == 5
+        remaining = [r["insight"] for r in history.iter_session_insights()]
+        assert remaining == ["Redis note 2024-07-01", "Redis note 2024-08-01", "Redis note 2024-08-10", "Redis note 2024-08-20"]
+    
+    def test_stats_in_memory_summary(self, history):
+        """Test that memory_summary() reports the log and compaction totals."""
+        history.compact_insights(max_age_days=45)
+        history.compact_insights(max_age_days=45)
+        
+        log = history.memory_summary()["insight_log"]
+        assert log["records"] == 5
+        assert log["segments"] == 2
+        assert log["compaction"]["runs"] == 1
+        assert log["compaction"]["records_removed"] == 4
+    
+    def test_retention_with_sqlite_backend(self, history, monkeypatch):
+        """Test retention rules against the SQLite insights table."""
+        history.migrate_to_sqlite()
+        monkeypatch.setattr("utils.memory_utils.MEMORY_BACKEND", "sqlite")
+        
+        stats = history.compact_insights(max_per_category=1)
+        
+        assert stats["records_removed"] == 7
+        assert [r["insight"] for r in history.iter_session_insights()] == ["Redis note 2024-08-01", "Redis note 2024-08-20"]
+        assert history.memory_summary()["insight_log"]["compaction"]["runs"] == 1
+    
+    def test_sqlite_pagination_after_compaction(self, history, monkeypatch):
+        """Test that offsets count positions once compaction has deleted rows."""
+        history.migrate_to_sqlite()
+        monkeypatch.setattr("utils.memory_utils.MEMORY_BACKEND", "sqlite")
+        
+        history.compact_insights(max_per_category=2)
+        
+        remaining = [r["insight"] for r in history.iter_session_insights()]
+        assert len(remaining) == 4
+        for offset in range(len(remaining)):
+            page = history.get_session_insights(offset=offset, limit=1)
+            assert [r["insight"] for records in page.values() for r in records] == [remaining[offset]]
+            assert history.get_insight(offset)["insight"] == remaining[offset]
+        assert history.get_session_insights(offset=len(remaining), limit=3) == {}
+        history.save_session_insight("After compaction", "testing")
+        assert history.get_insight(len(remaining))["insight"] == "After compaction"
+
+
+class TestInsightSearch:
+    """Test full-text search over session insights."""
+    
+    @pytest.fixture
+    def insights(self, memory_utils_module, temp_memory_dir):
+        memory_utils_module.save_session_insights([
+            ("Redis caching cut API latency in half", "performance"),
+            ("Database indexes on timestamp columns speed up range queries", "performance"),
+            ("Feature flags let us ship the frontend redesign safely", "deployment"),
+            ("Caching database query results needs careful invalidation", "architecture"),
+        ])
+        return memory_utils_module
+    
+    def test_ranked_results(self, insights):
+        """Test that the best BM25 match comes first."""
+        results = insights.search_insights("redis caching latency", k=2)
+        
+        assert len(results) == 2
+        assert results[0]["insight"] == "Redis caching cut API latency in half"
+        assert results[0]["score"] > results[1]["score"]
+        assert results[0]["id"] == 0
+    
+    def test_category_filter(self, insights):
+        """Test restricting matches to one category."""
+        results = insights.search_insights("database", k=10, category="architecture")
+        
+        assert [r["insight"] for r in results] == ["Caching database query results needs careful invalidation"]
+        assert insights.search_insights("database", category="no_such_category") == []
+    
+    def test_index_is_updated_incrementally(self, insights, temp_memory_dir):
+        """Test that each save appends to the index instead of rebuilding it."""
+        entries_file = os.path.join(temp_memory_dir, "learning_memory", "search_index", "entries.jsonl")
+        with open(entries_file, "rb") as f:
+            before = f.read()
+        
+        insights.save_session_insight("Connection pooling fixed the timeout storm", "performance")
+        
+        with open(entries_file, "rb") as f:
+            after = f.read()
+        assert after.startswith(before)
+        assert len(after.splitlines()) == 5
+        assert insights.search_insights("pooling")[0]["id"] == 4
+    
+    def test_index_survives_a_new_process(self, insights):
+        """Test that a fresh index instance loads the persisted entries."""
+        fresh = insights.InsightSearchIndex(insights.get_backend())
+        
+        hits = fresh.search("frontend redesign", k=1)
+        assert hits[0][0] == 2
+    
+    def test_index_rebuilds_after_log_rewrite(self, insights, temp_memory_dir):
+        """Test that a rewritten log (here: a legacy migration) rebuilds the index."""
+        assert insights.search_insights("redis")[0]["id"] == 0
+        
+        legacy = {"insights": [{"timestamp": "2024-01-01T00:00:00", "category": "legacy", "insight": "Old redis note"}]}
+        with open(os.path.join(temp_memory_dir, "learning_memory", "session_insights.json"), "w") as f:
+            json.dump(legacy, f)
+        insights._backends.clear()  # legacy files are migrated when a backend is first used
+        insights.save_session_insight("Newest insight", "testing")
+        
+        results = {r["id"]: r["insight"] for r in insights.search_insights("redis")}
+        assert results == {0: "Old redis note", 1: "Redis caching cut API latency in half"}
+    
+    def test_search_with_sqlite_backend(self, memory_utils_module, monkeypatch):
+        """Test that search works on top of any backend."""
+        memory_utils = memory_utils_module
+        monkeypatch.setattr("utils.memory_utils.MEMORY_BACKEND", "sqlite")
+        memory_utils.save_session_insight("SQLite write-ahead logging allows concurrent readers", "storage")
+        
+        assert memory_utils.search_insights("concurrent readers")[0]["category"] == "storage"
+
+
+class TestRecall:
+    """Test semantic recall over session insights."""
+    
+    @pytest.fixture
+    def insights(self, memory_utils_module, temp_memory_dir):
+        pytest.importorskip("numpy")
+        memory_utils_module.save_session_insights([
+            ("Redis caching cut API latency in half", "performance"),
+            ("Use pytest fixtures for temporary directories", "testing"),
+            ("Batch writes reduce file system overhead", "performance"),
+            ("Prefer composition over inheritance", "architecture"),
+        ])
+        return memory_utils_module
+    
+    def test_matches_related_word_forms(self, insights):
+        """Test that recall matches insights phrased differently from the query."""
+        results = insights.recall("the cache layer is caching responses", k=2)
+        
+        assert results[0]["insight"] == "Redis caching cut API latency in half"
+        assert results[0]["id"] == 0
+        assert results[0]["score"] > results[1]["score"] > 0
+        assert insights.recall("writing in batches", k=1)[0]["id"] == 2
+        assert insights.recall("the and of", k=3) == []
+    
+    def test_vectors_are_appended_on_save(self, insights, temp_memory_dir):
+        """Test that each save adds one float32 row to the mapped matrix."""
+        vectors = os.path.join(temp_memory_dir, "learning_memory", "vector_index", "vectors.f32")
+        width = 4 * insights.RECALL_DIMENSIONS
+        assert os.path.getsize(vectors) == 4 * width
+        
+        insights.save_session_insight("Connection pooling fixed the timeout storm", "performance")
+        
+        assert os.path.getsize(vectors) == 5 * width
+        assert insights.recall("pooled connections", k=1)[0]["id"] == 4
+    
+    def test_sketch_search_above_exact_limit(self, insights, monkeypatch):
+        """Test that large indexes rerank only the nearest sketches."""
+        insights.save_session_insights([f"filler note {i} about topic {i % 37}" for i in range(2000)])
+        monkeypatch.setattr(insights, "RECALL_EXACT_LIMIT", 100)
+        monkeypatch.setattr(insights, "RECALL_CANDIDATES", 200)
+        
+        assert insights.recall("temporary directory fixture", k=1)[0]["id"] == 1
+        assert insights.recall("inheritance versus composition", k=1)[0]["id"] == 3
+    
+    def test_recall_with_sqlite_backend(self, memory_utils_module, monkeypatch):
+        """Test that recall works on top of any backend."""
+        pytest.importorskip("numpy")
+        monkeypatch.setattr("utils.memory_utils.MEMORY_BACKEND", "sqlite")
+        memory_utils_module.save_session_insight("SQLite write-ahead logging allows concurrent readers", "storage")
+        
+        assert memory_utils_module.recall("concurrently reading", k=1)[0]["category"] == "storage"
+
+
+class TestInsightDedup:
+    """Test near-duplicate detection when insights are saved."""
+    
+    @staticmethod
+    def configure(temp_memory_dir, **settings):
+        with open(os.path.join(temp_memory_dir, "memory_config.json"), "w") as f:
+            json.dump({"insight_dedup": settings}, f)
+    
+    def stored(self, memory_utils):
+        return [record["insight"] for record in memory_utils.iter_session_insights()]
+    
+    def test_off_by_default(self, memory_utils_module):
+        """Test that without configuration every insight is stored."""
+        memory_utils_module.save_session_insight("Redis caching cut API latency in half")
+        memory_utils_module.save_session_insight("Redis caching cut API latency in half")
+        assert len(self.stored(memory_utils_module)) == 2
+    
+    def test_skip_near_duplicates(self, memory_utils_module, temp_memory_dir):
+        """Test that rephrasings are dropped while distinct insights are kept."""
+        self.configure(temp_memory_dir, mode="skip")
+        memory_utils_module.save_session_insight("Redis caching cut API latency in half", "performance")
+        memory_utils_module.save_session_insight("Redis caching cuts the API latency by half", "performance")
+        memory_utils_module.save_session_insights([
+            "Use pytest fixtures for temporary directories",
+            "Use pytest fixtures for the temporary directories",
+            "Routine note number 1",
+            "Routine note number 2",
+        ])
+        
+        assert self.stored(memory_utils_module) == [
+            "Redis caching cut API latency in half",
+            "Use pytest fixtures for temporary directories",
+            "Routine note number 1",
+            "Routine note number 2",
+        ]
+    
+    def test_count_and_merge(self, memory_utils_module, temp_memory_dir, monkeypatch):
+        """Test that folded duplicates are counted on the original insight."""
+        self.configure(temp_memory_dir, mode="count")
+        for _ in range(3):
+            memory_utils_module.save_session_insight("Batch writes reduce file system overhead")
+        assert memory_utils_module.get_insight(0)["occurrences"] == 3
+        
+        self.configure(temp_memory_dir, mode="merge", threshold=0.95)
+        monkeypatch.setattr("utils.memory_utils.datetime", type("Later", (), {
+            "utcnow": staticmethod(lambda: __import__("datetime").datetime(2030, 1, 1))}))
+        memory_utils_module.save_session_insight("Batch writes reduce the file system overhead")
+        
+        insight = memory_utils_module.get_insight(0)
+        assert insight["occurrences"] == 4
+        assert insight["last_seen"] == "2030-01-01T00:00:00"
+        assert len(self.stored(memory_utils_module)) == 1
+    
+    def test_check_does_not_scan_the_log(self, memory_utils_module, temp_memory_dir, monkeypatch):
+        """Test that a check only consults the in-memory band tables."""
+        self.configure(temp_memory_dir, mode="skip")
+        memory_utils_module.save_session_insights([f"Lesson {i} from sprint {i * 7919}" for i in range(200)])
+        backend = memory_utils_module.get_backend()
+        stored = backend.next_insight_id()
+        read_from = []
+        iter_entries = backend.iter_insight_entries
+        monkeypatch.setattr(backend, "iter_insight_entries", lambda start=0: read_from.append(start) or iter_entries(start))
+        
+        memory_utils_module.save_session_insight("Lesson 3 from the sprint 23757")
+        
+        assert backend.next_insight_id() == stored
+        assert all(start >= stored for start in read_from)
+    
+    def test_invalid_settings(self, memory_utils_module, temp_memory_dir):
+        """Test that unknown modes are rejected."""
+        self.configure(temp_memory_dir, mode="sometimes")
+        with pytest.raises(ValueError):
+            memory_utils_module.save_session_insight("Anything")
+
+
+class TestAgentContext:
+    """Test the token-budgeted agent context builder."""
+    
+    @pytest.fixture
+    def memory(self, memory_utils_module, populated_memory_dir):
+        memory_utils_module.save_project_context("Test Project", {
+            "project_type": "web application",
+            "architecture": {"frontend": "React", "backend": "FastAPI"},
+            "notes": "x" * 2000,
+        })
+        memory_utils_module.save_session_insights(
+            [("Redis caching cut API latency in half", "performance")]
+            + [(f"Routine note number {i}", "general") for i in range(30)]
+        )
+        return memory_utils_module
+    
+    def test_sections_in_priority_order(self, memory):
+        """Test that session, preferences, project and insights are combined."""
+        context = memory.build_agent_context(max_tokens=2000)
+        
+        headers = [line for line in context.splitlines() if line.startswith("## ")]
+        assert headers == ["## Session", "## User Preferences", "## Project: Test Project", "## Insights"]
+        assert "- project: Test Project" in context
+        assert '- architecture: {"frontend":"React","backend":"FastAPI"}' in context
+        assert context.split("## Insights\n")[1].splitlines()[0] == "- [general] Routine note number 29"
+    
+    def test_stays_within_budget(self, memory):
+        """Test that long values are shortened and low-priority lines dropped."""
+        for max_tokens in (60, 150, 400):
+            context = memory.build_agent_context(max_tokens=max_tokens)
+            assert len(context) <= max_tokens * memory.CONTEXT_CHARS_PER_TOKEN
+        
+        small = memory.build_agent_context(max_tokens=60)
+        assert small.startswith("## Session")
+        assert "## Insights" not in small
+        assert "…" in memory.build_agent_context(max_tokens=400)
+    
+    def test_query_ranks_matching_insights_first(self, memory):
+        """Test that insights matching the query come before recent ones."""
+        context = memory.build_agent_context(max_tokens=2000, query="caching latency")
+        
+        insights = context.split("## Insights\n")[1].splitlines()
+        assert insights[0] == "- [performance] Redis caching cut API latency in half"
+        assert insights[1] == "- [general] Routine note number 29"
+    
+    def test_cached_by_inputs(self, memory, temp_memory_dir, monkeypatch):
+        """Test that unchanged inputs reuse the assembled block, in and across processes."""
+        first = memory.build_agent_context(max_tokens=500, query="caching")
+        calls = []
+        ranking = memory._context_insights
+        monkeypatch.setattr(memory, "_context_insights", lambda *args: calls.append(args) or ranking(*args))
+        
+        assert memory.build_agent_context(max_tokens=500, query="caching") == first
+        memory._context_cache.clear()
+        assert memory.build_agent_context(max_tokens=500, query="caching") == first
+        assert calls == []
+        assert len(os.listdir(os.path.join(temp_memory_dir, ".context_cache"))) == 1
+        
+        memory.save_session_insight("Newest caching insight", "performance")
+        assert "Newest caching insight" in memory.build_agent_context(max_tokens=500, query="caching")
+        memory.update_active_memory("current_session", {"project": "Other"})
+        assert "## Project" not in memory.build_agent_context(max_tokens=500, query="caching")
+        assert len(calls) == 2
+
+
+class TestProjectPaths:
+    """Test path-addressed reads of project documents."""
+    
+    @pytest.fixture
+    def research(self, memory_utils_module, temp_memory_dir):
+        example = Path(__file__).parents[2] / "examples" / "research_project.json"
+        with open(example) as f:
+            document = json.load(f)
+        with open(os.path.join(temp_memory_dir, "project_memory", "research.json"), "w") as f:
+            json.dump(document, f, indent=2)
+        return document
+    
+    def test_reads_nested_values(self, memory_utils_module, research):
+        """Test dotted paths into objects and arrays."""
+        memory_utils = memory_utils_module
+        
+        assert memory_utils.get_project_context("research", path="current_progress") == research["current_progress"]
+        assert memory_utils.get_project_context("research", path="current_progress.in_progress.1") == "Statistical significance testing"
+        assert memory_utils.get_project_context("research", path=["status"]) == research["status"]
+    
+    def test_missing_paths(self, memory_utils_module, research):
+        """Test that unknown keys, indexes and projects give None."""
+        memory_utils = memory_utils_module
+        
+        assert memory_utils.get_project_context("research", path="no_such_key") is None
+        assert memory_utils.get_project_context("research", path="current_progress.in_progress.99") is None
+        assert memory_utils.get_project_context("research", path="status.deeper") is None
+        assert memory_utils.get_project_context("unknown", path="status") is None
+    
+    def test_only_the_value_is_decoded(self, memory_utils_module, research, temp_memory_dir, monkeypatch):
+        """Test that repeated reads decode just the requested bytes."""
+        memory_utils = memory_utils_module
+        memory_utils.get_project_context("research", path="status")  # builds the span index
+        memory_utils.get_project_context("research", path="status")  # and caches it
+        assert os.path.exists(os.path.join(temp_memory_dir, ".project_paths", "research.json"))
+        
+        decoded = []
+        original = memory_utils._json_loads
+        monkeypatch.setattr(memory_utils, "_json_loads", lambda data: decoded.append(len(data)) or original(data))
+        
+        value = memory_utils.get_project_context("research", path="current_progress.in_progress")
+        
+        assert value == research["current_progress"]["in_progress"]
+        assert decoded == [len(json.dumps(value, indent=2).replace("\n", "\n    "))]
+    
+    def test_index_follows_saves(self, memory_utils_module, research):
+        """Test that a rewritten project is re-indexed."""
+        memory_utils = memory_utils_module
+        assert memory_utils.get_project_context("research", path="status") == research["status"]
+        
+        memory_utils.save_project_context("research", dict(research, status="published", extra={"a": [1, 2]}))
+        
+        assert memory_utils.get_project_context("research", path="status") == "published"
+        assert memory_utils.get_project_context("research", path="extra.a.1") == 2
+    
+    def test_sqlite_backend(self, memory_utils_module, research, monkeypatch):
+        """Test that SQLite extracts the value in the database."""
+        memory_utils = memory_utils_module
+        monkeypatch.setattr("utils.memory_utils.MEMORY_BACKEND", "sqlite")
+        memory_utils.save_project_context("research", research)
+        
+        assert memory_utils.get_project_context("research", path="current_progress.in_progress.0") == research["current_progress"]["in_progress"][0]
+        assert memory_utils.get_project_context("research", path="research_focus") == research["research_focus"]
+        assert memory_utils.get_project_context("research", path="missing") is None
+
+
+class TestLoadAllProjects:
+    """Test parallel loading of every project document."""
+    
+    @pytest.fixture
+    def projects(self, memory_utils_module, temp_memory_dir):
+        for i in range(40):
+            memory_utils_module.save_project_context(f"Project {i}", {"index": i, "tags": ["web" if i % 2 else "data"]})
+        return memory_utils_module
+    
+    def test_loads_every_project(self, projects):
+        """Test that all projects arrive with their timings."""
+        results = list(projects.load_all_projects(workers=4))
+        
+        assert sorted(r.name for r in results) == sorted(f"project_{i}" for i in range(40))
+        assert all(r.context["index"] == int(r.name.split("_")[1]) for r in results)
+        assert all(r.seconds >= 0 and r.error is None for r in results)
+    
+    def test_results_do_not_share_the_cache(self, projects):
+        """Test that changing a loaded context leaves later reads untouched."""
+        projects.get_project_context("Project 3")  # cached before the bulk load
+        
+        result, = projects.load_all_projects("project_3")
+        result.context["tags"].append("mutated")
+        
+        assert projects.get_project_context("Project 3") == {"index": 3, "tags": ["web"]}
+    
+    def test_filters(self, projects):
+        """Test glob and predicate filters over project keys."""
+        assert sorted(r.name for r in projects.load_all_projects("project_1?")) == [f"project_{i}" for i in range(10, 20)]
+        assert len(list(projects.load_all_projects(lambda key: key.endswith("7")))) == 4
+    
+    def test_unreadable_file_is_reported(self, projects, temp_memory_dir):
+        """Test that one corrupt file does not stop the scan."""
+        with open(os.path.join(temp_memory_dir, "project_memory", "broken.json"), "w") as f:
+            f.write("{not json")
+        
+        results = {r.name: r for r in projects.load_all_projects(workers=2)}
+        
+        assert len(results) == 41
+        assert results["broken"].context is None
+        assert "Error" in results["broken"].error
+    
+    def test_process_pool(self, projects):
+        """Test parsing in worker processes."""
+        results = list(projects.load_all_projects("project_3*", workers=2, processes=True))
+        assert sorted(r.context["index"] for r in results) == [3] + list(range(30, 40))
+    
+    def test_stopping_early(self, projects):
+        """Test that abandoning the stream shuts the pool down cleanly."""
+        stream = projects.load_all_projects(workers=1)
+        first = next(stream)
+        stream.close()
+        assert first.context is not None
+    
+    def test_sqlite_backend(self, projects, monkeypatch):
+        """Test loading projects stored in SQLite."""
+        projects.migrate_to_sqlite()
+        monkeypatch.setattr("utils.memory_utils.MEMORY_BACKEND", "sqlite")
+        assert len(list(projects.load_all_projects("project_2*", processes=True))) == 11
+
+
+class TestTiering:
+    """Test moving idle memory into the compressed archive."""
+    
+    @pytest.fixture
+    def idle_project(self, memory_utils_module, temp_memory_dir, sample_project_memory):
+        path = Path(temp_memory_dir) / "project_memory" / "old_app.json"
+        path.write_text(json.dumps(sample_project_memory))
+        month_ago = path.stat().st_mtime - 40 * 86400
+        os.utime(path, (month_ago, month_ago))
+        return path
+    
+    def test_idle_project_is_archived_and_still_readable(self, memory_utils_module, temp_memory_dir,
+                                                          idle_project, sample_project_memory):
+        """Test that an idle project moves to archive/ and reads decompress it."""
+        memory_utils = memory_utils_module
+        
+        stats = memory_utils.tier_memory(max_idle_days=30)
+        
+        archived = Path(temp_memory_dir) / "archive" / "project_memory" / "old_app.json.xz"
+        assert stats["projects"] == 1
+        assert stats["bytes_after"] < stats["bytes_before"]
+        assert not idle_project.exists() and archived.exists()
+        assert memory_utils.get_project_context("old_app") == sample_project_memory
+        assert memory_utils.get_project_context("old_app", path="architecture.frontend") == "React"
+        assert memory_utils.get_backend().list_projects() == ["old_app"]
+    
+    def test_process_pool_loads_archived_projects(self, memory_utils_module, idle_project, sample_project_memory):
+        """Test that load_all_projects(processes=True) reads archived projects too."""
+        memory_utils = memory_utils_module
+        memory_utils.save_project_context("new_app", {"status": "active"})
+        memory_utils.tier_memory(max_idle_days=30)
+        
+        results = {r.name: r for r in memory_utils.load_all_projects(workers=2, processes=True)}
+        
+        assert {key: r.error for key, r in results.items()} == {"new_app": None, "old_app": None}
+        assert results["old_app"].context == sample_project_memory
+        assert results["new_app"].context == {"status": "active"}
+    
+    def test_recently_read_project_stays_hot(self, memory_utils_module, idle_project):
+        """Test that the policy follows reads, not just modification times."""
+        memory_utils = memory_utils_module
+        memory_utils.get_project_context("old_app")
+        
+        assert memory_utils.tier_memory(max_idle_days=30)["projects"] == 0
+        assert idle_project.exists()
+    
+    def test_saving_an_archived_project_moves_it_back(self, memory_utils_module, temp_memory_dir, idle_project):
+        """Test that a save writes the hot file and drops the archived copy."""
+        memory_utils = memory_utils_module
+        memory_utils.tier_memory(max_idle_days=30)
+        
+        memory_utils.save_project_context("old_app", {"status": "revived"})
+        
+        assert idle_project.exists()
+        assert not list((Path(temp_memory_dir) / "archive" / "project_memory").iterdir())
+        assert memory_utils.get_project_context("old_app") == {"status": "revived"}
+    
+    def test_archived_insight_segments_are_read_transparently(self, memory_utils_module, temp_memory_dir,
+                                                             mock_datetime):
+        """Test that sealed segments are compressed and the readers still find every insight."""
+        memory_utils = memory_utils_module
+        backend = memory_utils.get_backend()
+        backend.append_insights([
+            {"timestamp": f"2024-{month:02d}-{day:02d}T08:00:00", "category": "general", "insight": f"{month}/{day}"}
+            for month in (6, 7, 8) for day in (1, 2)
+        ])
+        before = list(memory_utils.iter_session_insights())
+        
+        stats = memory_utils.tier_memory(max_idle_days=-1)
+        
+        insights_dir = Path(temp_memory_dir) / "learning_memory" / "insights"
+        assert stats["insight_segments"] == 2
+        assert sorted(p.name for p in insights_dir.glob("*.jsonl")) == ["2024-08.jsonl"]
+        assert len(list((Path(temp_memory_dir) / "archive" / "learning_memory" / "insights").glob("*.jsonl.xz"))) == 2
+        memory_utils.clear_read_cache()
+        backend._log._segments.clear()
+        assert list(memory_utils.iter_session_insights()) == before
+        assert memory_utils.get_insight(2)["insight"] == "7/1"
+        assert [r["insight"] for r in memory_utils.get_session_insights(since="2024-07-02")["general"]] == ["7/2", "8/1", "8/2"]
+        assert memory_utils.memory_summary(["insight_log"])["insight_log"]["archived_segments"] == 2
+        assert memory_utils.compact_insights()["segments_merged"] == 0
+    
+    def test_files_compression_would_grow_stay_hot(self, memory_utils_module, temp_memory_dir):
+        """Test that tiering skips files the xz container would make bigger."""
+        memory_utils = memory_utils_module
+        small = Path(temp_memory_dir) / "project_memory" / "tiny.json"
+        small.write_text('{"status": "done"}')
+        
+        stats = memory_utils.tier_memory(max_idle_days=-1)
+        
+        assert stats["projects"] == 0 and stats["bytes_before"] == stats["bytes_after"] == 0
+        assert small.exists()
+        assert not (Path(temp_memory_dir) / "archive" / "project_memory" / "tiny.json.xz").exists()
+        assert memory_utils.get_project_context("tiny") == {"status": "done"}
+    
+    def test_idle_session_logs_are_compressed(self, memory_utils_module, temp_memory_dir):
+        """Test that old session logs move to archive/session_logs."""
+        import lzma
+        memory_utils = memory_utils_module
+        log = Path(temp_memory_dir) / "session_logs" / "2024-01-02.md"
+        log.write_text("# Session\n" * 100)
+        
+        stats = memory_utils.tier_memory(max_idle_days=-1)
+        
+        archived = Path(temp_memory_dir) / "archive" / "session_logs" / "2024-01-02.md.xz"
+        assert stats["session_logs"] == 1
+        assert not log.exists()
+        assert lzma.decompress(archived.read_bytes()).decode() == "# Session\n" * 100
+
+
+class TestSessionLogs:
+    """Test the buffered session activity log writer."""
+    
+    @pytest.fixture(autouse=True)
+    def fresh_logs(self, memory_utils_module):
+        yield
+        memory_utils_module.configure_session_logs()
+        for log in memory_utils_module._session_logs.values():
+            log.close()
+        memory_utils_module._session_logs.clear()
+    
+    def _log(self, temp_memory_dir, name="demo_session.md"):
+        return (Path(temp_memory_dir) / "session_logs" / name).read_text()
+    
+    def test_entries_share_one_open_handle(self, memory_utils_module, temp_memory_dir, mock_datetime, monkeypatch):
+        """Test that logging many entries opens the file once."""
+        memory_utils = memory_utils_module
+        opened = []
+        monkeypatch.setattr(memory_utils, "open", lambda *args, **kwargs: opened.append(args[0]) or open(*args, **kwargs),
+                            raising=False)
+        
+        for i in range(50):
+            memory_utils.log_session_activity(f"step {i}", "demo_session.md")
+        
+        assert self._log(temp_memory_dir).splitlines()[:2] == ["- 2024-08-21T12:00:00 step 0",
+                                                               "- 2024-08-21T12:00:00 step 1"]
+        assert len(self._log(temp_memory_dir).splitlines()) == 50
+        assert [Path(p).name for p in opened].count("demo_session.md") == 2  # rotation check, then the handle
+    
+    def test_default_log_file(self, memory_utils_module, temp_memory_dir, mock_datetime):
+        """Test that entries without a log name go to SESSION_LOG_FILE."""
+        memory_utils_module.log_session_activity("Completed backend API")
+        assert self._log(temp_memory_dir, "activity.md") == "- 2024-08-21T12:00:00 Completed backend API\n"
+    
+    def test_buffered_entries_are_written_in_batches(self, memory_utils_module, temp_memory_dir, mock_datetime):
+        """Test flush_every batching and explicit flushing."""
+        memory_utils = memory_utils_module
+        memory_utils.configure_session_logs(flush_every=3)
+        
+        memory_utils.log_session_activity("one", "demo_session.md")
+        memory_utils.log_session_activity("two", "demo_session.md")
+        assert self._log(temp_memory_dir) == ""
+        memory_utils.log_session_activity("three", "demo_session.md")
+        memory_utils.log_session_activity("four", "demo_session.md")
+        assert len(self._log(temp_memory_dir).splitlines()) == 3
+        
+        memory_utils.flush_session_logs()
+        assert self._log(temp_memory_dir).splitlines()[-1] == "- 2024-08-21T12:00:00 four"
+    
+    @pytest.mark.parametrize("durability, flush_every, expected", [
+        ("none", 1, 0),
+        ("batch", 2, 3),
+        ("always", None, 6),
+    ])
+    def test_durability_modes(self, memory_utils_module, mock_datetime, monkeypatch, durability, flush_every, expected):
+        """Test how often each durability mode fsyncs."""
+        memory_utils = memory_utils_module
+        synced = []
+        monkeypatch.setattr(memory_utils.os, "fsync", synced.append)
+        memory_utils.configure_session_logs(flush_every=flush_every, durability=durability)
+        
+        for i in range(6):
+            memory_utils.log_session_activity(f"step {i}", "demo_session.md")
+        
+        assert len(synced) == expected
+    
+    def test_unknown_durability_is_rejected(self, memory_utils_module):
+        """Test that a misspelled durability mode raises."""
+        with pytest.raises(ValueError, match="durability"):
+            memory_utils_module.configure_session_logs(durability="sometimes")
+    
+    def test_logs_rotate_daily(self, memory_utils_module, temp_memory_dir, monkeypatch):
+        """Test that the first entry of a new day moves the previous day's file aside."""
+        from datetime import datetime
+        
+        class Clock:
+            now_value = datetime(2024, 8, 21, 23, 59, 0)
+            
+            @classmethod
+            def utcnow(cls):
+                return cls.now_value
+        
+        memory_utils = memory_utils_module
+        monkeypatch.setattr("utils.memory_utils.datetime", Clock)
+        memory_utils.log_session_activity("late", "demo_session.md")
+        Clock.now_value = datetime(2024, 8, 22, 0, 1, 0)
+        memory_utils.log_session_activity("early", "demo_session.md")
+        
+        assert self._log(temp_memory_dir, "demo_session.2024-08-21.md") == "- 2024-08-21T23:59:00 late\n"
+        assert self._log(temp_memory_dir) == "- 2024-08-22T00:01:00 early\n"
+
+
+class TestMetrics:
+    """Test per-operation metrics and span hooks."""
+    
+    @pytest.fixture
+    def metrics(self, memory_utils_module):
+        memory_utils_module.enable_metrics()
+        yield memory_utils_module
+        memory_utils_module.enable_metrics(False)
+        del memory_utils_module._span_hooks[:]
+        memory_utils_module._instrumentation_on = False
+    
+    def test_disabled_by_default(self, memory_utils_module):
+        """Test that nothing is collected until metrics are enabled."""
+        memory_utils_module.update_active_memory("key", "value")
+        
+        snapshot = memory_utils_module.metrics_snapshot()
+        assert snapshot["enabled"] is False
+        assert snapshot["operations"] == {}
+    
+    def test_counts_calls_latency_bytes_and_cache_hits(self, metrics, sample_project_memory):
+        """Test the counters collected for public operations."""
+        metrics.save_project_context("web", sample_project_memory)
+        metrics.clear_read_cache()
+        metrics.get_project_context("web")
+        metrics.get_project_context("web")
+        metrics.save_session_insight("Metrics are cheap", "observability")
+        
+        operations = metrics.metrics_snapshot()["operations"]
+        reads = operations["get_project_context"]
+        assert reads["calls"] == 2 and reads["errors"] == 0
+        assert sum(reads["buckets"]) == 2 and reads["seconds"] > 0
+        assert (reads["cache_hits"], reads["cache_misses"]) == (1, 1)
+        assert reads["bytes_read"] == len(json.dumps(sample_project_memory, separators=(",", ":")))
+        assert operations["save_project_context"]["bytes_written"] == reads["bytes_read"]
+        assert operations["save_session_insight"]["bytes_written"] > 0
+        assert operations["save_session_insight"]["lock_waits"] >= 1
+    
+    def test_errors_are_counted(self, metrics):
+        """Test that a raising call counts as an error and still re-raises."""
+        with pytest.raises(TypeError):
+            metrics.save_project_context("broken", {"value": object()})
+        
+        assert metrics.metrics_snapshot()["operations"]["save_project_context"]["errors"] == 1
+    
+    def test_generators_count_one_call(self, metrics):
+        """Test that iterating, even partly, records a single call."""
+        metrics.save_session_insights([f"Insight {i}" for i in range(5)])
+        
+        first = next(metrics.iter_session_insights())
+        
+        assert first["insight"] == "Insight 0"
+        import gc
+        gc.collect()
+        assert metrics.metrics_snapshot()["operations"]["iter_session_insights"]["calls"] == 1
+    
+    def test_prometheus_and_json_exports(self, metrics, temp_memory_dir):
+        """Test the textfile and snapshot formats."""
+        metrics.update_active_memory("key", "value")
+        
+        prom = metrics.write_metrics()
+        text = prom.read_text()
+        snapshot = json.loads(metrics.write_metrics(Path(temp_memory_dir) / "metrics.json").read_text())
+        
+        assert prom == Path(temp_memory_dir) / "metrics.prom"
+        assert "# TYPE ai_memory_operation_seconds histogram" in text
+        assert 'ai_memory_calls_total{operation="update_active_memory"} 1' in text
+        assert 'ai_memory_operation_seconds_bucket{operation="update_active_memory",le="+Inf"} 1' in text
+        assert snapshot["operations"]["update_active_memory"]["calls"] == 1
+    
+    def test_span_hooks_wrap_nested_operations(self, memory_utils_module):
+        """Test that span hooks see each operation, including nested ones."""
+        from contextlib import contextmanager
+        memory_utils = memory_utils_module
+        spans = []
+        
+        @contextmanager
+        def hook(name):
+            spans.append(("start", name))
+            yield
+            spans.append(("end", name))
+        
+        memory_utils.update_active_memory("current_session", {"project": "Web"})
+        memory_utils.add_span_hook(hook)
+        try:
+            memory_utils.get_project_context()
+        finally:
+            memory_utils.remove_span_hook(hook)
+        memory_utils.get_active_memory()
+        
+        assert spans == [("start", "get_project_context"), ("start", "get_active_memory"),
+                         ("end", "get_active_memory"), ("end", "get_project_context")]
+        assert memory_utils.metrics_snapshot()["operations"] == {}
+
+
+class TestMemorySummary:
+    """Test the cached directory manifest behind memory_summary()."""
+    
+    @pytest.fixture
+    def settled(self, memory_utils_module, populated_memory_dir):
+        """A populated tree whose directories were last changed an hour ago."""
+        import time
+        past = time.time() - 3600
+        for name in memory_utils_module.SUMMARY_DIRECTORIES:
+            for directory, _, _ in os.walk(os.path.join(populated_memory_dir, name)):
+                os.utime(directory, (past, past))
+        return memory_utils_module
+    
+    @pytest.fixture
+    def scans(self, memory_utils_module, monkeypatch):
+        scanned = []
+        original = memory_utils_module.DirectoryManifest._scan
+        
+        def scan(manifest, name, mtime_ns):
+            scanned.append(name)
+            return original(manifest, name, mtime_ns)
+        
+        monkeypatch.setattr(memory_utils_module.DirectoryManifest, "_scan", scan)
+        return scanned
+    
+    def test_directory_stats(self, settled, populated_memory_dir):
+        """Test file counts and sizes per directory."""
+        directories = settled.memory_summary(fields=["directories"])["directories"]
+        
+        project_file = os.path.join(populated_memory_dir, "project_memory", "test_project.json")
+        assert directories["project_memory"]["count"] == 1
+        assert directories["project_memory"]["bytes"] == os.path.getsize(project_file)
+        assert directories["orc_data"] == {"count": 0, "bytes": 0, "last_modified": directories["orc_data"]["last_modified"]}
+    
+    def test_directory_stats_cover_subdirectories(self, settled, populated_memory_dir):
+        """Test that nested files count and directory entries do not."""
+        def tree_bytes(name):
+            return sum(os.path.getsize(os.path.join(directory, f))
+                       for directory, _, files in os.walk(os.path.join(populated_memory_dir, name)) for f in files)
+        
+        settled.save_session_insight("First nested insight", "testing")
+        stats = settled.memory_summary(fields=["directories"])["directories"]["learning_memory"]
+        assert stats["bytes"] == tree_bytes("learning_memory")
+        assert stats["count"] == sum(len(files) for _, _, files in
+                                     os.walk(os.path.join(populated_memory_dir, "learning_memory")))
+        
+        settled.save_session_insight("An insight appended to the same segment", "testing")
+        assert settled.memory_summary(fields=["directories"])["directories"]["learning_memory"]["bytes"] == \
+            tree_bytes("learning_memory")
+        assert any(name.startswith("insights/") for name in
+                   settled.memory_summary(fields=["files"])["files"]["learning_memory"])
+    
+    def test_fields_select_sections(self, settled, monkeypatch):
+        """Test that only the requested sections are computed."""
+        monkeypatch.setattr(settled, "get_active_memory", lambda key=None: pytest.fail("active memory was read"))
+        
+        summary = settled.memory_summary(fields=["files"])
+        
+        assert set(summary) == {"memory_directory", "last_updated", "files"}
+        assert summary["files"]["project_memory"] == ["test_project.json"]
+        with pytest.raises(ValueError):
+            settled.memory_summary(fields=["everything"])
+    
+    def test_unchanged_directories_are_not_rescanned(self, settled, scans, populated_memory_dir):
+        """Test that listings are reused until a directory changes."""
+        settled.memory_summary(fields=["directories"])
+        assert sorted(scans) == sorted(settled.SUMMARY_DIRECTORIES)
+        
+        scans.clear()
+        settled.memory_summary(fields=["directories"])
+        assert scans == []
+        
+        settled.save_project_context("Second Project", {"status": "new"})
+        directories = settled.memory_summary(fields=["directories"])["directories"]
+        assert scans == ["project_memory"]
+        assert directories["project_memory"]["count"] == 2
+    
+    def test_manifest_persists_across_processes(self, settled, scans, populated_memory_dir):
+        """Test that a new process starts from the saved manifest."""
+        settled.memory_summary(fields=["directories"])
+        assert os.path.exists(os.path.join(populated_memory_dir, "directory_manifest.json"))
+        
+        settled._directory_manifests.clear()
+        scans.clear()
+        assert settled.memory_summary(fields=["directories"])["directories"]["project_memory"]["count"] == 1
+        assert scans == []
+
+
+class TestSQLiteBackend:
+    """Test the SQLite storage backend and the JSON tree migration."""
+    
+    @pytest.fixture
+    def sqlite_utils(self, memory_utils_module, monkeypatch):
+        monkeypatch.setattr("utils.memory_utils.MEMORY_BACKEND", "sqlite")
+        return memory_utils_module
+    
+    def test_round_trip(self, sqlite_utils, temp_memory_dir):
+        """Test active memory, projects and insights through SQLite."""
+        memory_utils = sqlite_utils
+        
+        memory_utils.update_active_memory("current_session", {"project": "Test Project"})
+        memory_utils.save_project_context("Test Project", {"status": "active"})
+        memory_utils.save_session_insight("SQLite works", "storage")
+        
+        assert memory_utils.get_active_memory("current_session") == {"project": "Test Project"}
+        assert memory_utils.get_project_context() == {"status": "active"}
+        assert memory_utils.load_session_insights()["insights"][0]["insight"] == "SQLite works"
+        assert os.path.exists(os.path.join(temp_memory_dir, "memory.db"))
+        assert not os.path.exists(os.path.join(temp_memory_dir, "active_memory.json"))
+    
+    def test_wal_mode_and_indexes(self, sqlite_utils, temp_memory_dir):
+        """Test that the database uses WAL and indexes insight lookups."""
+        import sqlite3
+        memory_utils = sqlite_utils
+        memory_utils.save_session_insight("Indexed", "storage")
+        
+        conn = sqlite3.connect(os.path.join(temp_memory_dir, "memory.db"))
+        try:
+            assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+            indexes = {row[1] for row in conn.execute("PRAGMA index_list(insights)")}
+        finally:
+            conn.close()
+        assert {"idx_insights_category", "idx_insights_timestamp"} <= indexes
+    
+    def test_active_keys_written_individually(self, sqlite_utils):
+        """Test that a delete only removes the affected row."""
+        memory_utils = sqlite_utils
+        store = memory_utils.get_memory_store()
+        store.set("keep", 1)
+        store.set("drop", 2)
+        store.delete("drop")
+        
+        assert memory_utils.get_backend().load_active()["keep"] == 1
+        assert "drop" not in memory_utils.get_backend().load_active()
+    
+    def test_migrate_json_tree(self, memory_utils_module, populated_memory_dir):
+        """Test importing an existing directory tree and switching backends."""
+        memory_utils = memory_utils_module
+        memory_utils.save_session_insight("Migrated insight", "migration")
+        
+        counts = memory_utils.migrate_to_sqlite()
+        
+        assert counts == {"active_keys": 3, "projects": 1, "insights": 1}
+        assert memory_utils.get_backend().name == "sqlite"
+        assert memory_utils.get_active_memory("current_session")["project"] == "Test Project"
+        assert memory_utils.get_project_context("test_project")["project_name"] == "Test Application"
+        assert memory_utils.load_session_insights()["insights"][0]["insight"] == "Migrated insight"
+        
+        # Re-running the migration does not duplicate insights
+        memory_utils.migrate_to_sqlite()
+        assert len(memory_utils.load_session_insights()["insights"]) == 1
+    
+    def test_unknown_backend(self, memory_utils_module, monkeypatch):
+        """Test that a misconfigured backend name is reported."""
+        memory_utils = memory_utils_module
+        monkeypatch.setattr("utils.memory_utils.MEMORY_BACKEND", "nosuch")
+        
+        with pytest.raises(ValueError):
+            memory_utils.get_active_memory()
+
+
+class TestAsyncMemoryStore:
+    """Test the asyncio front end of the memory functions."""
+    
+    @pytest.mark.asyncio
+    async def test_round_trip(self, memory_utils_module, temp_memory_dir):
+        """Test each coroutine against the synchronous functions."""
+        memory_utils = memory_utils_module
+        async with memory_utils.AsyncMemoryStore() as memory:
+            await memory.update_active_memory("status", "testing")
+            await memory.update_active_memory_many({"current_session": {"project": "Async Project"}, "step": 2})
+            await memory.save_project_context("Async Project", {"architecture": {"frontend": "React"}})
+            await memory.save_session_insight("Async saves work", "testing")
+            
+            assert await memory.get_active_memory("status") == "testing"
+            assert await memory.get_project_context(path="architecture.frontend") == "React"
+            assert (await memory.memory_summary(fields=["active"]))["step"] == 2
+        
+        assert memory_utils.get_active_memory("step") == 2
+        assert memory_utils.load_session_insights()["insights"][0]["insight"] == "Async saves work"
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_reads_share_one_load(self, memory_utils_module, temp_memory_dir, monkeypatch):
+        """Test that reads of the same file in flight together load it once."""
+        import asyncio
+        import time
+        memory_utils = memory_utils_module
+        memory_utils.update_active_memory("status", "ready")
+        loads = []
+        original = memory_utils.get_active_memory
+        
+        def slow_load(key=None):
+            loads.append(key)
+            time.sleep(0.05)
+            return original(key)
+        
+        monkeypatch.setattr(memory_utils, "get_active_memory", slow_load)
+        async with memory_utils.AsyncMemoryStore() as memory:
+            results = await asyncio.gather(*(memory.get_active_memory() for _ in range(10)))
+        
+        assert len(loads) == 1
+        assert all(result["status"] == "ready" for result in results)
+        results[0]["status"] = "changed"
+        assert results[1]["status"] == "ready"
+    
+    @pytest.mark.asyncio
+    async def test_shared_loads_give_independent_nested_values(self, memory_utils_module, temp_memory_dir):
+        """Test that callers sharing one load cannot see each other's nested changes."""
+        import asyncio
+        memory_utils = memory_utils_module
+        memory_utils.save_project_context("shared", {"nested": {"a": [1]}})
+        
+        async with memory_utils.AsyncMemoryStore() as memory:
+            a, b = await asyncio.gather(memory.get_project_context("shared"), memory.get_project_context("shared"))
+            a["nested"]["a"].append(2)
+            
+            assert b == {"nested": {"a": [1]}}
+            assert await memory.get_project_context("shared") == {"nested": {"a": [1]}}
+    
+    @pytest.mark.asyncio
+    async def test_operations_on_a_file_keep_call_order(self, memory_utils_module, temp_memory_dir):
+        """Test that reads see exactly the writes issued before them."""
+        import asyncio
+        memory_utils = memory_utils_module
+        async with memory_utils.AsyncMemoryStore(max_workers=8) as memory:
+            operations = []
+            for i in range(20):
+                operations.append(memory.update_active_memory("counter", i))
+                operations.append(memory.get_active_memory("counter"))
+            results = await asyncio.gather(*operations)
+        
+        assert results[1::2] == list(range(20))
+    
+    @pytest.mark.asyncio
+    async def test_event_loop_is_not_blocked(self, memory_utils_module, temp_memory_dir, monkeypatch):
+        """Test that slow I/O runs off the event loop, within the worker bound."""
+        import asyncio
+        import threading
+        import time
+        memory_utils = memory_utils_module
+        running, peak = [0], [0]
+        lock = threading.Lock()
+        
+        def slow_project(name=None, path=None):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+            return {"name": name}
+        
+        monkeypatch.setattr(memory_utils, "get_project_context", slow_project)
+        ticks = []
+        
+        async def ticker():
+            for _ in range(10):
+                ticks.append(time.perf_counter())
+                await asyncio.sleep(0.01)
+        
+        async with memory_utils.AsyncMemoryStore(max_workers=2) as memory:
+            results, _ = await asyncio.gather(
+                asyncio.gather(*(memory.get_project_context(f"Project {i}") for i in range(6))),
+                ticker(),
+            )
+        
+        assert [r["name"] for r in results] == [f"Project {i}" for i in range(6)]
+        assert peak[0] == 2
+        assert max(b - a for a, b in zip(ticks, ticks[1:])) < 0.04
+
+
 class TestMemoryUtilsErrorHandling:
     """Test error handling in memory utilities."""
     
@@ -171,7 +2074,7 @@ class TestMemoryUtilsErrorHandling:
         
         # Verify directory and file were created
         assert learning_dir.exists()
-        assert (learning_dir / "session_insights.json").exists()
+        assert list((learning_dir / "insights").glob("*.jsonl"))
 
 
 class TestMemoryUtilsIntegration:
@@ -198,11 +2101,9 @@ class TestMemoryUtilsIntegration:
         assert "files" in summary
         
         # Verify insights were saved
-        insights_file = os.path.join(temp_memory_dir, "learning_memory", "session_insights.json")
-        assert os.path.exists(insights_file)
+        assert list((Path(temp_memory_dir) / "learning_memory" / "insights").glob("*.jsonl"))
         
-        with open(insights_file, "r") as f:
-            insights_data = json.load(f)
+        insights_data = memory_utils.load_session_insights()
         assert len(insights_data["insights"]) == 2
     
     def test_concurrent_access_simulation(self, memory_utils_module, temp_memory_dir):
@@ -221,9 +2122,7 @@ class TestMemoryUtilsIntegration:
             assert active_memory[f"key_{i}"] == f"value_{i}"
         
         # Verify insights were saved
-        insights_file = os.path.join(temp_memory_dir, "learning_memory", "session_insights.json")
-        with open(insights_file, "r") as f:
-            insights_data = json.load(f)
+        insights_data = memory_utils.load_session_insights()
         
         expected_insights = len([i for i in range(10) if i % 3 == 0])
         assert len(insights_data["insights"]) == expected_insights
\ No newline at end of file
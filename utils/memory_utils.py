@@ -5,142 +5,4533 @@ your AI agent Memory Management Utilities
 Provides tools for managing persistent memory data across sessions.
 """
 
+import argparse
+import asyncio
+import atexit
+import bisect
+import copy
+import fnmatch
+import functools
+import hashlib
+import heapq
+import inspect
+import itertools
 import json
+import lzma
+import math
+import mmap
+import operator
 import os
-from datetime import datetime
+import re
+import shutil
+import sqlite3
+import struct
+import sys
+import threading
+import time
+import warnings
+import zlib
+from array import array
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import (Dict, Any, Callable, ContextManager, Iterable, Iterator, List, NamedTuple, Optional, Set,
+                    Tuple, Union)
+from urllib.parse import quote, unquote
 
 MEMORY_DIR = Path.home() / "ai_memory"
 
+# Storage backend: "json" (one file per document) or "sqlite". When unset, the
+# "backend" key of MEMORY_DIR/memory_config.json decides, defaulting to "json".
+MEMORY_BACKEND = os.environ.get("AI_MEMORY_BACKEND")
+MEMORY_CONFIG_FILE = "memory_config.json"
+SQLITE_DB_FILE = "memory.db"
+
+# Byte-span sidecars for path-addressed project reads, and how many levels of
+# nested objects they cover.
+PROJECT_PATHS_DIR = ".project_paths"
+PROJECT_PATH_INDEX_DEPTH = 2
+
+# Encoding for memory documents: "json" (compact), "pretty", "orjson" or
+# "msgpack". Readers detect the format from the file contents.
+MEMORY_SERIALIZER = os.environ.get("AI_MEMORY_SERIALIZER", "json")
+MSGPACK_MAGIC = b"\x00AIMEM-msgpack\n"
+
+# Number of parsed documents kept by the shared read cache.
+READ_CACHE_SIZE = 256
+
+# Directories covered by memory_summary(), and the cached listing of them
+SUMMARY_DIRECTORIES = ("project_memory", "learning_memory", "orc_data", "session_logs")
+SUMMARY_FIELDS = ("backend", "insight_log", "directories", "files", "active")
+DIRECTORY_MANIFEST_FILE = "directory_manifest.json"
+
+# Active memory writes are appended to active_memory.journal; past this size
+# the journal is folded into a new active_memory.json snapshot
+ACTIVE_JOURNAL_MAX_BYTES = 256 * 1024
+
+# tier_memory() moves files neither read nor written for ARCHIVE_IDLE_DAYS into
+# ARCHIVE_DIR, LZMA-compressed, at the same relative path plus ARCHIVE_SUFFIX
+ARCHIVE_DIR = "archive"
+ARCHIVE_IDLE_DAYS = 90
+ARCHIVE_SUFFIX = ".xz"
+ARCHIVE_ACCESS_FILE = "access.json"
+
+try:
+    import fcntl
+except ImportError:  # Windows: only in-process locking is available
+    fcntl = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import numpy as np
+except ImportError:  # recall() needs numpy; everything else works without it
+    np = None
+
+# Insights are stored in time-partitioned segments under
+# learning_memory/insights/, one per "month" or, with "day", per day.
+INSIGHTS_DIR = "insights"
+INSIGHT_PARTITION = os.environ.get("AI_MEMORY_INSIGHT_PARTITION", "month")
+# The active segment is also sealed once it reaches this size; compaction
+# merges neighbouring sealed segments up to the same size.
+INSIGHT_SEGMENT_MAX_BYTES = 8 * 1024 * 1024
+# Number of segments whose files are kept memory-mapped per insight log
+MAPPED_SEGMENTS = 64
+
+# Semantic recall: width of the hashed feature vectors kept per insight, and
+# the insight count above which recall() narrows the search with sketches
+# instead of scoring every vector
+RECALL_DIMENSIONS = 256
+RECALL_EXACT_LIMIT = 1_000_000
+# Width of the random-projection sketches used above that limit, and how
+# many of the nearest sketches are then scored exactly
+RECALL_SKETCH_BITS = 128
+RECALL_CANDIDATES = 4096
+
+# Near-duplicate insights: what save_session_insight() does with an insight
+# whose SimHash similarity to a stored one reaches DEDUP_THRESHOLD ("off",
+# "skip", "count" or "merge"); overridden by "insight_dedup" in memory_config.json
+DEDUP_MODE = "off"
+DEDUP_THRESHOLD = 0.9
+
+# build_agent_context(): characters per estimated token, how many matching
+# and recent insights are considered (recall matches need a minimum cosine
+# similarity), and how many assembled contexts are kept
+CONTEXT_CHARS_PER_TOKEN = 4
+CONTEXT_INSIGHTS = 20
+CONTEXT_MIN_SIMILARITY = 0.1
+CONTEXT_CACHE_SIZE = 32
+CONTEXT_CACHE_VERSION = 1
+
+# Session logs in session_logs/: the file log_session_activity() writes by
+# default, how many logs keep an open handle, and whether flushed entries are
+# fsynced ("none", "batch": once per flush, "always": every entry)
+SESSION_LOG_FILE = "activity.md"
+SESSION_LOG_HANDLES = 32
+SESSION_LOG_DURABILITY = "none"
+
+# Rows per Arrow record batch when writing orc_data datasets
+ORC_CHUNK_ROWS = 10_000
+# Target stripe size of ORC part files; stripes are the unit read_orc_data() skips
+ORC_STRIPE_BYTES = 8 * 1024 * 1024
+
+# Per-operation metrics (see enable_metrics()), on at import when
+# AI_MEMORY_METRICS is set, and the latency histogram bucket bounds in seconds
+METRICS_ENABLED = os.environ.get("AI_MEMORY_METRICS", "") not in ("", "0")
+METRICS_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Earlier insight formats, migrated into the segments on first use
+INSIGHTS_LOG_FILE = "session_insights.jsonl"
+INSIGHTS_OFFSETS_FILE = "session_insights.offsets"
+LEGACY_INSIGHTS_FILE = "session_insights.json"
+
+_DELETED = object()
+_OFFSET = struct.Struct("<Q")
+
+class OperationMetrics:
+    """Counters for one instrumented operation."""
+
+    __slots__ = ("calls", "errors", "seconds", "buckets", "bytes_read", "bytes_written",
+                 "cache_hits", "cache_misses", "lock_waits", "lock_wait_seconds")
+
+    def __init__(self):
+        self.calls = self.errors = 0
+        self.seconds = 0.0
+        self.buckets = [0] * (len(METRICS_BUCKETS) + 1)  # the last one is +Inf
+        self.bytes_read = self.bytes_written = 0
+        self.cache_hits = self.cache_misses = 0
+        self.lock_waits = 0
+        self.lock_wait_seconds = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {name: list(getattr(self, name)) if name == "buckets" else getattr(self, name)
+                for name in self.__slots__}
+
+class Metrics:
+    """Call counts, latency histograms, bytes, cache hits and lock waits per
+    operation, exported as a JSON snapshot or in the Prometheus text format.
+
+    Operations are the public functions of this module. Bytes, cache lookups
+    and lock waits are charged to the innermost operation running on the
+    thread, or to "other" outside of one. Bytes count what passes through
+    this module's file reads and writes, including records read from
+    memory-mapped insight segments; SQLite I/O is not counted.
+    """
+
+    def __init__(self):
+        self._operations: Dict[str, OperationMetrics] = {}
+        self._lock = threading.Lock()
+
+    def _operation(self, name: str) -> OperationMetrics:
+        operation = self._operations.get(name)
+        if operation is None:
+            operation = self._operations.setdefault(name, OperationMetrics())
+        return operation
+
+    def observe(self, name: str, seconds: float, failed: bool) -> None:
+        with self._lock:
+            operation = self._operation(name)
+            operation.calls += 1
+            operation.errors += failed
+            operation.seconds += seconds
+            operation.buckets[bisect.bisect_left(METRICS_BUCKETS, seconds)] += 1
+
+    def add(self, field: str, amount: Union[int, float] = 1) -> None:
+        """Add to a counter of the operation running on this thread."""
+        with self._lock:
+            operation = self._operation(getattr(_current_operation, "name", None) or "other")
+            setattr(operation, field, getattr(operation, field) + amount)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            operations = {name: operation.as_dict() for name, operation in sorted(self._operations.items())}
+        return {"buckets": list(METRICS_BUCKETS), "operations": operations}
+
+    def prometheus(self) -> str:
+        """The metrics in the Prometheus text exposition format."""
+        operations = self.snapshot()["operations"]
+        lines: List[str] = []
+
+        def family(metric: str, kind: str, help_text: str, field: str) -> None:
+            lines.extend([f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}"])
+            lines.extend(f'{metric}{{operation="{name}"}} {values[field]}' for name, values in operations.items())
+
+        family("ai_memory_calls_total", "counter", "Calls of each memory operation.", "calls")
+        family("ai_memory_errors_total", "counter", "Calls that raised an exception.", "errors")
+        lines.extend(["# HELP ai_memory_operation_seconds Latency of memory operations.",
+                      "# TYPE ai_memory_operation_seconds histogram"])
+        for name, values in operations.items():
+            cumulative = 0
+            for bound, count in zip(METRICS_BUCKETS + ("+Inf",), values["buckets"]):
+                cumulative += count
+                lines.append(f'ai_memory_operation_seconds_bucket{{operation="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'ai_memory_operation_seconds_sum{{operation="{name}"}} {values["seconds"]}')
+            lines.append(f'ai_memory_operation_seconds_count{{operation="{name}"}} {values["calls"]}')
+        family("ai_memory_read_bytes_total", "counter", "Bytes read from memory files.", "bytes_read")
+        family("ai_memory_written_bytes_total", "counter", "Bytes written to memory files.", "bytes_written")
+        family("ai_memory_cache_hits_total", "counter", "Document and context cache hits.", "cache_hits")
+        family("ai_memory_cache_misses_total", "counter", "Document and context cache misses.", "cache_misses")
+        family("ai_memory_lock_waits_total", "counter", "File lock acquisitions.", "lock_waits")
+        family("ai_memory_lock_wait_seconds_total", "counter", "Time spent waiting for file locks.",
+               "lock_wait_seconds")
+        return "\n".join(lines) + "\n"
+
+# The active Metrics (None when disabled) and span hooks. _instrumentation_on is
+# True if either is in use, so a disabled wrapper costs one global lookup.
+_metrics: Optional[Metrics] = Metrics() if METRICS_ENABLED else None
+_span_hooks: List[Callable[[str], ContextManager[Any]]] = []
+_instrumentation_on = METRICS_ENABLED
+_current_operation = threading.local()
+
+def _run_instrumented(name: str, call: Callable[[], Any]) -> Any:
+    with ExitStack() as spans:
+        for hook in list(_span_hooks):
+            spans.enter_context(hook(name))
+        outer = getattr(_current_operation, "name", None)
+        _current_operation.name = name
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = call()
+            failed = False
+            return result
+        finally:
+            _current_operation.name = outer
+            metrics = _metrics
+            if metrics is not None:
+                metrics.observe(name, time.perf_counter() - start, failed)
+
+def _instrument(func: Callable) -> Callable:
+    """Report calls of ``func`` to the metrics and span hooks when they are enabled.
+
+    Generator functions are timed over each step of the iteration, not the
+    time the caller spends between items.
+    """
+    name = func.__name__
+    if inspect.isgeneratorfunction(func):
+        @functools.wraps(func)
+        def generator_wrapper(*args, **kwargs):
+            if not _instrumentation_on:
+                return (yield from func(*args, **kwargs))
+            iterator = func(*args, **kwargs)
+            elapsed, failed = 0.0, True
+            try:
+                with ExitStack() as spans:
+                    for hook in list(_span_hooks):
+                        spans.enter_context(hook(name))
+                    while True:
+                        outer = getattr(_current_operation, "name", None)
+                        _current_operation.name = name
+                        start = time.perf_counter()
+                        try:
+                            item = next(iterator)
+                        except StopIteration as stop:
+                            failed = False
+                            return stop.value
+                        finally:
+                            _current_operation.name = outer
+                            elapsed += time.perf_counter() - start
+                        yield item
+            except GeneratorExit:
+                failed = False  # the caller stopped early
+                raise
+            finally:
+                iterator.close()
+                metrics = _metrics
+                if metrics is not None:
+                    metrics.observe(name, elapsed, failed)
+        return generator_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _instrumentation_on:
+            return func(*args, **kwargs)
+        return _run_instrumented(name, lambda: func(*args, **kwargs))
+    return wrapper
+
+def enable_metrics(enabled: bool = True) -> None:
+    """Start or stop collecting per-operation metrics.
+
+    Stopping discards what was collected. Collection can also be switched on
+    for a whole process by setting AI_MEMORY_METRICS=1.
+    """
+    global _metrics, _instrumentation_on
+    if not enabled:
+        _metrics = None
+    elif _metrics is None:
+        _metrics = Metrics()
+    _instrumentation_on = _metrics is not None or bool(_span_hooks)
+
+def reset_metrics() -> None:
+    """Zero all collected metrics, keeping collection on if it was."""
+    global _metrics
+    if _metrics is not None:
+        _metrics = Metrics()
+
+def metrics_snapshot() -> Dict[str, Any]:
+    """Collected metrics as a JSON-serialisable dict: histogram ``buckets``
+    (upper bounds in seconds, +Inf implied) and per-operation counters."""
+    metrics = _metrics
+    snapshot = metrics.snapshot() if metrics is not None else {"buckets": list(METRICS_BUCKETS), "operations": {}}
+    return dict(snapshot, enabled=metrics is not None)
+
+def write_metrics(path: Optional[Path] = None) -> Path:
+    """Write the metrics atomically, as JSON if ``path`` ends in ``.json`` and
+    otherwise in the Prometheus text format for node_exporter's textfile
+    collector. Defaults to MEMORY_DIR/metrics.prom; returns the path."""
+    path = Path(path) if path else Path(MEMORY_DIR) / "metrics.prom"
+    if path.suffix == ".json":
+        payload = _SERIALIZERS["pretty"].dumps(metrics_snapshot())
+    else:
+        payload = (_metrics or Metrics()).prometheus().encode("utf-8")
+    _atomic_write_bytes(path, payload)
+    return path
+
+def add_span_hook(hook: Callable[[str], ContextManager[Any]]) -> None:
+    """Wrap every instrumented operation in ``hook(operation_name)``, a context
+    manager, e.g. ``lambda name: tracer.start_as_current_span(f"memory.{name}")``
+    for OpenTelemetry. Hooks are entered in the order they were added."""
+    global _instrumentation_on
+    _span_hooks.append(hook)
+    _instrumentation_on = True
+
+def remove_span_hook(hook: Callable[[str], ContextManager[Any]]) -> None:
+    global _instrumentation_on
+    _span_hooks.remove(hook)
+    _instrumentation_on = _metrics is not None or bool(_span_hooks)
+
+@contextmanager
+def _file_lock(f, shared: bool = False) -> Iterator[None]:
+    """Hold an exclusive (or shared) advisory lock on an open file where the OS supports it."""
+    if fcntl is None:
+        yield
+        return
+    if _metrics is None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+    else:
+        start = time.perf_counter()
+        fcntl.flock(f.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        _metrics.add("lock_wait_seconds", time.perf_counter() - start)
+        _metrics.add("lock_waits")
+    try:
+        yield
+    finally:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+def _file_signature(path: Path) -> Optional[Tuple[int, int, int]]:
+    """Return ``(st_mtime_ns, st_size, st_ino)`` for a file, or None if missing."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+def _json_loads(data: Any) -> Any:
+    """Parse JSON text, bytes or a memoryview, using orjson when it is installed."""
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # orjson is stricter (e.g. NaN, huge ints); let the stdlib decide
+            pass
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return json.loads(data)
+
+class Serializer:
+    """Encodes memory documents to bytes and decodes what it wrote."""
+
+    name = ""
+    json_compatible = True
+
+    def dumps(self, obj: Any) -> bytes:
+        raise NotImplementedError
+
+    def loads(self, data: bytes) -> Any:
+        return _json_loads(data)
+
+class JSONSerializer(Serializer):
+    """Compact stdlib JSON, the default."""
+
+    name = "json"
+
+    def dumps(self, obj: Any) -> bytes:
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+class PrettyJSONSerializer(Serializer):
+    """Indented JSON for files people read and edit."""
+
+    name = "pretty"
+
+    def dumps(self, obj: Any) -> bytes:
+        return json.dumps(obj, indent=2, ensure_ascii=False).encode("utf-8")
+
+class ORJSONSerializer(Serializer):
+    """Compact JSON produced by orjson (optional dependency)."""
+
+    name = "orjson"
+
+    def dumps(self, obj: Any) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+class MsgpackSerializer(Serializer):
+    """MessagePack behind the MSGPACK_MAGIC marker (optional dependency)."""
+
+    name = "msgpack"
+    json_compatible = False
+
+    def dumps(self, obj: Any) -> bytes:
+        return MSGPACK_MAGIC + msgpack.packb(obj, use_bin_type=True)
+
+    def loads(self, data: bytes) -> Any:
+        return msgpack.unpackb(data[len(MSGPACK_MAGIC):], raw=False, strict_map_key=False)
+
+_SERIALIZERS: Dict[str, Serializer] = {
+    serializer.name: serializer
+    for serializer in (JSONSerializer(), PrettyJSONSerializer(), ORJSONSerializer(), MsgpackSerializer())
+}
+_OPTIONAL_SERIALIZER_MODULES = {"orjson": "orjson", "msgpack": "msgpack"}
+
+def get_serializer(name: Optional[str] = None) -> Serializer:
+    """Return the named (default: MEMORY_SERIALIZER) serializer.
+
+    Optional serializers whose package is not installed fall back to compact
+    JSON with a warning.
+    """
+    name = name or MEMORY_SERIALIZER
+    if name not in _SERIALIZERS:
+        raise ValueError(f"Unknown memory serializer {name!r}; choose from {sorted(_SERIALIZERS)}")
+    module = _OPTIONAL_SERIALIZER_MODULES.get(name)
+    if module and globals()[module] is None:
+        warnings.warn(f"{module} is not installed; writing compact JSON instead "
+                      f"(install with: pip install {module})")
+        return _SERIALIZERS["json"]
+    return _SERIALIZERS[name]
+
+def _decode_document(data: bytes) -> Any:
+    """Decode a memory document, detecting its format from the leading bytes."""
+    if data.startswith(MSGPACK_MAGIC):
+        if msgpack is None:
+            raise RuntimeError("This memory file is MessagePack encoded; install with: pip install msgpack")
+        return _SERIALIZERS["msgpack"].loads(data)
+    return _json_loads(data)
+
+def _encode_record(obj: Any) -> str:
+    """Encode one record as a single line of compact JSON for logs and SQLite.
+
+    Line-oriented storage always holds JSON text; orjson is used for it when it
+    is the configured serializer.
+    """
+    serializer = get_serializer()
+    if not serializer.json_compatible:
+        serializer = _SERIALIZERS["json"]
+    return serializer.dumps(obj).decode("utf-8")
+
+class ReadCache:
+    """Process-wide LRU cache of parsed memory documents.
+
+    Entries are keyed on path and validated by ``(st_mtime_ns, st_size,
+    st_ino)``, so an unchanged file costs one ``stat``. Atomic writes replace
+    the inode, which invalidates the entry even within one mtime tick. Cached
+    documents are shared between callers and must be treated as read-only.
+    """
+
+    def __init__(self, max_entries: int = READ_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, Tuple[Tuple[int, int, int], Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, path: Path, decode: Callable[[bytes], Any]) -> Any:
+        """Return the decoded contents of ``path``, parsing it only if it changed."""
+        key = str(path)
+        signature = _file_signature(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == signature:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                if _metrics is not None:
+                    _metrics.add("cache_hits")
+                return entry[1]
+            self._entries.pop(key, None)
+            self.misses += 1
+
+        with open(path, 'rb') as f:
+            st = os.fstat(f.fileno())
+            data = f.read()
+        if _metrics is not None:
+            _metrics.add("cache_misses")
+            _metrics.add("bytes_read", len(data))
+        value = decode(data)
+
+        with self._lock:
+            if self.max_entries > 0:
+                self._entries[key] = ((st.st_mtime_ns, st.st_size, st.st_ino), value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return value
+
+    def invalidate(self, path: Optional[Path] = None) -> None:
+        """Drop one path, or every entry when ``path`` is None."""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(str(path), None)
+
+    def stats(self) -> Dict[str, int]:
+        """Hit, miss and eviction counters plus current occupancy."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+            }
+
+_read_cache = ReadCache()
+
+def read_cache_stats() -> Dict[str, int]:
+    """Counters for the shared document read cache."""
+    return _read_cache.stats()
+
+def configure_read_cache(max_entries: int = READ_CACHE_SIZE) -> None:
+    """Resize the shared document read cache; 0 disables caching."""
+    with _read_cache._lock:
+        _read_cache.max_entries = max_entries
+        while len(_read_cache._entries) > max(max_entries, 0):
+            _read_cache._entries.popitem(last=False)
+            _read_cache.evictions += 1
+
+def clear_read_cache() -> None:
+    """Empty the shared document read cache and reset its counters."""
+    with _read_cache._lock:
+        _read_cache._entries.clear()
+        _read_cache.hits = _read_cache.misses = _read_cache.evictions = 0
+
+def _read_document(path: Path) -> Any:
+    """Read a memory document in any supported format, via the read cache."""
+    return _read_cache.load(path, _decode_document)
+
+def _atomic_write_document(path: Path, data: Any, serializer: Optional[Serializer] = None) -> None:
+    """Encode ``data`` to a temporary file and rename it over ``path``."""
+    _atomic_write_bytes(path, (serializer or get_serializer()).dumps(data))
+
+def _atomic_write_bytes(path: Path, payload: bytes) -> None:
+    if _metrics is not None:
+        _metrics.add("bytes_written", len(payload))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp_file, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp_file, path)
+    except BaseException:
+        tmp_file.unlink(missing_ok=True)
+        raise
+
+def _decode_archived(data: bytes) -> Any:
+    return _decode_document(lzma.decompress(data))
+
+def _read_archived_document(path: Path) -> Any:
+    """Read a compressed document from the archive, via the read cache."""
+    return _read_cache.load(path, _decode_archived)
+
+def _archive_file(path: Path, archived: Path) -> Tuple[int, int]:
+    """Compress ``path`` to ``archived`` and remove it; returns the sizes
+    before and after, or ``(0, 0)`` if the file changed meanwhile or would
+    not get smaller (the xz container alone takes some 60 bytes)."""
+    signature = _file_signature(path)
+    with open(path, 'rb') as f:
+        data = f.read()
+    payload = lzma.compress(data)
+    if len(payload) >= len(data):
+        return 0, 0
+    _atomic_write_bytes(archived, payload)
+    if _file_signature(path) != signature:
+        archived.unlink(missing_ok=True)  # written to while compressing: still hot
+        return 0, 0
+    path.unlink()
+    _read_cache.invalidate(path)
+    return len(data), len(payload)
+
+class AccessLog:
+    """Last-read times of memory files, which drive tier_memory().
+
+    A read costs one dict store; the times are merged into
+    ``archive/access.json`` when memory is tiered and at interpreter exit.
+    File atimes are not used, since cached and memory-mapped reads never
+    update them while backup and indexing tools do.
+    """
+
+    def __init__(self, memory_dir: Path):
+        self.memory_dir = memory_dir
+        self.access_file = memory_dir / ARCHIVE_DIR / ARCHIVE_ACCESS_FILE
+        self._pending: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def touch(self, path: Path) -> None:
+        self._pending[str(path)] = time.time()
+
+    def last_access(self) -> Dict[str, float]:
+        """Last read of each file, keyed by its path relative to the memory directory."""
+        return self._merged(dict(self._pending))
+
+    def _merged(self, pending: Dict[str, float]) -> Dict[str, float]:
+        try:
+            times = dict(_read_document(self.access_file))
+        except (FileNotFoundError, ValueError):
+            times = {}
+        for path, when in pending.items():
+            key = Path(os.path.relpath(path, self.memory_dir)).as_posix()
+            times[key] = max(times.get(key, 0.0), when)
+        return times
+
+    def save(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if pending and self.memory_dir.exists():
+                _atomic_write_document(self.access_file, self._merged(pending), _SERIALIZERS["json"])
+
+_access_logs: Dict[Path, AccessLog] = {}
+_access_logs_lock = threading.Lock()
+
+def _access_log(memory_dir: Path) -> AccessLog:
+    with _access_logs_lock:
+        log = _access_logs.get(memory_dir)
+        if log is None:
+            log = _access_logs[memory_dir] = AccessLog(memory_dir)
+        return log
+
+def _save_access_logs() -> None:
+    for log in list(_access_logs.values()):
+        try:
+            log.save()
+        except OSError:
+            pass
+
+atexit.register(_save_access_logs)
+
+def _project_key(project_name: str) -> str:
+    """Normalise a project name the way project files are named."""
+    return project_name.lower().replace(' ', '_')
+
+# Byte-level JSON scanning: locates values inside a document without decoding
+# anything but object keys, for path-addressed reads of large files.
+_JSON_WS = re.compile(rb"[ \t\n\r]*")
+_JSON_STRING = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"')
+_JSON_STRUCTURE = re.compile(rb'["{}\[\]]')
+_JSON_SCALAR = re.compile(rb"[^,}\]\s]+")
+
+def _json_value_end(data: bytes, pos: int) -> int:
+    """End offset of the JSON value starting at ``pos``."""
+    opener = data[pos:pos + 1]
+    if opener == b'"':
+        return _JSON_STRING.match(data, pos).end()
+    if opener not in (b"{", b"["):
+        return _JSON_SCALAR.match(data, pos).end()
+    depth = 0
+    while True:
+        match = _JSON_STRUCTURE.search(data, pos)
+        if match is None:
+            raise ValueError("unterminated JSON value")
+        if match.group() == b'"':
+            pos = _JSON_STRING.match(data, match.start()).end()
+            continue
+        depth += 1 if match.group() in (b"{", b"[") else -1
+        pos = match.end()
+        if depth == 0:
+            return pos
+
+def _json_members(data: bytes, pos: int) -> Iterator[Tuple[Union[str, int], int, int]]:
+    """Yield ``(key or index, start, end)`` for each member of the object or
+    array starting at ``pos``."""
+    is_object = data[pos:pos + 1] == b"{"
+    closer = b"}" if is_object else b"]"
+    pos = _JSON_WS.match(data, pos + 1).end()
+    index = 0
+    while data[pos:pos + 1] != closer:
+        if is_object:
+            key_end = _JSON_STRING.match(data, pos).end()
+            key: Union[str, int] = json.loads(data[pos:key_end])
+            pos = _JSON_WS.match(data, key_end).end() + 1  # the colon
+            pos = _JSON_WS.match(data, pos).end()
+        else:
+            key, index = index, index + 1
+        end = _json_value_end(data, pos)
+        yield key, pos, end
+        pos = _JSON_WS.match(data, end).end()
+        if data[pos:pos + 1] == b",":
+            pos = _JSON_WS.match(data, pos + 1).end()
+
+def _json_path_span(data: bytes, segments: List[Union[str, int]], pos: int = 0) -> Tuple[int, int]:
+    """Byte span of the value at ``segments`` below the value at ``pos``;
+    raises KeyError if there is none."""
+    pos = _JSON_WS.match(data, pos).end()
+    end = _json_value_end(data, pos)
+    for segment in segments:
+        opener = data[pos:pos + 1]
+        if opener == b"{":
+            wanted: Union[str, int] = str(segment)
+        elif opener == b"[" and str(segment).isdigit():
+            wanted = int(segment)
+        else:
+            raise KeyError(segment)
+        for key, start, stop in _json_members(data, pos):
+            if key == wanted:
+                pos, end = start, stop
+                break
+        else:
+            raise KeyError(segment)
+    return pos, end
+
+def _json_span_tree(data: bytes, pos: int, depth: int) -> Optional[Dict[str, Any]]:
+    """``{key: [start, end, subtree]}`` for an object's members, ``depth`` levels deep."""
+    if depth <= 0 or data[pos:pos + 1] != b"{":
+        return None
+    return {
+        key: [start, end, _json_span_tree(data, start, depth - 1)]
+        for key, start, end in _json_members(data, pos)
+    }
+
+def _path_segments(path: Union[str, Iterable[Union[str, int]]]) -> List[Union[str, int]]:
+    """Split a dotted path ("a.b.0"); sequences of keys and indexes pass through."""
+    return path.split(".") if isinstance(path, str) else list(path)
+
+def _walk_path(value: Any, segments: List[Union[str, int]]) -> Any:
+    for segment in segments:
+        if isinstance(value, dict) and str(segment) in value:
+            value = value[str(segment)]
+        elif isinstance(value, list) and str(segment).isdigit() and int(segment) < len(value):
+            value = value[int(segment)]
+        else:
+            raise KeyError(segment)
+    return value
+
+def _append_lines(log_file: Path, lines: List[str]) -> None:
+    """Append newline-terminated records to a log file in a single write.
+
+    If a previous writer died mid-record, the partial line is terminated first
+    so the new records stay readable. If the write fails part way, the file is
+    truncated back so none of the records are left behind.
+    """
+    payload = "".join(line + "\n" for line in lines).encode("utf-8")
+    with open(log_file, 'ab+', buffering=0) as f:
+        size = f.seek(0, os.SEEK_END)
+        if size:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                payload = b"\n" + payload
+        view = memoryview(payload)
+        try:
+            while view:
+                view = view[f.write(view):]
+        except BaseException:
+            f.truncate(size)
+            raise
+    if _metrics is not None:
+        _metrics.add("bytes_written", len(payload))
+    _note_file_write(Path(log_file))
+
+def _as_timestamp(value: Any) -> Optional[str]:
+    """Normalise a datetime or ISO string bound to an ISO string (None passes through)."""
+    if value is None:
+        return None
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+def _insight_period(timestamp: str) -> str:
+    """Partition key of an insight timestamp under INSIGHT_PARTITION."""
+    return timestamp[:10] if INSIGHT_PARTITION == "day" else timestamp[:7]
+
+class _LogSegment:
+    """One JSONL file of the insight log plus its offsets sidecar.
+
+    The sidecar (``<segment>.offsets``) holds an 8-byte header with the
+    segment file's inode, then one little-endian uint64 start offset per
+    record, giving each record a position and O(1) random access. It is
+    brought up to date by scanning only the unindexed tail of the segment, so
+    it recovers from crashes and from appends by other processes.
+
+    Readers ``mmap`` both files: the offsets are used in place as a ``Q``
+    memoryview, and a record is located by slicing the mapped segment from
+    its offset to the next newline, so only the records returned are copied
+    or decoded. Maps are replaced, never closed, when the files grow; older
+    ones are released once no reader holds them.
+
+    A segment moved to ``archive_path`` by tier_memory() is decompressed into
+    memory on first use and indexed there; it never changes afterwards.
+    """
+
+    def __init__(self, path: Path, archive_path: Optional[Path] = None):
+        self.path = path
+        self.offsets_file = path.with_suffix(".offsets")
+        self.archive_path = archive_path
+        self._lock = threading.RLock()
+        self._offsets: Union[memoryview, array] = array('Q')
+        self._data: Union[mmap.mmap, bytes] = b""
+        self._inode: Optional[int] = None
+        self._covered = 0
+        self._archived = False
+
+    def append(self, lines: List[str]) -> None:
+        _append_lines(self.path, lines)
+        self.sync()
+
+    def __len__(self) -> int:
+        return len(self.sync())
+
+    def sync(self) -> Union[memoryview, array]:
+        """Bring the offsets sidecar in line with the segment and return the offsets."""
+        with self._lock:
+            if self._archived:
+                return self._offsets
+            signature = _file_signature(self.path)
+            if signature is None:
+                if not self._load_archive():
+                    self._reset(None)
+                return self._offsets
+            inode, size = signature[2], signature[1]
+            if inode != self._inode or size < self._covered:
+                self._reset(inode)
+            offsets_signature = _file_signature(self.offsets_file)
+            offsets_size = offsets_signature[1] if offsets_signature else 0
+            if self._covered == size and offsets_size == 8 * (len(self._offsets) + 1):
+                return self._offsets
+
+            with open(self.offsets_file, 'a+b') as idx, _file_lock(idx):
+                idx.seek(0)
+                header = idx.read(8)
+                if len(header) < 8 or _OFFSET.unpack(header)[0] != inode:
+                    # Missing, partial or describing a previous file: start over
+                    idx.truncate(0)
+                    idx.write(_OFFSET.pack(inode))
+                    self._reset(inode)
+                indexed = (idx.seek(0, os.SEEK_END) - 8) // 8
+                if indexed != len(self._offsets):
+                    # Another writer extended (or a crash truncated) the sidecar
+                    self._map_offsets(idx, indexed)
+                    self._covered = self._record_end(self._offsets[-1]) if indexed else 0
+
+                new_offsets = self._scan(self._covered)
+                if new_offsets:
+                    packed = array('Q', new_offsets)
+                    if sys.byteorder != "little":
+                        packed.byteswap()
+                    idx.truncate(8 + 8 * indexed)
+                    idx.write(packed.tobytes())
+                    idx.flush()
+                    self._map_offsets(idx, indexed + len(new_offsets))
+            return self._offsets
+
+    def _reset(self, inode: Optional[int]) -> None:
+        self._offsets, self._data, self._inode, self._covered = array('Q'), b"", inode, 0
+
+    def _load_archive(self) -> bool:
+        if self.archive_path is None:
+            return False
+        try:
+            with open(self.archive_path, 'rb') as f:
+                data = lzma.decompress(f.read())
+        except FileNotFoundError:
+            return False
+        offsets, position = array('Q'), 0
+        for line in data.splitlines(keepends=True):
+            offsets.append(position)
+            position += len(line)
+        self._offsets, self._data, self._covered, self._archived = offsets, data, len(data), True
+        return True
+
+    def _map_offsets(self, idx: Any, count: int) -> None:
+        if not count:
+            self._offsets = array('Q')
+        elif sys.byteorder == "little":
+            view = memoryview(mmap.mmap(idx.fileno(), 0, access=mmap.ACCESS_READ))
+            self._offsets = view[8:8 + 8 * count].cast('Q')
+        else:
+            idx.seek(8)
+            self._offsets = array('Q', idx.read(8 * count))
+            self._offsets.byteswap()
+
+    def _mapped(self, end: int) -> Union[mmap.mmap, bytes]:
+        """A read-only map of the segment covering at least ``end`` bytes."""
+        data = self._data
+        if len(data) < end:
+            with self._lock:
+                if len(self._data) < end:
+                    with open(self.path, 'rb') as f:
+                        self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                data = self._data
+        return data
+
+    def _record_end(self, offset: int) -> int:
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            f.readline()
+            return f.tell()
+
+    def _scan(self, start: int) -> List[int]:
+        """Offsets of complete, decodable records from ``start``; advances coverage."""
+        offsets = []
+        with open(self.path, 'rb') as f:
+            f.seek(start)
+            position = start
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # a record still being written
+                if line.strip():
+                    try:
+                        _json_loads(line)
+                        offsets.append(position)
+                    except json.JSONDecodeError:
+                        # A writer interrupted mid-line leaves a partial record behind
+                        pass
+                position += len(line)
+                self._covered = position
+        return offsets
+
+    def _line(self, data: Union[mmap.mmap, bytes], offset: int) -> memoryview:
+        return memoryview(data)[offset:data.find(b"\n", offset)]
+
+    def read_many(self, positions: Iterable[int]) -> List[Optional[Dict[str, Any]]]:
+        offsets = self.sync()
+        data = self._mapped(self._covered)
+        lines = [self._line(data, offsets[position]) if 0 <= position < len(offsets) else None
+                 for position in positions]
+        if _metrics is not None:
+            _metrics.add("bytes_read", sum(len(line) for line in lines if line is not None))
+        return [_json_loads(line) if line is not None else None for line in lines]
+
+    def timestamp_at(self, position: int) -> str:
+        return self.read_many([position])[0].get("timestamp", "")
+
+    def iter_lines(self, position: int = 0) -> Iterator[Tuple[bytes, Dict[str, Any]]]:
+        """Yield ``(encoded line, record)`` for the indexed records from ``position`` on."""
+        offsets = self.sync()
+        data = self._mapped(self._covered)
+        for index in range(max(position, 0), len(offsets)):
+            line = self._line(data, offsets[index])
+            if _metrics is not None:
+                _metrics.add("bytes_read", len(line))
+            yield line.tobytes(), _json_loads(line)
+
+    def iter_from(self, position: int = 0) -> Iterator[Dict[str, Any]]:
+        offsets = self.sync()
+        data = self._mapped(self._covered)
+        for index in range(max(position, 0), len(offsets)):
+            line = self._line(data, offsets[index])
+            if _metrics is not None:
+                _metrics.add("bytes_read", len(line))
+            yield _json_loads(line)
+
+    def bisect(self, timestamp: str, lo: int = 0, hi: Optional[int] = None) -> int:
+        """First position whose timestamp is >= ``timestamp``; the segment must be sorted."""
+        hi = len(self) if hi is None else hi
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.timestamp_at(mid) < timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+class SegmentedInsightLog:
+    """Insight log split into time-partitioned JSONL segments under one directory.
+
+    ``manifest.json`` lists the segments in id order. Each entry records its
+    ``period`` (a month, or a day with INSIGHT_PARTITION = "day"), the id of its
+    first record, and for sealed segments the record count and timestamp
+    range. Only the last segment is appended to; a record from a later period,
+    or the segment reaching INSIGHT_SEGMENT_MAX_BYTES, seals it and starts a
+    new one, so appends never touch old segments and the manifest is rewritten
+    only when a segment is created or found to be out of timestamp order.
+    Range queries pick segments from the manifest and binary-search inside the
+    sorted ones; compact() applies retention to and merges sealed segments.
+
+    ``generation`` is a random token replaced whenever the log is rewritten
+    rather than appended to; derived indexes use it to detect that ids moved.
+    archive() moves cold sealed segments into ``archive_dir``, compressed, and
+    marks them ``archived`` in the manifest; they are still read transparently.
+    """
+
+    def __init__(self, directory: Path, archive_dir: Optional[Path] = None,
+                 access_log: Optional[AccessLog] = None):
+        self.directory = directory
+        self.archive_dir = archive_dir
+        self.access_log = access_log
+        self.manifest_file = directory / "manifest.json"
+        self._lock = threading.RLock()
+        self._segments: "OrderedDict[str, _LogSegment]" = OrderedDict()
+        self._compacting = threading.Lock()
+
+    def manifest(self) -> Dict[str, Any]:
+        """A private copy of the manifest, safe to modify."""
+        try:
+            manifest = _read_document(self.manifest_file)
+        except FileNotFoundError:
+            return {"version": 1, "partition": INSIGHT_PARTITION, "generation": None, "segments": []}
+        return dict(manifest, segments=[dict(entry) for entry in manifest["segments"]])
+
+    def _write_manifest(self, manifest: Dict[str, Any]) -> None:
+        _atomic_write_document(self.manifest_file, manifest)
+
+    def segment(self, name: str) -> _LogSegment:
+        with self._lock:
+            segment = self._segments.get(name)
+            if segment is None:
+                segment = self._segments[name] = _LogSegment(self.directory / f"{name}.jsonl",
+                                                              self._archive_path(name))
+                if len(self._segments) > MAPPED_SEGMENTS:
+                    # Each open segment holds two maps (and file descriptors)
+                    self._segments.popitem(last=False)
+            else:
+                self._segments.move_to_end(name)
+        if self.access_log is not None:
+            self.access_log.touch(segment.path)
+        return segment
+
+    def _archive_path(self, name: str) -> Optional[Path]:
+        return self.archive_dir / f"{name}.jsonl{ARCHIVE_SUFFIX}" if self.archive_dir else None
+
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        """Serialise structural changes within and across processes."""
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with open(self.directory / ".lock", 'ab') as lock, _file_lock(lock):
+                yield
+
+    def _entry_count(self, entry: Dict[str, Any]) -> int:
+        count = entry.get("count")
+        return count if count is not None else len(self.segment(entry["name"]))
+
+    def append(self, records: List[Dict[str, Any]]) -> bool:
+        """Append records, starting new segments as their period advances or
+        the active segment reaches INSIGHT_SEGMENT_MAX_BYTES.
+
+        Returns True if a segment was sealed.
+        """
+        lines = [_encode_record(record) for record in records]
+        with self.locked():
+            manifest = self.manifest()
+            changed = manifest["generation"] is None
+            if changed:
+                manifest["generation"] = os.urandom(8).hex()
+            segments = manifest["segments"]
+            full = bool(segments) and self._file_size(segments[-1]["name"]) >= INSIGHT_SEGMENT_MAX_BYTES
+            sealed = False
+            group: List[int] = []
+            for i, record in enumerate(records):
+                period = _insight_period(str(record.get("timestamp", "")))
+                if not segments or period > segments[-1]["period"] or (full and i == 0):
+                    sealed |= bool(segments)
+                    if group:
+                        self._note_order(manifest, [records[j] for j in group])
+                        self.segment(segments[-1]["name"]).append([lines[j] for j in group])
+                        group = []
+                    self._start_segment(manifest, period, record)
+                    changed = True
+                group.append(i)
+            changed |= self._note_order(manifest, [records[j] for j in group])
+            if changed:
+                self._write_manifest(manifest)
+            self.segment(segments[-1]["name"]).append([lines[j] for j in group])
+            return sealed
+
+    def _file_size(self, name: str) -> int:
+        signature = _file_signature(self.directory / f"{name}.jsonl")
+        return signature[1] if signature else 0
+
+    def _stored_size(self, entry: Dict[str, Any]) -> int:
+        """Bytes on disk for a segment, compressed if it is archived."""
+        if not entry.get("archived"):
+            return self._file_size(entry["name"])
+        signature = _file_signature(self._archive_path(entry["name"]))
+        return signature[1] if signature else 0
+
+    def _start_segment(self, manifest: Dict[str, Any], period: str, first: Dict[str, Any]) -> None:
+        """Seal the active segment, if any, and add a new one for ``period``."""
+        segments = manifest["segments"]
+        first_id = 0
+        if segments:
+            last = segments[-1]
+            segment = self.segment(last["name"])
+            last["count"] = len(segment)
+            if not last["count"]:
+                last["max_ts"] = last["min_ts"]
+            elif last["sorted"]:
+                last["max_ts"] = segment.timestamp_at(last["count"] - 1)
+            else:
+                last["max_ts"] = max(str(r.get("timestamp", "")) for r in segment.iter_from(0))
+            first_id = last["first_id"] + last["count"]
+        names = {entry["name"] for entry in segments}
+        name, n = period, 1
+        while name in names:
+            name, n = f"{period}.{n}", n + 1
+        segments.append({
+            "name": name,
+            "period": period,
+            "first_id": first_id,
+            "count": None,
+            "min_ts": str(first.get("timestamp", "")),
+            "max_ts": None,
+            "sorted": True,
+        })
+
+    def _note_order(self, manifest: Dict[str, Any], records: List[Dict[str, Any]]) -> bool:
+        """Track min timestamp and sortedness of the active segment; True if changed."""
+        entry = manifest["segments"][-1]
+        segment = self.segment(entry["name"])
+        count = len(segment)
+        previous = segment.timestamp_at(count - 1) if count else None
+        changed = False
+        for record in records:
+            timestamp = str(record.get("timestamp", ""))
+            if previous is not None and timestamp < previous and entry["sorted"]:
+                entry["sorted"] = False
+                changed = True
+            if timestamp < entry["min_ts"]:
+                entry["min_ts"] = timestamp
+                changed = True
+            previous = timestamp
+        return changed
+
+    def _located(self) -> Tuple[List[Dict[str, Any]], List[int]]:
+        segments = self.manifest()["segments"]
+        return segments, [entry["first_id"] for entry in segments]
+
+    def next_id(self) -> int:
+        segments = self.manifest()["segments"]
+        if not segments:
+            return 0
+        return segments[-1]["first_id"] + self._entry_count(segments[-1])
+
+    def iter_entries(self, start_id: int = 0) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        segments, first_ids = self._located()
+        if not segments:
+            return
+        index = max(bisect.bisect_right(first_ids, start_id) - 1, 0)
+        for entry in segments[index:]:
+            position = max(start_id - entry["first_id"], 0)
+            insight_id = entry["first_id"] + position
+            for record in self.segment(entry["name"]).iter_from(position):
+                yield insight_id, record
+                insight_id += 1
+
+    def get(self, insight_ids: Iterable[int]) -> List[Optional[Dict[str, Any]]]:
+        insight_ids = list(insight_ids)
+        segments, first_ids = self._located()
+        by_segment: Dict[int, List[int]] = {}
+        for i, insight_id in enumerate(insight_ids):
+            index = bisect.bisect_right(first_ids, insight_id) - 1
+            if index >= 0:
+                by_segment.setdefault(index, []).append(i)
+        results: List[Optional[Dict[str, Any]]] = [None] * len(insight_ids)
+        for index, slots in by_segment.items():
+            entry = segments[index]
+            positions = [insight_ids[i] - entry["first_id"] for i in slots]
+            if entry.get("count") is not None:
+                positions = [p if p < entry["count"] else -1 for p in positions]
+            for slot, record in zip(slots, self.segment(entry["name"]).read_many(positions)):
+                results[slot] = record
+        return results
+
+    def id_ranges(self, since: Optional[str], until: Optional[str]) -> List[Tuple[int, int, bool]]:
+        """Id ranges ``(start, stop, exact)`` that can hold insights in [since, until).
+
+        Ranges from sorted segments are exact; the rest must be filtered.
+        """
+        ranges: List[Tuple[int, int, bool]] = []
+        for entry in self.manifest()["segments"]:
+            segment = self.segment(entry["name"])
+            count = self._entry_count(entry)
+            if not count:
+                continue
+            max_ts = entry.get("max_ts")
+            if max_ts is None and entry.get("sorted", True):
+                max_ts = segment.timestamp_at(count - 1)
+            if since is not None and max_ts is not None and max_ts < since:
+                continue
+            if until is not None and entry["min_ts"] >= until:
+                continue
+            first_id = entry["first_id"]
+            if not entry.get("sorted", True):
+                ranges.append((first_id, first_id + count, False))
+                continue
+            lo = segment.bisect(since, 0, count) if since is not None else 0
+            hi = segment.bisect(until, lo, count) if until is not None else count
+            if lo < hi:
+                ranges.append((first_id + lo, first_id + hi, True))
+        return ranges
+
+    def generation(self) -> Optional[str]:
+        return self.manifest().get("generation")
+
+    def stats(self) -> Dict[str, Any]:
+        """Record, segment and byte counts plus cumulative compaction stats."""
+        manifest = self.manifest()
+        return {
+            "records": self.next_id(),
+            "segments": len(manifest["segments"]),
+            "archived_segments": sum(1 for entry in manifest["segments"] if entry.get("archived")),
+            "bytes": sum(self._stored_size(entry) for entry in manifest["segments"]),
+            "compaction": manifest.get("compaction", {}),
+        }
+
+    def compact(self, cutoff: Optional[str] = None, max_per_category: Optional[int] = None,
+                max_bytes: Optional[int] = None) -> Dict[str, int]:
+        """Apply retention rules to sealed segments and merge small neighbours.
+
+        Records timestamped before ``cutoff`` are dropped, as are the oldest
+        records of any category holding more than ``max_per_category``
+        (records in the active segment count towards the quota but are never
+        dropped). Runs of adjacent sealed segments that fit in ``max_bytes``
+        after retention are rewritten as one segment; segments of different
+        months are never merged, so daily segments fold into at most one per
+        month.
+
+        Sealed segments are immutable, so the new segments are written without
+        holding the log lock; appends continue meanwhile and the manifest is
+        swapped under the lock at the end. Ids only move when records are
+        dropped, in which case the generation changes.
+        """
+        max_bytes = INSIGHT_SEGMENT_MAX_BYTES if max_bytes is None else max_bytes
+        stats = {"records_removed": 0, "segments_merged": 0, "bytes_reclaimed": 0}
+        with self._compaction_lock():
+            manifest = self.manifest()
+            sealed = manifest["segments"][:-1]
+            if not sealed:
+                return stats
+
+            excess: Dict[str, int] = {}
+            if max_per_category is not None:
+                totals: Dict[str, int] = {}
+                for entry in manifest["segments"]:
+                    for record in self.segment(entry["name"]).iter_from(0):
+                        category = record.get("category", "general")
+                        totals[category] = totals.get(category, 0) + 1
+                excess = {c: n - max_per_category for c, n in totals.items() if n > max_per_category}
+
+            def kept(entry: Dict[str, Any], quota: Dict[str, int]) -> Iterator[Tuple[bytes, Dict[str, Any]]]:
+                for line, record in self.segment(entry["name"]).iter_lines(0):
+                    if cutoff is not None and str(record.get("timestamp", "")) < cutoff:
+                        continue
+                    category = record.get("category", "general")
+                    if quota.get(category, 0) > 0:
+                        quota[category] -= 1
+                        continue
+                    yield line, record
+
+            def expired(entry: Dict[str, Any]) -> bool:
+                return cutoff is not None and entry["max_ts"] is not None and entry["max_ts"] < cutoff
+
+            sizes = [self._stored_size(entry) for entry in sealed]
+            kept_sizes, dropped = list(sizes), [0] * len(sealed)
+            if cutoff is not None or excess:
+                quota = dict(excess)
+                for i, entry in enumerate(sealed):
+                    if expired(entry):
+                        kept_sizes[i], dropped[i] = 0, entry["count"]
+                        continue
+                    kept_sizes[i] = count = 0
+                    for line, _ in kept(entry, quota):
+                        kept_sizes[i] += len(line) + 1
+                        count += 1
+                    dropped[i] = entry["count"] - count
+
+            runs: List[List[int]] = []
+            run_bytes = 0
+            for i in range(len(sealed)):
+                # Archived segments are only rewritten to apply retention
+                if (runs and run_bytes + kept_sizes[i] <= max_bytes
+                        and not sealed[i].get("archived") and not sealed[runs[-1][-1]].get("archived")
+                        and sealed[i]["period"][:7] == sealed[runs[-1][0]]["period"][:7]):
+                    runs[-1].append(i)
+                    run_bytes += kept_sizes[i]
+                else:
+                    runs.append([i])
+                    run_bytes = kept_sizes[i]
+            if all(len(run) == 1 and not dropped[run[0]] for run in runs):
+                return stats
+
+            # Write the replacement segments outside the log lock
+            quota = dict(excess)
+            replacements: Dict[int, List[Dict[str, Any]]] = {}
+            created: List[str] = []
+            try:
+                for run in runs:
+                    if len(run) == 1 and not dropped[run[0]]:
+                        continue
+                    name = f"{sealed[run[0]]['period']}.{os.urandom(3).hex()}"
+                    output = {"name": name, "period": sealed[run[0]]["period"], "first_id": 0,
+                              "count": 0, "min_ts": None, "max_ts": None, "sorted": True}
+                    with open(self.directory / f"{name}.jsonl", 'wb') as out:
+                        created.append(name)
+                        for i in run:
+                            if expired(sealed[i]):
+                                continue
+                            for line, record in kept(sealed[i], quota):
+                                out.write(line + b"\n")
+                                timestamp = str(record.get("timestamp", ""))
+                                if output["max_ts"] is not None and timestamp < output["max_ts"]:
+                                    output["sorted"] = False
+                                output["min_ts"] = min(output["min_ts"] or timestamp, timestamp)
+                                output["max_ts"] = max(output["max_ts"] or timestamp, timestamp)
+                                output["count"] += 1
+                    replacements[run[0]] = [output] if output["count"] else []
+                    for i in run[1:]:
+                        replacements[i] = []
+                    self.segment(name).sync()
+            except BaseException:
+                for name in created:
+                    self._remove_segment_files(name)
+                raise
+
+            with self.locked():
+                current = self.manifest()
+                if (current.get("generation") != manifest.get("generation")
+                        or [e["name"] for e in current["segments"][:len(sealed)]] != [e["name"] for e in sealed]):
+                    # Rewritten by someone else meanwhile; this pass is stale
+                    for name in created:
+                        self._remove_segment_files(name)
+                    return stats
+
+                segments: List[Dict[str, Any]] = []
+                for i, entry in enumerate(sealed):
+                    segments.extend(replacements.get(i, [entry]))
+                segments.extend(current["segments"][len(sealed):])
+                first_id = 0
+                for entry in segments:
+                    entry["first_id"] = first_id
+                    first_id += self._entry_count(entry)
+
+                stats["records_removed"] = sum(dropped)
+                stats["segments_merged"] = len(replacements)
+                stats["bytes_reclaimed"] = (sum(sizes[i] for i in replacements)
+                                            - sum(self._file_size(name) for name in created))
+                totals = current.get("compaction", {})
+                current["compaction"] = {
+                    "runs": totals.get("runs", 0) + 1,
+                    "last_run": datetime.utcnow().isoformat(),
+                    **{key: totals.get(key, 0) + value for key, value in stats.items()},
+                }
+                current["segments"] = segments
+                if stats["records_removed"]:
+                    current["generation"] = os.urandom(8).hex()
+                self._write_manifest(current)
+
+                # Remove replaced segments and anything left behind by an interrupted compaction
+                listed = {entry["name"] for entry in segments}
+                for path in self.directory.iterdir():
+                    if path.suffix in (".jsonl", ".offsets") and path.stem not in listed:
+                        self._remove_segment_files(path.stem)
+            return stats
+
+    def _remove_segment_files(self, name: str) -> None:
+        self._segments.pop(name, None)
+        for suffix in (".jsonl", ".offsets"):
+            (self.directory / f"{name}{suffix}").unlink(missing_ok=True)
+        if self.archive_dir is not None:
+            self._archive_path(name).unlink(missing_ok=True)
+
+    def archive(self, is_cold: Callable[[Path], bool]) -> Tuple[int, int, int]:
+        """Compress the sealed segments for which ``is_cold(path)`` holds into
+        ``archive_dir``. Returns the number archived and their bytes before
+        and after compression."""
+        archived, before, after = [], 0, 0
+        if self.archive_dir is None:
+            return 0, 0, 0
+        with self._compaction_lock():
+            for entry in self.manifest()["segments"][:-1]:
+                path = self.directory / f"{entry['name']}.jsonl"
+                if entry.get("archived") or not is_cold(path):
+                    continue
+                payload = lzma.compress(b"".join(
+                    line + b"\n" for line, _ in self.segment(entry["name"]).iter_lines(0)))
+                size = self._file_size(entry["name"])
+                if len(payload) >= size:
+                    continue  # too small to gain from compression; stays hot
+                _atomic_write_bytes(self._archive_path(entry["name"]), payload)
+                archived.append(entry["name"])
+                before += size
+                after += len(payload)
+            if not archived:
+                return 0, 0, 0
+            with self.locked():
+                # Compaction is excluded, so sealed segments cannot have changed
+                manifest = self.manifest()
+                for entry in manifest["segments"]:
+                    if entry["name"] in archived:
+                        entry["archived"] = True
+                self._write_manifest(manifest)
+                for name in archived:
+                    self._segments.pop(name, None)
+                    for suffix in (".jsonl", ".offsets"):
+                        (self.directory / f"{name}{suffix}").unlink(missing_ok=True)
+        return len(archived), before, after
+
+    @contextmanager
+    def _compaction_lock(self) -> Iterator[None]:
+        with self._compacting:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with open(self.directory / ".compact.lock", 'ab') as lock, _file_lock(lock):
+                yield
+
+    def files(self) -> List[Path]:
+        """Segment files in id order; archived segments give their compressed file."""
+        return [self._archive_path(entry["name"]) if entry.get("archived")
+                else self.directory / f"{entry['name']}.jsonl"
+                for entry in self.manifest()["segments"]]
+
+def _migrate_legacy_insights(learning_dir: Path, log: SegmentedInsightLog) -> None:
+    """Fold earlier insight formats into the segmented log.
+
+    Both the original ``session_insights.json`` document and the single
+    ``session_insights.jsonl`` log that replaced it are read, oldest first and
+    ahead of anything already in the segments; the log is rebuilt beside the
+    current one and swapped in, and the old files are kept with a ``.bak``
+    suffix.
+    """
+    legacy_files = [learning_dir / LEGACY_INSIGHTS_FILE, learning_dir / INSIGHTS_LOG_FILE]
+    if not any(path.exists() for path in legacy_files):
+        return
+
+    with log.locked():
+        legacy_files = [path for path in legacy_files if path.exists()]
+        if not legacy_files:
+            return  # another process got here first
+        records: List[Dict[str, Any]] = []
+        for path in legacy_files:
+            if path.suffix == ".json":
+                records.extend(_read_document(path).get("insights", []))
+            else:
+                records.extend(_LogSegment(path).iter_from(0))
+        records.extend(record for _, record in log.iter_entries())
+
+        staging = SegmentedInsightLog(log.directory.with_name(f".{log.directory.name}.{os.getpid()}.tmp"))
+        shutil.rmtree(staging.directory, ignore_errors=True)
+        try:
+            if records:
+                staging.append(records)
+            staging.directory.mkdir(parents=True, exist_ok=True)
+            for name in os.listdir(log.directory):
+                if name != ".lock":
+                    path = log.directory / name
+                    shutil.rmtree(path) if path.is_dir() else path.unlink()
+            for name in os.listdir(staging.directory):
+                if name != ".lock":
+                    os.replace(staging.directory / name, log.directory / name)
+        finally:
+            shutil.rmtree(staging.directory, ignore_errors=True)
+        log._segments.clear()
+
+        for path in legacy_files:
+            os.replace(path, path.with_name(path.name + ".bak"))
+        (learning_dir / INSIGHTS_OFFSETS_FILE).unlink(missing_ok=True)
+
+class MemoryBackend:
+    """Storage interface behind the module-level memory functions.
+
+    Active memory is exchanged as a whole document on load and as the set of
+    changed keys on save, so backends that store keys individually only write
+    what changed. ``active_signature()`` must be cheap: MemoryStore calls it on
+    every read to decide whether its cached copy is still current.
+    """
+
+    name = ""
+
+    def __init__(self, memory_dir: Path):
+        self.memory_dir = Path(memory_dir)
+
+    def active_signature(self) -> Any:
+        raise NotImplementedError
+
+    def load_active(self) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def save_active(self, memory: Dict[str, Any], changed_keys: Set[str],
+                    patches: Optional[Dict[str, Dict[str, Any]]] = None) -> None:
+        """Store ``changed_keys`` of ``memory``. ``patches`` maps keys that were
+        only patched since the last save to the merged-in changes, for
+        backends that can record a patch more cheaply than the whole value."""
+        raise NotImplementedError
+
+    def checkpoint_active(self) -> None:
+        """Fold any pending active memory journal into the stored document."""
+
+    def load_project(self, project_key: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def save_project(self, project_key: str, context: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def load_project_path(self, project_key: str, segments: List[Union[str, int]]) -> Any:
+        """The value at ``segments`` inside a project document; raises KeyError
+        if the project or the path does not exist."""
+        context = self.load_project(project_key)
+        if context is None:
+            raise KeyError(project_key)
+        return _walk_path(context, segments)
+
+    def list_projects(self) -> List[str]:
+        raise NotImplementedError
+
+    def append_insights(self, records: List[Dict[str, Any]]) -> None:
+        raise NotImplementedError
+
+    def iter_insights(self) -> Iterator[Dict[str, Any]]:
+        for _, record in self.iter_insight_entries():
+            yield record
+
+    def iter_insight_entries(self, start_id: int = 0) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """Yield ``(insight_id, record)`` pairs in id order, from ``start_id`` on.
+
+        Ids are dense, increasing integers assigned in append order; they stay
+        stable until the log is rewritten, which changes insight_log_token().
+        """
+        raise NotImplementedError
+
+    def get_insights(self, insight_ids: Iterable[int]) -> List[Optional[Dict[str, Any]]]:
+        """Fetch insights by id; unknown ids give None."""
+        raise NotImplementedError
+
+    def next_insight_id(self) -> int:
+        """The id the next appended insight will receive."""
+        raise NotImplementedError
+
+    def insight_log_token(self) -> Any:
+        """Identifies the current insight log; changes when the log is rewritten
+        rather than appended to, telling derived indexes to rebuild."""
+        raise NotImplementedError
+
+    def insight_id_ranges(self, since: Optional[str], until: Optional[str]) -> List[Tuple[int, int, bool]]:
+        """Id ranges ``(start, stop, exact)`` covering insights timestamped in
+        [since, until); either bound may be None. Ranges that are not exact
+        may also hold insights outside the bounds and must be filtered."""
+        return [(0, self.next_insight_id(), False)]
+
+    def compact_insights(self, cutoff: Optional[str] = None,
+                         max_per_category: Optional[int] = None) -> Dict[str, int]:
+        """Drop insights older than ``cutoff`` or beyond the newest
+        ``max_per_category`` of their category, and reclaim the space."""
+        raise NotImplementedError
+
+    def insight_stats(self) -> Dict[str, Any]:
+        return {"records": self.next_insight_id()}
+
+    def archive_cold(self, is_cold: Callable[[Path], bool]) -> Dict[str, int]:
+        """Move project documents and insights whose files satisfy ``is_cold``
+        into compressed archive storage, where reads still find them. Returns
+        counts of what moved and its bytes before and after compression.
+        Backends without per-document files keep everything in place."""
+        return {}
+
+    def close(self) -> None:
+        pass
+
+class JSONFileBackend(MemoryBackend):
+    """The original directory layout: one JSON file per document under MEMORY_DIR."""
+
+    name = "json"
+
+    def __init__(self, memory_dir: Path, active_file: Optional[Path] = None):
+        super().__init__(memory_dir)
+        self.active_file = Path(active_file) if active_file else self.memory_dir / "active_memory.json"
+        self.journal_file = self.active_file.with_name(self.active_file.stem + ".journal")
+        self._active_thread_lock = threading.RLock()
+        self._replayed: Optional[Dict[str, Any]] = None
+        self.project_dir = self.memory_dir / "project_memory"
+        self.learning_dir = self.memory_dir / "learning_memory"
+        self.archive_dir = self.memory_dir / ARCHIVE_DIR
+        self.access_log = _access_log(self.memory_dir)
+        self._log = SegmentedInsightLog(self.learning_dir / INSIGHTS_DIR,
+                                        self.archive_dir / "learning_memory" / INSIGHTS_DIR, self.access_log)
+        self._migrated = False
+
+    # Active memory is a snapshot (active_file) plus a journal of operations
+    # appended since it was written, one line per save:
+    # {"ops": [["set", key, value], ["del", key], ["patch", key, {...}]]}.
+    # Every operation is idempotent, so replaying the journal over a snapshot
+    # that already contains some of it gives the same document. Readers replay
+    # only the journal bytes they have not seen; once the journal passes
+    # ACTIVE_JOURNAL_MAX_BYTES it is folded into a new snapshot and removed,
+    # which bounds replay at startup. Saves and checkpoints take the lock file
+    # exclusively and loads take it shared, so a load never pairs an old
+    # snapshot with an emptied journal.
+
+    def active_signature(self) -> Any:
+        return (_file_signature(self.active_file), _file_signature(self.journal_file))
+
+    @contextmanager
+    def _active_lock(self, shared: bool = False) -> Iterator[None]:
+        with self._active_thread_lock:
+            self.active_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.active_file.with_name(f".{self.active_file.stem}.lock"), 'ab') as lock, \
+                    _file_lock(lock, shared):
+                yield
+
+    def _replay(self) -> Optional[Dict[str, Any]]:
+        """The active document: snapshot plus journal, replaying only new journal bytes."""
+        snapshot = _file_signature(self.active_file)
+        journal = _file_signature(self.journal_file)
+        state = self._replayed
+        if (state is None or state["snapshot"] != snapshot or journal is None
+                or state["journal"] != journal[2] or journal[1] < state["pos"]):
+            try:
+                memory, exists = dict(_read_document(self.active_file)), True
+            except FileNotFoundError:
+                memory, exists = {}, False
+            state = self._replayed = {"snapshot": snapshot, "journal": journal and journal[2], "pos": 0,
+                                      "memory": memory, "exists": exists}
+        if journal is not None and journal[1] > state["pos"]:
+            with open(self.journal_file, 'rb') as f:
+                f.seek(state["pos"])
+                data = f.read()
+            if _metrics is not None:
+                _metrics.add("bytes_read", len(data))
+            complete = data[:data.rfind(b"\n") + 1]
+            state["pos"] += len(complete)
+            memory = state["memory"]
+            for line in complete.splitlines():
+                try:
+                    ops = _json_loads(line)["ops"]
+                except (ValueError, KeyError, TypeError):
+                    continue  # a line cut short by a crashed writer
+                for op in ops:
+                    if op[0] == "set":
+                        memory[op[1]] = op[2]
+                    elif op[0] == "del":
+                        memory.pop(op[1], None)
+                    elif op[0] == "patch":
+                        base = memory.get(op[1])
+                        memory[op[1]] = dict(base if isinstance(base, dict) else {}, **op[2])
+                state["exists"] = True
+        return dict(state["memory"]) if state["exists"] else None
+
+    def load_active(self) -> Optional[Dict[str, Any]]:
+        with self._active_lock(shared=True):
+            return self._replay()
+
+    def save_active(self, memory: Dict[str, Any], changed_keys: Set[str],
+                    patches: Optional[Dict[str, Dict[str, Any]]] = None) -> None:
+        patches = patches or {}
+        with self._active_lock():
+            if not self.active_file.exists():
+                # Nothing to journal against yet: the first save is the snapshot
+                _atomic_write_document(self.active_file, memory)
+                self.journal_file.unlink(missing_ok=True)
+                return
+            ops: List[List[Any]] = []
+            for key in sorted(changed_keys):
+                if key in patches:
+                    ops.append(["patch", key, patches[key]])
+                elif key in memory:
+                    ops.append(["set", key, memory[key]])
+                else:
+                    ops.append(["del", key])
+            _append_lines(self.journal_file, [_encode_record({"ops": ops})])
+            if os.stat(self.journal_file).st_size > ACTIVE_JOURNAL_MAX_BYTES:
+                self._checkpoint()
+
+    def _checkpoint(self) -> None:
+        memory = self._replay()
+        if memory is not None:
+            _atomic_write_document(self.active_file, memory)
+        self.journal_file.unlink(missing_ok=True)
+
+    def checkpoint_active(self) -> None:
+        with self._active_lock():
+            if self.journal_file.exists():
+                self._checkpoint()
+
+    # Projects archived by tier_memory() live in archive/project_memory/ as
+    # <key>.json.xz and are read from there until the next save moves them back.
+
+    def _archived_project(self, project_key: str) -> Path:
+        return self.archive_dir / "project_memory" / f"{project_key}.json{ARCHIVE_SUFFIX}"
+
+    def load_project(self, project_key: str) -> Optional[Dict[str, Any]]:
+        path = self.project_dir / f"{project_key}.json"
+        try:
+            context = _read_document(path)
+        except FileNotFoundError:
+            try:
+                context = _read_archived_document(self._archived_project(project_key))
+            except FileNotFoundError:
+                return None
+        self.access_log.touch(path)
+        return context
+
+    def project_file(self, project_key: str) -> Path:
+        """Where a project is read from: its hot file, else its archived copy.
+        Counts as a read for tiering, like load_project()."""
+        path = self.project_dir / f"{project_key}.json"
+        self.access_log.touch(path)
+        if not path.exists() and self._archived_project(project_key).exists():
+            return self._archived_project(project_key)
+        return path
+
+    def save_project(self, project_key: str, context: Dict[str, Any]) -> None:
+        _atomic_write_document(self.project_dir / f"{project_key}.json", context)
+        self._archived_project(project_key).unlink(missing_ok=True)
+
+    # Path-addressed reads use a sidecar of byte spans for the members of the
+    # document's top PROJECT_PATH_INDEX_DEPTH levels of objects, built by one
+    # scan of the raw bytes and tied to the file's (mtime, size, inode). A read
+    # seeks to the deepest indexed ancestor, scans within its span for the
+    # rest of the path and decodes only the value found.
+
+    def load_project_path(self, project_key: str, segments: List[Union[str, int]]) -> Any:
+        path = self.project_dir / f"{project_key}.json"
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            return super().load_project_path(project_key, segments)  # archived, or missing
+        self.access_log.touch(path)
+        with f:
+            stat = os.fstat(f.fileno())
+            signature = [stat.st_mtime_ns, stat.st_size, stat.st_ino]
+            spans_file = self.memory_dir / PROJECT_PATHS_DIR / f"{project_key}.json"
+            try:
+                spans = _read_document(spans_file)
+            except (FileNotFoundError, ValueError):
+                spans = None
+            if spans is None or spans.get("signature") != signature:
+                data = f.read()
+                if data.startswith(MSGPACK_MAGIC):
+                    return _walk_path(_decode_document(data), segments)
+                try:
+                    start = _JSON_WS.match(data).end()
+                    tree = _json_span_tree(data, start, PROJECT_PATH_INDEX_DEPTH)
+                except (AttributeError, ValueError):  # not valid JSON: let the decoder report it
+                    return _walk_path(_json_loads(data), segments)
+                spans = {"signature": signature, "spans": tree}
+                _atomic_write_document(spans_file, spans)
+
+            start, end, node = 0, stat.st_size, spans["spans"]
+            remaining = list(segments)
+            while remaining and node is not None:
+                member = node.get(str(remaining[0]))
+                if member is None:
+                    raise KeyError(remaining[0])
+                start, end, node = member
+                remaining.pop(0)
+            f.seek(start)
+            data = f.read(end - start)
+        if _metrics is not None:
+            _metrics.add("bytes_read", len(data))
+        if remaining:
+            start, end = _json_path_span(data, remaining)
+            data = data[start:end]
+        return _json_loads(data)
+
+    def list_projects(self) -> List[str]:
+        keys = {p.stem for p in self.project_dir.glob("*.json")} if self.project_dir.exists() else set()
+        suffix = f".json{ARCHIVE_SUFFIX}"
+        archived = self.archive_dir / "project_memory"
+        if archived.exists():
+            keys.update(p.name[:-len(suffix)] for p in archived.glob(f"*{suffix}"))
+        return sorted(keys)
+
+    def archive_cold(self, is_cold: Callable[[Path], bool]) -> Dict[str, int]:
+        stats = {"projects": 0, "insight_segments": 0, "bytes_before": 0, "bytes_after": 0}
+        if self.project_dir.exists():
+            for path in sorted(self.project_dir.glob("*.json")):
+                if not is_cold(path):
+                    continue
+                before, after = _archive_file(path, self._archived_project(path.stem))
+                if before:
+                    (self.memory_dir / PROJECT_PATHS_DIR / path.name).unlink(missing_ok=True)
+                    stats["projects"] += 1
+                    stats["bytes_before"] += before
+                    stats["bytes_after"] += after
+        if self.insights_dir.exists():
+            segments, before, after = self._insight_log().archive(is_cold)
+            stats["insight_segments"] = segments
+            stats["bytes_before"] += before
+            stats["bytes_after"] += after
+        return stats
+
+    # Insights live in a SegmentedInsightLog under learning_memory/insights/.
+
+    @property
+    def insights_dir(self) -> Path:
+        return self.learning_dir / INSIGHTS_DIR
+
+    def _insight_log(self) -> SegmentedInsightLog:
+        # Legacy files are only written by older versions, so one check per
+        # backend is enough once the directory exists
+        if not self._migrated and self.learning_dir.exists():
+            _migrate_legacy_insights(self.learning_dir, self._log)
+            self._migrated = True
+        return self._log
+
+    def append_insights(self, records: List[Dict[str, Any]]) -> None:
+        self.learning_dir.mkdir(parents=True, exist_ok=True)
+        if self._insight_log().append(records):
+            _compact_in_background(self)
+
+    def iter_insight_entries(self, start_id: int = 0) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        return self._insight_log().iter_entries(start_id)
+
+    def get_insights(self, insight_ids: Iterable[int]) -> List[Optional[Dict[str, Any]]]:
+        return self._insight_log().get(insight_ids)
+
+    def next_insight_id(self) -> int:
+        return self._insight_log().next_id()
+
+    def insight_log_token(self) -> Any:
+        return self._insight_log().generation()
+
+    def insight_id_ranges(self, since: Optional[str], until: Optional[str]) -> List[Tuple[int, int, bool]]:
+        return self._insight_log().id_ranges(since, until)
+
+    def compact_insights(self, cutoff: Optional[str] = None,
+                         max_per_category: Optional[int] = None) -> Dict[str, int]:
+        return self._insight_log().compact(cutoff, max_per_category)
+
+    def insight_stats(self) -> Dict[str, Any]:
+        return self._insight_log().stats()
+
+class SQLiteBackend(MemoryBackend):
+    """All memory in a single ``memory.db`` SQLite database in WAL mode.
+
+    Insights are indexed by category and timestamp, project documents are keyed
+    by their normalised name, and active memory is stored one row per key so a
+    flush only writes the keys that changed. Each thread gets its own
+    connection; statements use fixed SQL text with bound parameters so the
+    sqlite3 statement cache reuses the prepared statements.
+    """
+
+    name = "sqlite"
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+        CREATE TABLE IF NOT EXISTS active_memory (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS projects (
+            name TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS insights (
+            id INTEGER PRIMARY KEY,
+            timestamp TEXT NOT NULL,
+            category TEXT NOT NULL,
+            record TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_insights_category ON insights (category, timestamp);
+        CREATE INDEX IF NOT EXISTS idx_insights_timestamp ON insights (timestamp);
+        INSERT OR IGNORE INTO meta (key, value) VALUES ('active_version', 0);
+        INSERT OR IGNORE INTO meta (key, value) VALUES ('insights_generation', 0);
+    """
+
+    def __init__(self, memory_dir: Path, db_file: Optional[Path] = None):
+        super().__init__(memory_dir)
+        self.db_file = Path(db_file) if db_file else self.memory_dir / SQLITE_DB_FILE
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.db_file.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.db_file), timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(self._SCHEMA)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def active_signature(self) -> Any:
+        row = self._conn().execute("SELECT value FROM meta WHERE key = 'active_version'").fetchone()
+        return row[0] if row else 0
+
+    def load_active(self) -> Optional[Dict[str, Any]]:
+        rows = self._conn().execute("SELECT key, value FROM active_memory").fetchall()
+        if not rows:
+            return None
+        return {key: _json_loads(value) for key, value in rows}
+
+    def save_active(self, memory: Dict[str, Any], changed_keys: Set[str],
+                    patches: Optional[Dict[str, Dict[str, Any]]] = None) -> None:
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO active_memory (key, value) VALUES (?, ?)",
+                [(key, _encode_record(memory[key])) for key in changed_keys if key in memory],
+            )
+            conn.executemany(
+                "DELETE FROM active_memory WHERE key = ?",
+                [(key,) for key in changed_keys if key not in memory],
+            )
+            conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'active_version'")
+
+    def load_project(self, project_key: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute("SELECT data FROM projects WHERE name = ?", (project_key,)).fetchone()
+        return _json_loads(row[0]) if row else None
+
+    def save_project(self, project_key: str, context: Dict[str, Any]) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO projects (name, data, updated_at) VALUES (?, ?, ?)",
+                (project_key, _encode_record(context), datetime.utcnow().isoformat()),
+            )
+
+    def load_project_path(self, project_key: str, segments: List[Union[str, int]]) -> Any:
+        # json_extract() pulls the subtree out inside SQLite
+        conn = self._conn()
+        json_path = "$"
+        for segment in segments:
+            if str(segment).isdigit():
+                parent_type = conn.execute(
+                    "SELECT json_type(data, ?) FROM projects WHERE name = ?", (json_path, project_key)
+                ).fetchone()
+                if parent_type and parent_type[0] == "array":
+                    json_path += f"[{int(segment)}]"
+                    continue
+            json_path += '."' + str(segment).replace("\\", "\\\\").replace('"', '\\"') + '"'
+        row = conn.execute(
+            "SELECT json_type(data, ?), json_extract(data, ?) FROM projects WHERE name = ?",
+            (json_path, json_path, project_key),
+        ).fetchone()
+        if row is None or row[0] is None:
+            raise KeyError(project_key if row is None else segments[-1])
+        value_type, value = row
+        if value_type in ("object", "array"):
+            return _json_loads(value)
+        return {"true": True, "false": False, "null": None}.get(value_type, value)
+
+    def list_projects(self) -> List[str]:
+        return [row[0] for row in self._conn().execute("SELECT name FROM projects ORDER BY name")]
+
+    def append_insights(self, records: List[Dict[str, Any]]) -> None:
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT INTO insights (timestamp, category, record) VALUES (?, ?, ?)",
+                [(r.get("timestamp", ""), r.get("category", "general"), _encode_record(r)) for r in records],
+            )
+
+    # Insight ids are rowid - 1, so they start at 0 like the JSON log's.
+
+    def iter_insight_entries(self, start_id: int = 0) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        cursor = self._conn().execute(
+            "SELECT id - 1, record FROM insights WHERE id > ? ORDER BY id", (start_id,)
+        )
+        for insight_id, record in cursor:
+            yield insight_id, _json_loads(record)
+
+    def get_insights(self, insight_ids: Iterable[int]) -> List[Optional[Dict[str, Any]]]:
+        insight_ids = list(insight_ids)
+        found: Dict[int, Dict[str, Any]] = {}
+        conn = self._conn()
+        for start in range(0, len(insight_ids), 500):
+            chunk = [i + 1 for i in insight_ids[start:start + 500]]
+            placeholders = ",".join("?" * len(chunk))
+            for row_id, record in conn.execute(
+                f"SELECT id, record FROM insights WHERE id IN ({placeholders})", chunk
+            ):
+                found[row_id - 1] = _json_loads(record)
+        return [found.get(i) for i in insight_ids]
+
+    def next_insight_id(self) -> int:
+        return self._conn().execute("SELECT COALESCE(MAX(id), 0) FROM insights").fetchone()[0]
+
+    def insight_id_ranges(self, since: Optional[str], until: Optional[str]) -> List[Tuple[int, int, bool]]:
+        row = self._conn().execute(
+            "SELECT MIN(id) - 1, MAX(id) FROM insights WHERE timestamp >= ? AND timestamp < ?",
+            (since if since is not None else "", until if until is not None else "\uffff"),
+        ).fetchone()
+        return [] if row[0] is None else [(row[0], row[1], False)]
+
+    # Rows left after a deletion are renumbered so ids stay dense positions, as
+    # after a rewrite of the JSON log, and the generation changes so derived
+    # indexes are rebuilt. Freed pages are reused by later inserts.
+
+    def compact_insights(self, cutoff: Optional[str] = None,
+                         max_per_category: Optional[int] = None) -> Dict[str, int]:
+        conn = self._conn()
+        removed = 0
+        with conn:
+            if cutoff is not None:
+                removed += conn.execute("DELETE FROM insights WHERE timestamp < ?", (cutoff,)).rowcount
+            if max_per_category is not None:
+                removed += conn.execute(
+                    """DELETE FROM insights WHERE id IN (
+                        SELECT id FROM (
+                            SELECT id, ROW_NUMBER() OVER (PARTITION BY category ORDER BY id DESC) AS newer
+                            FROM insights
+                        ) WHERE newer > ?
+                    )""",
+                    (max_per_category,),
+                ).rowcount
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+            stats = {
+                "records_removed": removed,
+                "segments_merged": 0,
+                "bytes_reclaimed": conn.execute("PRAGMA freelist_count").fetchone()[0] * page_size if removed else 0,
+            }
+            if removed:
+                self._renumber_insights(conn)
+                conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'insights_generation'")
+            totals = self._compaction_totals(conn)
+            rows = [(f"compaction_{key}", totals.get(key, 0) + value) for key, value in stats.items()]
+            rows += [("compaction_runs", totals.get("runs", 0) + 1),
+                     ("compaction_last_run", datetime.utcnow().isoformat())]
+            conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", rows)
+        return stats
+
+    @staticmethod
+    def _renumber_insights(conn: sqlite3.Connection) -> None:
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS insight_ids (old INTEGER PRIMARY KEY, new INTEGER NOT NULL)")
+        conn.execute("DELETE FROM temp.insight_ids")
+        conn.execute("INSERT INTO temp.insight_ids SELECT id, ROW_NUMBER() OVER (ORDER BY id) FROM insights")
+        # Through negative ids, so no intermediate id collides with a row not yet moved
+        conn.execute("""UPDATE insights SET id = -(SELECT new FROM temp.insight_ids WHERE old = insights.id)
+                        WHERE id IN (SELECT old FROM temp.insight_ids WHERE old <> new)""")
+        conn.execute("UPDATE insights SET id = -id WHERE id < 0")
+        conn.execute("DELETE FROM temp.insight_ids")
+
+    def _compaction_totals(self, conn: sqlite3.Connection) -> Dict[str, Any]:
+        rows = conn.execute("SELECT key, value FROM meta WHERE key LIKE 'compaction_%'")
+        return {key[len("compaction_"):]: value for key, value in rows}
+
+    def insight_stats(self) -> Dict[str, Any]:
+        conn = self._conn()
+        return {
+            "records": conn.execute("SELECT COUNT(*) FROM insights").fetchone()[0],
+            "compaction": self._compaction_totals(conn),
+        }
+
+    def insight_log_token(self) -> Any:
+        row = self._conn().execute("SELECT value FROM meta WHERE key = 'insights_generation'").fetchone()
+        return row[0] if row else 0
+
+    def close(self) -> None:
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+_BACKENDS: Dict[str, Callable[[Path], MemoryBackend]] = {
+    "json": JSONFileBackend,
+    "sqlite": SQLiteBackend,
+}
+_backends: Dict[Tuple[str, Path], MemoryBackend] = {}
+_backends_lock = threading.Lock()
+
+def register_backend(name: str, factory: Callable[[Path], MemoryBackend]) -> None:
+    """Make a custom backend selectable by name; ``factory`` receives MEMORY_DIR."""
+    _BACKENDS[name] = factory
+
+_config_cache: Dict[Path, Tuple[Any, str]] = {}
+
+def _configured_backend_name(memory_dir: Path) -> str:
+    """Backend chosen by MEMORY_BACKEND, else memory_config.json, else "json"."""
+    if MEMORY_BACKEND:
+        return MEMORY_BACKEND
+    config_file = memory_dir / MEMORY_CONFIG_FILE
+    signature = _file_signature(config_file)
+    cached = _config_cache.get(config_file)
+    if cached and cached[0] == signature:
+        return cached[1]
+    name = "json"
+    if signature is not None:
+        name = _read_document(config_file).get("backend", "json")
+    _config_cache[config_file] = (signature, name)
+    return name
+
+def get_backend() -> MemoryBackend:
+    """Return the configured storage backend for the current MEMORY_DIR."""
+    memory_dir = Path(MEMORY_DIR)
+    name = _configured_backend_name(memory_dir)
+    if name not in _BACKENDS:
+        raise ValueError(f"Unknown memory backend {name!r}; choose from {sorted(_BACKENDS)}")
+    with _backends_lock:
+        backend = _backends.get((name, memory_dir))
+        if backend is None:
+            backend = _backends[(name, memory_dir)] = _BACKENDS[name](memory_dir)
+        return backend
+
+@_instrument
+def migrate_to_sqlite(memory_dir: Optional[Path] = None, switch_backend: bool = True) -> Dict[str, int]:
+    """Import an existing JSON memory tree into the SQLite backend.
+
+    Active memory keys and project documents are upserted; the insight table is
+    replaced by the contents of the insight log so the command can be re-run.
+    With ``switch_backend`` the directory's memory_config.json is updated to
+    select SQLite. Returns the number of items imported per kind.
+    """
+    memory_dir = Path(memory_dir) if memory_dir else Path(MEMORY_DIR)
+    source = JSONFileBackend(memory_dir)
+    target = SQLiteBackend(memory_dir)
+    conn = target._conn()
+
+    active = source.load_active() or {}
+    projects = {key: source.load_project(key) for key in source.list_projects()}
+    insights = list(source.iter_insights())
+
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO active_memory (key, value) VALUES (?, ?)",
+            [(key, _encode_record(value)) for key, value in active.items()],
+        )
+        conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'active_version'")
+        conn.executemany(
+            "INSERT OR REPLACE INTO projects (name, data, updated_at) VALUES (?, ?, ?)",
+            [(key, _encode_record(data), datetime.utcnow().isoformat()) for key, data in projects.items()],
+        )
+        conn.execute("DELETE FROM insights")
+        conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'insights_generation'")
+        conn.executemany(
+            "INSERT INTO insights (timestamp, category, record) VALUES (?, ?, ?)",
+            [(r.get("timestamp", ""), r.get("category", "general"), _encode_record(r)) for r in insights],
+        )
+    target.close()
+
+    if switch_backend:
+        config_file = memory_dir / MEMORY_CONFIG_FILE
+        # A new dict: the document from _read_document() is shared by the read cache
+        config = dict(_read_document(config_file) if config_file.exists() else {}, backend=SQLiteBackend.name)
+        _atomic_write_document(config_file, config, _SERIALIZERS["pretty"])
+
+    return {"active_keys": len(active), "projects": len(projects), "insights": len(insights)}
+
+class MemoryStore:
+    """In-process, write-back cache of active memory.
+
+    Reads are served from RAM after a cheap check (a ``stat`` for JSON files)
+    confirms the backend has not been changed by another writer. Writes mark
+    keys dirty and are flushed according to the policy:
+
+    - ``flush_every``: flush after this many writes (``None`` disables it)
+    - ``flush_interval_ms``: flush this long after the first unflushed write
+    - leaving a ``with MemoryStore(...)`` block, or calling ``flush()``
+
+    If the stored document changed while keys were dirty, the flush reloads it
+    and applies only the dirty keys on top, so concurrent writers of other keys
+    are not overwritten.
+    """
+
+    def __init__(self, memory_file: Optional[Path] = None, flush_every: Optional[int] = 1,
+                 flush_interval_ms: Optional[float] = None, backend: Optional[MemoryBackend] = None):
+        if backend is None:
+            memory_file = Path(memory_file) if memory_file else Path(MEMORY_DIR) / "active_memory.json"
+            backend = JSONFileBackend(memory_file.parent, active_file=memory_file)
+        self.backend = backend
+        self.flush_every = flush_every
+        self.flush_interval_ms = flush_interval_ms
+        self._lock = threading.RLock()
+        self._memory: Dict[str, Any] = {}
+        self._exists = False
+        self._signature: Any = None
+        self._loaded = False
+        self._dirty: Set[str] = set()
+        self._patches: Dict[str, Dict[str, Any]] = {}
+        self._pending_ops = 0
+        self._timer: Optional[threading.Timer] = None
+
+    def __enter__(self) -> "MemoryStore":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    @property
+    def dirty_keys(self) -> Set[str]:
+        """Keys changed in RAM but not yet written to the backend."""
+        with self._lock:
+            return set(self._dirty)
+
+    def _read_backend(self) -> None:
+        self._signature = self.backend.active_signature()
+        memory = self.backend.load_active()
+        # Copy so staged writes never leak into documents shared by the read cache
+        self._memory, self._exists = (dict(memory), True) if memory is not None else ({}, False)
+        self._loaded = True
+
+    def _refresh(self) -> None:
+        # Unflushed writes make RAM authoritative until the next flush
+        if self._dirty:
+            return
+        if not self._loaded or self.backend.active_signature() != self._signature:
+            self._read_backend()
+
+    def get(self, key: str = None) -> Any:
+        """Return a deep copy of one key or of the whole document (None if absent)."""
+        with self._lock:
+            self._refresh()
+            if not self._exists:
+                return None
+            return copy.deepcopy(self._memory.get(key) if key else self._memory)
+
+    def set(self, key: str, value: Any) -> None:
+        """Set a key and stamp ``last_updated``."""
+        self.update({key: value})
+
+    def update(self, changes: Dict[str, Any]) -> None:
+        """Set several keys as a single write.
+
+        If the write triggered by the flush policy fails, the keys are restored
+        to their previous values so none of the batch is applied.
+        """
+        if not changes:
+            return
+        with self._lock:
+            self._refresh()
+            self._apply({key: (value, None) for key, value in changes.items()})
+
+    def patch(self, key: str, changes: Dict[str, Any]) -> None:
+        """Merge ``changes`` into the dict stored under ``key`` (created if absent).
+
+        The JSON backend journals just the merged-in fields rather than the
+        whole value.
+        """
+        with self._lock:
+            self._refresh()
+            current = self._memory.get(key)
+            merged = dict(current if isinstance(current, dict) else {}, **changes)
+            self._apply({key: (merged, changes)})
+
+    def _apply(self, changes: Dict[str, Tuple[Any, Optional[Dict[str, Any]]]]) -> None:
+        """Stage ``key: (value, patch)`` changes plus ``last_updated`` as one write."""
+        keys = list(changes) + ["last_updated"]
+        previous = {key: self._memory.get(key, _DELETED) for key in keys}
+        dirty_before, exists_before = set(self._dirty), self._exists
+        patches_before = dict(self._patches)
+        for key, (value, patch) in changes.items():
+            if patch is None or (key in self._dirty and key not in self._patches):
+                self._patches.pop(key, None)  # a full value is pending anyway
+            else:
+                self._patches[key] = dict(self._patches.get(key, {}), **patch)
+            self._stage(key, value)
+        self._stage("last_updated", datetime.utcnow().isoformat())
+        try:
+            self._after_write()
+        except BaseException:
+            for key, value in previous.items():
+                if value is _DELETED:
+                    self._memory.pop(key, None)
+                else:
+                    self._memory[key] = value
+            self._dirty, self._exists, self._patches = dirty_before, exists_before, patches_before
+            raise
+
+    def delete(self, key: str) -> None:
+        """Remove a key if present."""
+        with self._lock:
+            self._refresh()
+            if key not in self._memory:
+                return
+            self._patches.pop(key, None)
+            self._stage(key, _DELETED)
+            self._stage("last_updated", datetime.utcnow().isoformat())
+            self._after_write()
+
+    def _stage(self, key: str, value: Any) -> None:
+        if value is _DELETED:
+            self._memory.pop(key, None)
+        else:
+            self._memory[key] = value
+        self._dirty.add(key)
+        self._exists = True
+
+    def _after_write(self) -> None:
+        self._pending_ops += 1
+        if self.flush_every and self._pending_ops >= self.flush_every:
+            self.flush()
+        elif self.flush_interval_ms is not None and self._timer is None:
+            self._timer = threading.Timer(self.flush_interval_ms / 1000.0, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self) -> None:
+        """Write dirty keys to the backend."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._pending_ops = 0
+            if not self._dirty:
+                return
+            if self.backend.active_signature() != self._signature:
+                # Someone else changed the document: merge our keys into their version
+                ours = {key: self._memory.get(key, _DELETED) for key in self._dirty}
+                self._read_backend()
+                for key, value in ours.items():
+                    if key in self._patches:
+                        theirs = self._memory.get(key)
+                        value = dict(theirs if isinstance(theirs, dict) else {}, **self._patches[key])
+                    self._stage(key, value)
+            self.backend.save_active(self._memory, self._dirty, self._patches)
+            self._signature = self.backend.active_signature()
+            self._dirty = set()
+            self._patches = {}
+
+    def close(self) -> None:
+        """Flush pending writes and cancel any scheduled flush."""
+        self.flush()
+
+_stores: Dict[Tuple[str, Path], MemoryStore] = {}
+_stores_lock = threading.Lock()
+_store_policy: Dict[str, Any] = {"flush_every": 1, "flush_interval_ms": None}
+
+def get_memory_store() -> MemoryStore:
+    """Return the shared MemoryStore for the current MEMORY_DIR and backend."""
+    backend = get_backend()
+    store_key = (backend.name, backend.memory_dir)
+    with _stores_lock:
+        store = _stores.get(store_key)
+        if store is None:
+            store = _stores[store_key] = MemoryStore(backend=backend, **_store_policy)
+        return store
+
+def configure_memory_store(flush_every: Optional[int] = 1, flush_interval_ms: Optional[float] = None) -> None:
+    """Set the flush policy used by update_active_memory and friends.
+
+    The default (``flush_every=1``) writes through on every update. Larger
+    values or ``None`` trade durability for fewer writes; pending changes are
+    always flushed at interpreter exit or by ``flush_memory()``.
+    """
+    with _stores_lock:
+        _store_policy.update(flush_every=flush_every, flush_interval_ms=flush_interval_ms)
+        stores = list(_stores.values())
+    for store in stores:
+        with store._lock:
+            store.flush_every = flush_every
+            store.flush_interval_ms = flush_interval_ms
+
+@_instrument
+def flush_memory() -> None:
+    """Flush every shared MemoryStore."""
+    with _stores_lock:
+        stores = list(_stores.values())
+    for store in stores:
+        store.flush()
+
+@_instrument
+def checkpoint_active_memory() -> None:
+    """Flush pending writes and fold the active memory journal into
+    ``active_memory.json``, leaving one up-to-date JSON file to read or edit."""
+    get_memory_store().flush()
+    get_backend().checkpoint_active()
+
+def _checkpoint_at_exit() -> None:
+    with _stores_lock:
+        stores = list(_stores.values())
+    for store in stores:
+        try:
+            store.backend.checkpoint_active()
+        except OSError:
+            pass  # the memory directory may be gone; the journal is replayed next time
+
+atexit.register(_checkpoint_at_exit)
+atexit.register(flush_memory)
+
+@_instrument
 def update_active_memory(key: str, value: Any) -> None:
     """Update a key in active memory."""
-    memory_file = MEMORY_DIR / "active_memory.json"
-    
-    # Ensure directory exists
-    memory_file.parent.mkdir(parents=True, exist_ok=True)
-    
-    if memory_file.exists():
-        with open(memory_file, 'r') as f:
-            memory = json.load(f)
-    else:
-        memory = {}
-    
-    memory[key] = value
-    memory["last_updated"] = datetime.utcnow().isoformat()
-    
-    with open(memory_file, 'w') as f:
-        json.dump(memory, f, indent=2)
+    get_memory_store().set(key, value)
+
+@_instrument
+def update_active_memory_many(updates: Dict[str, Any]) -> None:
+    """Update several active memory keys with one write; all land or none do."""
+    get_memory_store().update(updates)
+
+@_instrument
+def patch_active_memory(key: str, changes: Dict[str, Any]) -> None:
+    """Merge ``changes`` into a dict in active memory, e.g. one field of
+    ``current_session``, without rewriting the rest of it."""
+    get_memory_store().patch(key, changes)
+
+@_instrument
+def get_active_memory(key: str = None) -> Any:
+    """Get active memory data."""
+    return get_memory_store().get(key)
+
+class DerivedInsightIndex:
+    """Base class for indexes derived from the insight log by tailing it.
+
+    Each index keeps an append-only ``entries.jsonl`` of per-insight entries
+    (every entry carries the insight ``id``) and a ``meta.json`` recording the
+    log token it was built from, in ``learning_memory/<name>/``. ``catch_up()``
+    indexes only the insights the entries file does not cover yet, so a save
+    costs the same however large the history is; if the log was rewritten the
+    index is dropped and rebuilt. Entries are loaded into memory the first time
+    a process queries the index and are then followed incrementally.
+
+    Subclasses implement ``make_entry()``, ``apply()`` and ``reset()``; an
+    index with its own on-disk layout overrides ``write_entries()`` and
+    ``_persisted_next_id()`` instead.
+    """
+
+    name = ""
+
+    def __init__(self, backend: MemoryBackend):
+        self.backend = backend
+        self.index_dir = backend.memory_dir / "learning_memory" / self.name
+        self.entries_file = self.index_dir / "entries.jsonl"
+        self.meta_file = self.index_dir / "meta.json"
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._read_pos = 0
+        self._next_id = 0
+
+    def make_entry(self, insight_id: int, record: Dict[str, Any]) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def apply(self, entry: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def reset(self) -> None:
+        raise NotImplementedError
+
+    def write_entries(self, entries: List[Dict[str, Any]]) -> None:
+        """Persist new entries; called with the index's file lock held."""
+        with open(self.entries_file, 'ab') as f:
+            f.write("".join(_encode_record(entry) + "\n" for entry in entries).encode("utf-8"))
+
+    def _persisted_next_id(self) -> int:
+        """One past the id of the last complete entry on disk."""
+        try:
+            with open(self.entries_file, 'rb') as f:
+                size = f.seek(0, os.SEEK_END)
+                chunk = 4096
+                while True:
+                    f.seek(max(0, size - chunk))
+                    lines = f.read(min(size, chunk)).split(b"\n")
+                    complete = [line for line in lines[:-1] if line.strip()]
+                    if complete:
+                        return _json_loads(complete[-1])["id"] + 1
+                    if chunk >= size:
+                        return 0
+                    chunk *= 4
+        except FileNotFoundError:
+            return 0
+
+    def _check_token(self) -> None:
+        token = self.backend.insight_log_token()
+        try:
+            meta = _read_document(self.meta_file)
+        except FileNotFoundError:
+            meta = None
+        if meta is None or meta.get("log_token") != token:
+            for path in self.index_dir.iterdir():
+                if path.name not in ("meta.json", ".lock"):
+                    path.unlink()
+            _atomic_write_document(self.meta_file, {"log_token": token})
+            self.reset()
+            self._read_pos, self._next_id = 0, 0
+
+    def catch_up(self) -> None:
+        """Index insights appended since the last call, in this or any process."""
+        with self._lock:
+            self.index_dir.mkdir(parents=True, exist_ok=True)
+            self._check_token()
+            if self._persisted_next_id() < self.backend.next_insight_id():
+                with open(self.index_dir / ".lock", 'ab') as lock, _file_lock(lock):
+                    start = self._persisted_next_id()
+                    entries = [
+                        self.make_entry(insight_id, record)
+                        for insight_id, record in self.backend.iter_insight_entries(start)
+                    ]
+                    if entries:
+                        self.write_entries(entries)
+            if self._loaded:
+                self._follow()
+
+    def _follow(self) -> None:
+        """Apply entries written since this process last read the file."""
+        try:
+            f = open(self.entries_file, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            f.seek(self._read_pos)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                self._read_pos += len(line)
+                entry = _json_loads(line)
+                if entry["id"] >= self._next_id:
+                    self.apply(entry)
+                    self._next_id = entry["id"] + 1
+
+    def ensure_loaded(self) -> None:
+        """Load the index into memory if needed and bring it up to date."""
+        with self._lock:
+            if not self._loaded:
+                self.reset()
+                self._read_pos, self._next_id, self._loaded = 0, 0, True
+            self.catch_up()
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have in is it its of on or that the "
+    "this to was were will with".split()
+)
+
+def _tokenize(text: str) -> List[str]:
+    """Lower-cased alphanumeric terms without common English stopwords."""
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+class InsightSearchIndex(DerivedInsightIndex):
+    """BM25 inverted index over insight text, kept in ``learning_memory/search_index/``.
+
+    Each entry stores one insight's term frequencies and category. In memory,
+    postings are parallel ``array('I')`` columns of insight ids and term
+    frequencies, so a query only touches the postings of its own terms.
+    """
+
+    name = "search_index"
+    k1 = 1.2
+    b = 0.75
+
+    def reset(self) -> None:
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        self._doc_len = array('I')
+        self._doc_category = array('I')
+        self._categories: Dict[str, int] = {}
+        self._doc_count = 0
+        self._total_len = 0
+
+    def make_entry(self, insight_id: int, record: Dict[str, Any]) -> Dict[str, Any]:
+        tf: Dict[str, int] = {}
+        for term in _tokenize(str(record.get("insight", ""))):
+            tf[term] = tf.get(term, 0) + 1
+        return {"id": insight_id, "c": record.get("category", "general"), "tf": tf}
+
+    def apply(self, entry: Dict[str, Any]) -> None:
+        insight_id = entry["id"]
+        if len(self._doc_len) <= insight_id:
+            padding = insight_id + 1 - len(self._doc_len)
+            self._doc_len.extend([0] * padding)
+            self._doc_category.extend([0] * padding)
+        length = sum(entry["tf"].values())
+        self._doc_len[insight_id] = length
+        self._doc_category[insight_id] = self._categories.setdefault(entry["c"], len(self._categories) + 1)
+        self._doc_count += 1
+        self._total_len += length
+        for term, tf in entry["tf"].items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = (array('I'), array('I'))
+            postings[0].append(insight_id)
+            postings[1].append(tf)
+
+    def search(self, query: str, k: int = 10, category: Optional[str] = None) -> List[Tuple[int, float]]:
+        """Return up to ``k`` ``(insight_id, score)`` pairs, best first."""
+        self.ensure_loaded()
+        with self._lock:
+            if not self._doc_count:
+                return []
+            category_code = None
+            if category is not None:
+                category_code = self._categories.get(category)
+                if category_code is None:
+                    return []
+            n = self._doc_count
+            avg_len = (self._total_len / n) or 1.0
+            k1, b = self.k1, self.b
+            doc_len, doc_category = self._doc_len, self._doc_category
+            scores: Dict[int, float] = {}
+            for term in set(_tokenize(query)):
+                postings = self._postings.get(term)
+                if postings is None:
+                    continue
+                ids, tfs = postings
+                idf = math.log(1 + (n - len(ids) + 0.5) / (len(ids) + 0.5))
+                for insight_id, tf in zip(ids, tfs):
+                    if category_code is not None and doc_category[insight_id] != category_code:
+                        continue
+                    norm = k1 * (1 - b + b * doc_len[insight_id] / avg_len)
+                    scores[insight_id] = scores.get(insight_id, 0.0) + idf * tf * (k1 + 1) / (tf + norm)
+            return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+class InsightCategoryIndex(DerivedInsightIndex):
+    """Per-category lists of insight ids, kept in ``learning_memory/category_index/``.
+
+    Each category has a file of little-endian uint64 ids in ascending order,
+    named in ``categories.json``; ``next_id`` records how far the log has been
+    indexed. A page of a category is one seek and one read of ``8 * limit``
+    bytes, after which only the matching records are fetched from the log.
+    """
+
+    name = "category_index"
+
+    def reset(self) -> None:
+        pass
+
+    def make_entry(self, insight_id: int, record: Dict[str, Any]) -> Dict[str, Any]:
+        return {"id": insight_id, "c": record.get("category", "general")}
 
-def get_active_memory(key: str = None) -> Any:
-    """Get active memory data."""
-    memory_file = MEMORY_DIR / "active_memory.json"
-    
-    if not memory_file.exists():
-        return None
-    
-    with open(memory_file, 'r') as f:
-        memory = json.load(f)
-    
-    return memory.get(key) if key else memory
+    def _category_files(self) -> Dict[str, str]:
+        try:
+            return _read_document(self.index_dir / "categories.json")
+        except FileNotFoundError:
+            return {}
+
+    def _persisted_next_id(self) -> int:
+        try:
+            with open(self.index_dir / "next_id", 'rb') as f:
+                data = f.read(8)
+        except FileNotFoundError:
+            return 0
+        return _OFFSET.unpack(data)[0] if len(data) == 8 else 0
+
+    def write_entries(self, entries: List[Dict[str, Any]]) -> None:
+        grouped: Dict[str, List[int]] = {}
+        for entry in entries:
+            grouped.setdefault(entry["c"], []).append(entry["id"])
+
+        files = self._category_files()
+        new_categories = [category for category in grouped if category not in files]
+        if new_categories:
+            files = dict(files)
+            for category in new_categories:
+                slug = re.sub(r"[^a-z0-9_-]+", "_", str(category).lower())[:40]
+                digest = hashlib.sha1(str(category).encode("utf-8")).hexdigest()[:8]
+                files[category] = f"{slug}-{digest}.ids"
+            _atomic_write_document(self.index_dir / "categories.json", files)
+
+        for category, ids in grouped.items():
+            with open(self.index_dir / files[category], 'a+b') as f:
+                size = f.seek(0, os.SEEK_END)
+                if size % 8:
+                    size -= size % 8
+                    f.truncate(size)
+                if size:
+                    # Skip ids already written by an interrupted earlier run
+                    f.seek(size - 8)
+                    last_id = _OFFSET.unpack(f.read(8))[0]
+                    ids = [i for i in ids if i > last_id]
+                packed = array('Q', ids)
+                if sys.byteorder != "little":
+                    packed.byteswap()
+                f.write(packed.tobytes())
+
+        with open(self.index_dir / "next_id", 'wb') as f:
+            f.write(_OFFSET.pack(entries[-1]["id"] + 1))
+
+    def categories(self) -> List[str]:
+        """All categories seen so far."""
+        self.catch_up()
+        return list(self._category_files())
+
+    def count(self, category: str) -> int:
+        """Number of insights in a category."""
+        self.catch_up()
+        name = self._category_files().get(category)
+        signature = _file_signature(self.index_dir / name) if name else None
+        return signature[1] // 8 if signature else 0
+
+    def insight_ids(self, category: str, offset: int = 0, limit: Optional[int] = None) -> List[int]:
+        """Ids of a category's insights, oldest first, paginated."""
+        self.catch_up()
+        name = self._category_files().get(category)
+        if name is None:
+            return []
+        with open(self.index_dir / name, 'rb') as f:
+            f.seek(8 * max(offset, 0))
+            data = f.read(-1 if limit is None else 8 * max(limit, 0))
+        ids = array('Q')
+        ids.frombytes(data[:len(data) - len(data) % 8])
+        if sys.byteorder != "little":
+            ids.byteswap()
+        return ids.tolist()
+
+    def insight_ids_between(self, category: str, start: int, stop: int) -> List[int]:
+        """Ids of a category's insights in ``[start, stop)``, found by binary search."""
+        self.catch_up()
+        name = self._category_files().get(category)
+        if name is None:
+            return []
+        with open(self.index_dir / name, 'rb') as f:
+            count = f.seek(0, os.SEEK_END) // 8
+
+            def position(insight_id: int) -> int:
+                lo, hi = 0, count
+                while lo < hi:
+                    mid = (lo + hi) // 2
+                    f.seek(8 * mid)
+                    if _OFFSET.unpack(f.read(8))[0] < insight_id:
+                        lo = mid + 1
+                    else:
+                        hi = mid
+                return lo
+
+            first = position(start)
+            last = position(stop)
+            f.seek(8 * first)
+            data = f.read(8 * (last - first))
+        ids = array('Q')
+        ids.frombytes(data)
+        if sys.byteorder != "little":
+            ids.byteswap()
+        return ids.tolist()
+
+_STEM_SUFFIXES = ("ing", "ed", "es", "er", "ly", "s", "e")
+
+def _stem(word: str) -> str:
+    """Strip one common English suffix, keeping at least three letters."""
+    for suffix in _STEM_SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+def _embed_texts(texts: List[str]) -> Any:
+    """Embed texts as L2-normalised float32 rows of hashed word and trigram features.
+
+    Each word contributes its stem (double weight) and the character
+    trigrams of ``#stem#``, hashed with CRC32 into RECALL_DIMENSIONS signed
+    buckets, so related word forms ("cache", "caching") land close together
+    without any model.
+    """
+    vectors = np.zeros((len(texts), RECALL_DIMENSIONS), dtype=np.float32)
+    for row, text in enumerate(texts):
+        features, weights = [], []
+        for word in _tokenize(text):
+            stem = _stem(word)
+            padded = f"#{stem}#"
+            features.append(stem)
+            features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+            weights.append(2.0)
+            weights.extend([1.0] * (len(padded) - 2))
+        if not features:
+            continue
+        hashes = np.fromiter((zlib.crc32(f.encode("utf-8")) for f in features), dtype=np.uint32, count=len(features))
+        signed = np.where(hashes & 0x80000000, 1.0, -1.0) * weights
+        vectors[row] = np.bincount(hashes % RECALL_DIMENSIONS, weights=signed, minlength=RECALL_DIMENSIONS)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
+
+# Set bits per byte value, for Hamming distances between packed sketches
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8) if np is not None else None
+
+class InsightVectorIndex(DerivedInsightIndex):
+    """Hashed-feature vectors of insights, kept in ``learning_memory/vector_index/``.
+
+    ``vectors.f32`` is a row-major float32 matrix with one row per insight id,
+    appended to on every save and memory-mapped for queries, which score all
+    rows with one matrix-vector product. ``sketches.u8`` holds a
+    RECALL_SKETCH_BITS-bit random-projection (SimHash) sketch per row; above
+    RECALL_EXACT_LIMIT rows, queries rank the sketches by Hamming distance
+    and score only the closest RECALL_CANDIDATES rows, so the matrix itself
+    is read for a small fraction of rows.
+    """
+
+    name = "vector_index"
+
+    # Projection planes of the sketches, keyed by (bits, dimensions); they
+    # are fixed by the seed, so one copy serves every index
+    _planes: Dict[Tuple[int, int], Any] = {}
+
+    def __init__(self, backend: MemoryBackend):
+        super().__init__(backend)
+        self.reset()
+
+    def reset(self) -> None:
+        self._matrix: Any = None
+        self._sketches: Any = None
+
+    def make_entry(self, insight_id: int, record: Dict[str, Any]) -> Dict[str, Any]:
+        return {"id": insight_id, "text": str(record.get("insight", ""))}
+
+    @classmethod
+    def _sketch(cls, vectors: Any) -> Any:
+        shape = (RECALL_SKETCH_BITS, RECALL_DIMENSIONS)
+        planes = cls._planes.get(shape)
+        if planes is None:
+            planes = cls._planes[shape] = np.ascontiguousarray(
+                np.random.default_rng(RECALL_SKETCH_BITS).standard_normal(shape).astype(np.float32).T)
+        return np.packbits(vectors @ planes > 0, axis=1)
+
+    def _rows(self) -> int:
+        sizes = []
+        for name, width in (("vectors.f32", 4 * RECALL_DIMENSIONS), ("sketches.u8", RECALL_SKETCH_BITS // 8)):
+            signature = _file_signature(self.index_dir / name)
+            sizes.append(signature[1] // width if signature else 0)
+        return min(sizes)
 
+    def _persisted_next_id(self) -> int:
+        return self._rows()
+
+    def write_entries(self, entries: List[Dict[str, Any]]) -> None:
+        rows = self._rows()
+        entries = [entry for entry in entries if entry["id"] >= rows]
+        if not entries:
+            return
+        vectors = _embed_texts([entry["text"] for entry in entries]).astype("<f4")
+        for name, width, data in (("vectors.f32", 4 * RECALL_DIMENSIONS, vectors),
+                                  ("sketches.u8", RECALL_SKETCH_BITS // 8, self._sketch(vectors))):
+            with open(self.index_dir / name, 'a+b') as f:
+                f.truncate(rows * width)  # drop rows of an interrupted earlier write
+                f.seek(0, os.SEEK_END)
+                f.write(data.tobytes())
+
+    def _mapped(self) -> Tuple[Any, Any]:
+        """The vector matrix and sketches, remapped when rows were added."""
+        rows = self._rows()
+        if self._matrix is None or len(self._matrix) != rows:
+            self._matrix = self._sketches = None
+            if rows:
+                self._matrix = np.memmap(self.index_dir / "vectors.f32", dtype="<f4", mode="r",
+                                         shape=(rows, RECALL_DIMENSIONS))
+                self._sketches = np.memmap(self.index_dir / "sketches.u8", dtype=np.uint8, mode="r",
+                                           shape=(rows, RECALL_SKETCH_BITS // 8))
+        return self._matrix, self._sketches
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[int, float]]:
+        """Return up to ``k`` ``(insight_id, cosine similarity)`` pairs, best first."""
+        self.catch_up()
+        with self._lock:
+            matrix, sketches = self._mapped()
+            vector = _embed_texts([query])[0]
+            if matrix is None or k <= 0 or not vector.any():
+                return []
+            rows = None
+            if len(matrix) > RECALL_EXACT_LIMIT:
+                distances = _POPCOUNT[sketches ^ self._sketch(vector[None, :])].sum(axis=1, dtype=np.uint16)
+                candidates = min(max(RECALL_CANDIDATES, k), len(distances))
+                rows = np.sort(np.argpartition(distances, candidates - 1)[:candidates])
+                scores = matrix[rows] @ vector
+            else:
+                scores = matrix @ vector
+            k = min(k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top], kind="stable")]
+            ids = top if rows is None else rows[top]
+            return [(int(i), float(s)) for i, s in zip(ids, scores[top]) if s > 0]
+
+def _simhash(text: str) -> int:
+    """64-bit SimHash of a text's word stems and stem bigrams."""
+    stems = [_stem(word) for word in _tokenize(text)]
+    weights = [0] * 64
+    for feature in stems + [f"{a} {b}" for a, b in zip(stems, stems[1:])]:
+        digest = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+        for bit in range(64):
+            weights[bit] += 1 if digest >> bit & 1 else -1
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+class _SimHashBands:
+    """Band tables that find SimHashes within ``max_distance`` bits of a query.
+
+    The 64 bits are split into ``max_distance + 1`` bands; two hashes that
+    differ in at most ``max_distance`` bits agree exactly on at least one
+    band, so only hashes sharing a band value are compared.
+    """
+
+    def __init__(self, max_distance: int):
+        self.max_distance = max_distance
+        bands = max_distance + 1
+        self._bands = [(64 * b // bands, (1 << (64 * (b + 1) // bands - 64 * b // bands)) - 1) for b in range(bands)]
+        self._tables: List[Dict[int, List[int]]] = [{} for _ in range(bands)]
+        self._hashes: Dict[int, int] = {}
+
+    def add(self, key: int, simhash: int) -> None:
+        self._hashes[key] = simhash
+        for (shift, mask), table in zip(self._bands, self._tables):
+            table.setdefault(simhash >> shift & mask, []).append(key)
+
+    def nearest(self, simhash: int) -> Optional[int]:
+        """Key of the closest hash within range (the oldest on ties), or None."""
+        best: Optional[Tuple[int, int]] = None
+        for (shift, mask), table in zip(self._bands, self._tables):
+            for key in table.get(simhash >> shift & mask, ()):
+                distance = bin(self._hashes[key] ^ simhash).count("1")
+                if distance <= self.max_distance and (best is None or (distance, key) < best):
+                    best = (distance, key)
+        return None if best is None else best[1]
+
+class InsightDuplicateIndex(DerivedInsightIndex):
+    """SimHashes of insights for near-duplicate checks, in ``learning_memory/duplicate_index/``.
+
+    Entries carry each insight's 64-bit SimHash; in memory they are kept in
+    _SimHashBands, so a check compares only the hashes sharing a band with the
+    new insight. ``occurrences.jsonl`` records the duplicates folded into an
+    earlier insight by the "count" and "merge" modes; it is reset, like the
+    index, when the log is rewritten.
+    """
+
+    name = "duplicate_index"
+
+    def __init__(self, backend: MemoryBackend):
+        super().__init__(backend)
+        self.occurrences_file = self.index_dir / "occurrences.jsonl"
+        self.reset()
+
+    def reset(self) -> None:
+        self._simhashes: Dict[int, int] = {}
+        self._tables: Optional[_SimHashBands] = None
+        self._occurrences: Dict[int, Dict[str, Any]] = {}
+        self._occurrences_pos = 0
+
+    def make_entry(self, insight_id: int, record: Dict[str, Any]) -> Dict[str, Any]:
+        return {"id": insight_id, "h": _simhash(str(record.get("insight", "")))}
+
+    def apply(self, entry: Dict[str, Any]) -> None:
+        self._simhashes[entry["id"]] = entry["h"]
+        if self._tables is not None:
+            self._tables.add(entry["id"], entry["h"])
+
+    def _follow(self) -> None:
+        super()._follow()
+        try:
+            f = open(self.occurrences_file, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            f.seek(self._occurrences_pos)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                self._occurrences_pos += len(line)
+                entry = _json_loads(line)
+                seen = self._occurrences.setdefault(entry["id"], {"occurrences": 1})
+                seen["occurrences"] += 1
+                if "last_seen" in entry:
+                    seen["last_seen"] = entry["last_seen"]
+
+    def nearest(self, simhash: int, max_distance: int) -> Optional[int]:
+        """Id of the stored insight closest to ``simhash``, if within range."""
+        self.ensure_loaded()
+        with self._lock:
+            if self._tables is None or self._tables.max_distance != max_distance:
+                self._tables = _SimHashBands(max_distance)
+                for insight_id, stored in self._simhashes.items():
+                    self._tables.add(insight_id, stored)
+            return self._tables.nearest(simhash)
+
+    def record_occurrences(self, entries: List[Dict[str, Any]]) -> None:
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        _append_lines(self.occurrences_file, [_encode_record(entry) for entry in entries])
+
+    def occurrences(self, insight_id: int) -> Dict[str, Any]:
+        """``{"occurrences": n, "last_seen": ...}`` for an insight with folded duplicates."""
+        self.ensure_loaded()
+        with self._lock:
+            return dict(self._occurrences.get(insight_id, {}))
+
+def _dedup_settings(backend: MemoryBackend) -> Tuple[str, float]:
+    """Duplicate handling mode and similarity threshold for a memory directory."""
+    settings = _config_section(backend.memory_dir, "insight_dedup")
+    mode = settings.get("mode", DEDUP_MODE)
+    threshold = settings.get("threshold", DEDUP_THRESHOLD)
+    if mode not in ("off", "skip", "count", "merge"):
+        raise ValueError(f"Unknown insight_dedup mode {mode!r}; expected off, skip, count or merge")
+    if not 0.5 <= threshold <= 1:
+        raise ValueError(f"insight_dedup threshold must be between 0.5 and 1, not {threshold!r}")
+    return mode, threshold
+
+def _drop_near_duplicates(backend: MemoryBackend, records: List[Dict[str, Any]], mode: str,
+                          threshold: float) -> List[Dict[str, Any]]:
+    """Records that are not near-duplicates of stored insights or of each other."""
+    max_distance = int((1 - threshold) * 64)
+    index = _derived_index(InsightDuplicateIndex, backend)
+    index.catch_up()
+    next_id = backend.next_insight_id()
+    batch = _SimHashBands(max_distance)
+    kept: List[Dict[str, Any]] = []
+    occurrences: List[Dict[str, Any]] = []
+    for record in records:
+        simhash = _simhash(str(record.get("insight", "")))
+        original = index.nearest(simhash, max_distance)
+        if original is None:
+            original = batch.nearest(simhash)
+        if original is None:
+            batch.add(next_id + len(kept), simhash)
+            kept.append(record)
+        elif mode == "count":
+            occurrences.append({"id": original})
+        elif mode == "merge":
+            occurrences.append({"id": original, "last_seen": record.get("timestamp")})
+    if occurrences:
+        index.record_occurrences(occurrences)
+    return kept
+
+# Derived indexes kept up to date on every save, in the order they are listed
+_DERIVED_INDEXES: List[Callable[[MemoryBackend], DerivedInsightIndex]] = [
+    InsightSearchIndex,
+    InsightCategoryIndex,
+]
+if np is not None:
+    _DERIVED_INDEXES.append(InsightVectorIndex)
+_derived_indexes: Dict[Tuple[str, Path, str], DerivedInsightIndex] = {}
+
+def _derived_index(index_class: Callable[[MemoryBackend], DerivedInsightIndex],
+                   backend: Optional[MemoryBackend] = None) -> Any:
+    """Return the shared instance of a derived index for a backend."""
+    backend = backend or get_backend()
+    key = (backend.name, backend.memory_dir, index_class.name)
+    with _backends_lock:
+        index = _derived_indexes.get(key)
+        if index is None:
+            index = _derived_indexes[key] = index_class(backend)
+        return index
+
+def _store_insights(records: List[Dict[str, Any]]) -> None:
+    """Append insights to the backend and bring derived indexes up to date.
+
+    Near-duplicates are first dropped (and possibly counted) according to the
+    "insight_dedup" section of memory_config.json.
+    """
+    backend = get_backend()
+    mode, threshold = _dedup_settings(backend)
+    if mode != "off":
+        records = _drop_near_duplicates(backend, records, mode, threshold)
+        if not records:
+            return
+    backend.append_insights(records)
+    for index_class in _DERIVED_INDEXES:
+        _derived_index(index_class, backend).catch_up()
+    if mode != "off":
+        _derived_index(InsightDuplicateIndex, backend).catch_up()
+
+@_instrument
 def save_session_insight(insight: str, category: str = "general") -> None:
-    """Save a new insight from the current session."""
-    insights_file = MEMORY_DIR / "learning_memory" / "session_insights.json"
-    
-    # Ensure directory exists
-    insights_file.parent.mkdir(parents=True, exist_ok=True)
-    
-    if insights_file.exists():
-        with open(insights_file, 'r') as f:
-            insights = json.load(f)
-    else:
-        insights = {"insights": []}
-    
+    """Save a new insight from the current session.
+
+    With the JSON backend insights are appended as one JSON object per line,
+    so the cost of a save does not depend on how many insights are stored.
+    """
     new_insight = {
         "timestamp": datetime.utcnow().isoformat(),
         "category": category,
         "insight": insight
     }
     
-    insights["insights"].append(new_insight)
-    
-    with open(insights_file, 'w') as f:
-        json.dump(insights, f, indent=2)
+    _store_insights([new_insight])
 
-def get_project_context(project_name: str = None) -> Dict[str, Any]:
-    """Get project context from memory."""
-    if project_name:
-        project_file = MEMORY_DIR / "project_memory" / f"{project_name.lower().replace(' ', '_')}.json"
-    else:
+@_instrument
+def save_session_insights(insights: Iterable[Union[str, Tuple[str, str]]], category: str = "general") -> None:
+    """Save many insights with a single write; either all are stored or none are.
+
+    Items are insight strings, filed under ``category``, or
+    ``(insight, category)`` pairs.
+    """
+    timestamp = datetime.utcnow().isoformat()
+    records = []
+    for item in insights:
+        text, item_category = (item, category) if isinstance(item, str) else item
+        records.append({"timestamp": timestamp, "category": item_category, "insight": text})
+    if records:
+        _store_insights(records)
+
+@_instrument
+def iter_session_insights() -> Iterator[Dict[str, Any]]:
+    """Yield stored insights oldest first without loading them all at once."""
+    yield from get_backend().iter_insights()
+
+@_instrument
+def load_session_insights() -> Dict[str, List[Dict[str, Any]]]:
+    """Load all insights in the ``{"insights": [...]}`` document layout."""
+    return {"insights": list(iter_session_insights())}
+
+def _insights_in_range(backend: MemoryBackend, since: Optional[str], until: Optional[str],
+                       category: Optional[str]) -> Iterator[Dict[str, Any]]:
+    """Yield insights timestamped in [since, until), oldest first."""
+    index = _derived_index(InsightCategoryIndex, backend) if category is not None else None
+    for start, stop, exact in backend.insight_id_ranges(since, until):
+        if index is not None:
+            ids = index.insight_ids_between(category, start, stop)
+            records = (
+                record
+                for chunk in range(0, len(ids), 256)
+                for record in backend.get_insights(ids[chunk:chunk + 256])
+                if record is not None
+            )
+        else:
+            records = (record for _, record in itertools.islice(
+                backend.iter_insight_entries(start), stop - start))
+        for record in records:
+            if not exact:
+                timestamp = record.get("timestamp", "")
+                if (since is not None and timestamp < since) or (until is not None and timestamp >= until):
+                    continue
+            yield record
+
+@_instrument
+def get_insight(insight_id: int) -> Optional[Dict[str, Any]]:
+    """Fetch one insight by id (its position in save order), or None.
+
+    When near-duplicates are counted or merged, an insight that absorbed any
+    carries ``occurrences`` (and with "merge", ``last_seen``).
+    """
+    backend = get_backend()
+    record = backend.get_insights([insight_id])[0]
+    if record is not None and _dedup_settings(backend)[0] in ("count", "merge"):
+        seen = _derived_index(InsightDuplicateIndex, backend).occurrences(insight_id)
+        if seen:
+            record = dict(record, **seen)
+    return record
+
+@_instrument
+def get_session_insights(category: Optional[str] = None, limit: Optional[int] = None,
+                         offset: int = 0, since: Any = None,
+                         until: Any = None) -> Dict[str, List[Dict[str, Any]]]:
+    """Get saved insights grouped by category, oldest first.
+
+    With ``category`` only that category's records are read, located through
+    the category index, and ``limit``/``offset`` page within it. Without it,
+    ``limit``/``offset`` page through the whole history in save order.
+
+    ``since`` (inclusive) and ``until`` (exclusive) restrict the result to a
+    time range; they take datetimes or ISO timestamp strings. Only the log
+    segments overlapping the range are read.
+    """
+    backend = get_backend()
+    since, until = _as_timestamp(since), _as_timestamp(until)
+    if since is not None or until is not None:
+        records = itertools.islice(_insights_in_range(backend, since, until, category),
+                                   max(offset, 0), None if limit is None else max(offset, 0) + limit)
+        grouped: Dict[str, List[Dict[str, Any]]] = {category: []} if category is not None else {}
+        for record in records:
+            grouped.setdefault(record.get("category", "general"), []).append(record)
+        return grouped
+
+    if category is not None:
+        index = _derived_index(InsightCategoryIndex, backend)
+        records = backend.get_insights(index.insight_ids(category, offset, limit))
+        return {category: [record for record in records if record is not None]}
+
+    grouped = {}
+    entries = backend.iter_insight_entries(max(offset, 0))
+    for _, record in itertools.islice(entries, limit):
+        grouped.setdefault(record.get("category", "general"), []).append(record)
+    return grouped
+
+@_instrument
+def search_insights(query: str, k: int = 10, category: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Full-text search over session insights, ranked by BM25.
+
+    Returns up to ``k`` insight records, best match first, each with its
+    ``id`` and ``score`` added. ``category`` restricts matches to one category.
+    """
+    backend = get_backend()
+    hits = _derived_index(InsightSearchIndex, backend).search(query, k, category)
+    records = backend.get_insights([insight_id for insight_id, _ in hits])
+    return [
+        dict(record, id=insight_id, score=score)
+        for (insight_id, score), record in zip(hits, records)
+        if record is not None
+    ]
+
+@_instrument
+def recall(query: str, k: int = 10) -> List[Dict[str, Any]]:
+    """Semantic recall: the ``k`` insights closest in meaning to ``query``.
+
+    Unlike search_insights(), matches need not share exact words, since
+    insights are compared as hashed word and character-trigram vectors
+    computed locally (no network or model). Returns insight records, best
+    first, each with its ``id`` and a cosine ``score``. Requires numpy.
+    """
+    if np is None:
+        raise ImportError("recall() requires numpy. Install with: pip install numpy")
+    backend = get_backend()
+    hits = _derived_index(InsightVectorIndex, backend).search(query, k)
+    records = backend.get_insights([insight_id for insight_id, _ in hits])
+    return [
+        dict(record, id=insight_id, score=score)
+        for (insight_id, score), record in zip(hits, records)
+        if record is not None
+    ]
+
+def _config_section(memory_dir: Path, section: str) -> Dict[str, Any]:
+    """One section of memory_config.json, e.g. "insight_retention", if any."""
+    try:
+        config = _read_document(memory_dir / MEMORY_CONFIG_FILE)
+    except FileNotFoundError:
+        return {}
+    return config.get(section, {})
+
+def _compact(backend: MemoryBackend, max_age_days: Optional[float],
+             max_per_category: Optional[int]) -> Dict[str, int]:
+    settings = _config_section(backend.memory_dir, "insight_retention")
+    if max_age_days is None:
+        max_age_days = settings.get("max_age_days")
+    if max_per_category is None:
+        max_per_category = settings.get("max_per_category")
+    cutoff = None
+    if max_age_days is not None:
+        cutoff = (datetime.utcnow() - timedelta(days=max_age_days)).isoformat()
+    return backend.compact_insights(cutoff, max_per_category)
+
+def _compact_in_background(backend: MemoryBackend) -> None:
+    """Run compaction with the configured retention on a daemon thread."""
+    def run() -> None:
+        try:
+            _compact(backend, None, None)
+        except (OSError, ValueError) as exc:
+            warnings.warn(f"Background insight compaction failed: {exc}", RuntimeWarning)
+
+    threading.Thread(target=run, name="insight-compaction", daemon=True).start()
+
+@_instrument
+def compact_insights(max_age_days: Optional[float] = None,
+                     max_per_category: Optional[int] = None) -> Dict[str, int]:
+    """Apply retention rules to session insights and merge small old segments.
+
+    Limits default to the "insight_retention" section of memory_config.json,
+    e.g. ``{"insight_retention": {"max_age_days": 365, "max_per_category": 5000}}``.
+    The JSON backend runs this in the background whenever a segment is
+    sealed; concurrent saves are not blocked. Returns the number of records
+    removed, segments merged and bytes reclaimed.
+    """
+    return _compact(get_backend(), max_age_days, max_per_category)
+
+class SessionLog:
+    """Append-only markdown log in session_logs/, one ``- <timestamp> <activity>``
+    line per entry, written through a handle kept open between entries.
+
+    Entries are buffered and written with a single ``write`` according to the
+    same policy as MemoryStore (``flush_every`` entries, ``flush_interval_ms``
+    after the first pending one, or ``flush()``). ``durability`` decides what
+    a flush guarantees: "none" leaves the data to the OS, "batch" fsyncs once
+    per flush, and "always" writes and fsyncs every entry before returning.
+
+    Logs rotate daily: the first entry of a new (UTC) day renames the file to
+    ``<stem>.<previous day><suffix>`` and starts a fresh one. Each flush checks
+    the file's inode, so rotation or archiving by another process makes this
+    one reopen the path instead of writing to the moved file.
+    """
+
+    def __init__(self, path: Path, flush_every: Optional[int] = 1, flush_interval_ms: Optional[float] = None,
+                 durability: str = SESSION_LOG_DURABILITY):
+        if durability not in ("none", "batch", "always"):
+            raise ValueError(f"Unknown durability {durability!r}; choose from 'none', 'batch' or 'always'")
+        self.path = path
+        self.flush_every = flush_every
+        self.flush_interval_ms = flush_interval_ms
+        self.durability = durability
+        self._lock = threading.RLock()
+        self._file: Optional[Any] = None
+        self._inode: Optional[int] = None
+        self._day: Optional[str] = None
+        self._pending: List[str] = []
+        self._timer: Optional[threading.Timer] = None
+
+    def append(self, activity: str) -> None:
+        timestamp = datetime.utcnow().isoformat(timespec="seconds")
+        with self._lock:
+            if timestamp[:10] != self._day:
+                self.flush()  # pending entries belong to the previous day
+                self._rotate(timestamp[:10])
+            self._pending.append(f"- {timestamp} {activity}\n")
+            if self.durability == "always" or (self.flush_every and len(self._pending) >= self.flush_every):
+                self.flush()
+            elif self.flush_interval_ms is not None and self._timer is None:
+                self._timer = threading.Timer(self.flush_interval_ms / 1000.0, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _open(self) -> Any:
+        signature = _file_signature(self.path)
+        if self._file is None or signature is None or signature[2] != self._inode:
+            self._close_file()
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, 'ab')
+            self._inode = os.fstat(self._file.fileno()).st_ino
+        return self._file
+
+    def _rotate(self, day: str) -> None:
+        """Move entries of an earlier day aside, unless another process already did."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'ab') as f, _file_lock(f):
+            stat = os.fstat(f.fileno())
+            current = _file_signature(self.path)
+            if (stat.st_size and current is not None and current[2] == stat.st_ino
+                    and self._inode in (None, stat.st_ino)):
+                previous = self._day or time.strftime("%Y-%m-%d", time.gmtime(stat.st_mtime))
+                if previous < day:
+                    name, n = f"{self.path.stem}.{previous}{self.path.suffix}", 1
+                    while (self.path.parent / name).exists():
+                        name, n = f"{self.path.stem}.{previous}.{n}{self.path.suffix}", n + 1
+                    os.replace(self.path, self.path.parent / name)
+        self._close_file()
+        self._day = day
+
+    def flush(self) -> None:
+        """Write pending entries, fsyncing them unless durability is "none"."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._pending:
+                return
+            f = self._open()
+            payload = "".join(self._pending).encode("utf-8")
+            f.write(payload)
+            if _metrics is not None:
+                _metrics.add("bytes_written", len(payload))
+            f.flush()
+            if self.durability != "none":
+                os.fsync(f.fileno())
+            self._pending = []
+        _note_file_write(self.path)
+
+    def _close_file(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file, self._inode = None, None
+
+    def close(self) -> None:
+        """Flush pending entries and release the file handle."""
+        with self._lock:
+            self.flush()
+            self._close_file()
+
+_session_logs: "OrderedDict[Path, SessionLog]" = OrderedDict()
+_session_logs_lock = threading.Lock()
+_session_log_policy: Dict[str, Any] = {"flush_every": 1, "flush_interval_ms": None,
+                                       "durability": SESSION_LOG_DURABILITY}
+
+def configure_session_logs(flush_every: Optional[int] = 1, flush_interval_ms: Optional[float] = None,
+                           durability: str = SESSION_LOG_DURABILITY) -> None:
+    """Set the buffering and durability of log_session_activity().
+
+    By default every entry is written as it is logged, without fsync. For
+    high-frequency logging, ``flush_every=100, flush_interval_ms=1000`` writes
+    in batches, and ``durability="batch"`` fsyncs each batch; "always" writes
+    and fsyncs every entry. Pending entries are written at interpreter exit or
+    by ``flush_session_logs()``.
+    """
+    if durability not in ("none", "batch", "always"):
+        raise ValueError(f"Unknown durability {durability!r}; choose from 'none', 'batch' or 'always'")
+    flush_session_logs()
+    with _session_logs_lock:
+        _session_log_policy.update(flush_every=flush_every, flush_interval_ms=flush_interval_ms,
+                                   durability=durability)
+        for log in _session_logs.values():
+            with log._lock:
+                log.flush_every, log.flush_interval_ms, log.durability = flush_every, flush_interval_ms, durability
+
+def _session_log(log_file: str) -> SessionLog:
+    path = Path(MEMORY_DIR) / "session_logs" / log_file
+    with _session_logs_lock:
+        log = _session_logs.get(path)
+        if log is None:
+            log = _session_logs[path] = SessionLog(path, **_session_log_policy)
+            if len(_session_logs) > SESSION_LOG_HANDLES:
+                _session_logs.popitem(last=False)[1].close()
+        else:
+            _session_logs.move_to_end(path)
+        return log
+
+@_instrument
+def log_session_activity(activity: str, log_file: Optional[str] = None) -> None:
+    """Append a timestamped activity line to a markdown log in session_logs/.
+
+    ``log_file`` defaults to SESSION_LOG_FILE. Logs rotate daily, and writes
+    are buffered and synced as set by configure_session_logs().
+    """
+    _session_log(log_file or SESSION_LOG_FILE).append(activity)
+
+@_instrument
+def flush_session_logs() -> None:
+    """Write all pending session log entries."""
+    with _session_logs_lock:
+        logs = list(_session_logs.values())
+    for log in logs:
+        log.flush()
+
+atexit.register(flush_session_logs)
+
+@_instrument
+def tier_memory(max_idle_days: Optional[float] = None) -> Dict[str, int]:
+    """Move memory that has not been read or written recently into ``archive/``.
+
+    Project documents, sealed insight segments and session logs whose last
+    read (as recorded by this module) and last modification are both older
+    than ``max_idle_days`` are LZMA-compressed into ``archive/`` under their
+    relative path; files that compression would not shrink stay where they
+    are. get_project_context() and the insight readers keep
+    finding archived items, decompressing them on first use; saving a
+    project moves it back. The limit defaults to the "tiering" section of
+    memory_config.json, e.g. ``{"tiering": {"max_idle_days": 30}}``, else
+    ARCHIVE_IDLE_DAYS. Returns the number of items moved of each kind and
+    their bytes before and after compression.
+    """
+    memory_dir = Path(MEMORY_DIR)
+    if max_idle_days is None:
+        max_idle_days = _config_section(memory_dir, "tiering").get("max_idle_days", ARCHIVE_IDLE_DAYS)
+    access_log = _access_log(memory_dir)
+    accessed = access_log.last_access()
+    cutoff = time.time() - max_idle_days * 86400
+
+    def is_cold(path: Path) -> bool:
+        try:
+            modified = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return False
+        key = Path(os.path.relpath(path, memory_dir)).as_posix()
+        return max(modified, accessed.get(key, 0.0)) < cutoff
+
+    stats = {"projects": 0, "insight_segments": 0, "session_logs": 0, "bytes_before": 0, "bytes_after": 0}
+    stats.update(get_backend().archive_cold(is_cold))
+    session_dir = memory_dir / "session_logs"
+    if session_dir.exists():
+        for path in sorted(session_dir.iterdir()):
+            if not path.is_file() or path.name.startswith(".") or not is_cold(path):
+                continue
+            before, after = _archive_file(path, memory_dir / ARCHIVE_DIR / "session_logs" /
+                                          f"{path.name}{ARCHIVE_SUFFIX}")
+            if before:
+                stats["session_logs"] += 1
+                stats["bytes_before"] += before
+                stats["bytes_after"] += after
+    access_log.save()
+    return stats
+
+@_instrument
+def get_project_context(project_name: str = None,
+                        path: Union[str, Iterable[Union[str, int]], None] = None) -> Any:
+    """Get project context from memory.
+
+    Unchanged project files are served from the read cache; the returned
+    value is a deep copy, so changing it does not affect later reads.
+
+    With ``path`` (dotted, e.g. ``"architecture.frontend"`` or
+    ``"current_progress.in_progress.0"``, or a sequence of keys and indexes)
+    only that value is returned, or None if it does not exist. The JSON
+    backend reads just the bytes of the value through a span index instead of
+    decoding the whole file; SQLite extracts it in the database.
+    """
+    if not project_name:
         # Get the current project from active memory
         active = get_active_memory()
         if active and "current_session" in active:
             project_name = active["current_session"].get("project", "")
-            project_file = MEMORY_DIR / "project_memory" / f"{project_name.lower().replace(' ', '_')}.json"
         else:
-            return {}
+            return {} if path is None else None
     
-    if project_file.exists():
-        with open(project_file, 'r') as f:
-            return json.load(f)
-    return {}
+    if path is not None:
+        try:
+            # Archived documents are walked in their cached copy
+            return copy.deepcopy(get_backend().load_project_path(_project_key(project_name), _path_segments(path)))
+        except KeyError:
+            return None
+
+    context = get_backend().load_project(_project_key(project_name))
+    return copy.deepcopy(context) if context is not None else {}
+
+@_instrument
+def save_project_context(project_name: str, context: Dict[str, Any]) -> None:
+    """Store the full context document for a project."""
+    get_backend().save_project(_project_key(project_name), context)
+
+class ProjectLoad(NamedTuple):
+    """One result of load_all_projects(); ``context`` is None if ``error`` is set."""
+    name: str
+    context: Optional[Dict[str, Any]]
+    seconds: float
+    error: Optional[str] = None
+
+def _timed_project_load(load: Callable[[Any], Optional[Dict[str, Any]]], name: str, source: Any) -> ProjectLoad:
+    start = time.perf_counter()
+    try:
+        context = load(source)
+    except (OSError, ValueError) as exc:
+        return ProjectLoad(name, None, time.perf_counter() - start, f"{type(exc).__name__}: {exc}")
+    # Thread loads return the read cache's document; callers get their own copy
+    return ProjectLoad(name, copy.deepcopy(context) if context is not None else {}, time.perf_counter() - start)
+
+def _load_project_file(path: str) -> Optional[Dict[str, Any]]:
+    """Read and decode one project file, bypassing the read cache (process pools).
+
+    Files archived by tier_memory() are decompressed first.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    return _decode_archived(data) if path.endswith(ARCHIVE_SUFFIX) else _decode_document(data)
+
+@_instrument
+def load_all_projects(filter: Union[str, Callable[[str], bool], None] = None, workers: int = 8,
+                      processes: bool = False) -> Iterator[ProjectLoad]:
+    """Load every project document in parallel, yielding each as it completes.
+
+    ``filter`` is a glob pattern or a predicate over project keys (names as
+    stored, e.g. ``"web_*"``). Files are read and parsed on ``workers``
+    threads, or with ``processes=True`` in a process pool, which also spreads
+    JSON parsing over several cores (JSON backend only). Results arrive in
+    completion order as ProjectLoad tuples carrying the time spent on that
+    project and a context the caller may modify; a file that cannot be read
+    or parsed is reported through ``error`` instead of stopping the scan.
+    """
+    backend = get_backend()
+    keys = backend.list_projects()
+    if isinstance(filter, str):
+        keys = fnmatch.filter(keys, filter)
+    elif filter is not None:
+        keys = [key for key in keys if filter(key)]
+
+    if processes and isinstance(backend, JSONFileBackend):
+        pool: Any = ProcessPoolExecutor(max_workers=workers)
+        jobs = ((key, _load_project_file, str(backend.project_file(key))) for key in keys)
+    else:
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="project-load")
+        jobs = ((key, backend.load_project, key) for key in keys)
 
-def create_orc_data(data: List[Dict], filename: str) -> None:
-    """Create ORC file for analytical data (requires pyarrow)."""
+    pending: Set[Any] = set()
+    try:
+        # Keep a bounded window in flight so thousands of files stream steadily
+        for key, load, source in jobs:
+            if len(pending) >= workers * 4:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+            pending.add(pool.submit(_timed_project_load, load, key, source))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+    finally:
+        for future in pending:
+            future.cancel()  # the caller stopped early
+        pool.shutdown(wait=True)
+
+def _context_lines(values: Dict[str, Any]) -> List[str]:
+    return [f"- {key}: {value if isinstance(value, str) else _encode_record(value)}"
+            for key, value in values.items()]
+
+def _fit_lines(header: str, lines: List[str], chars: int) -> Tuple[List[str], int]:
+    """Take lines in order while they fit in ``chars``, shortening the last one.
+
+    Returns the section (empty if not even one line fits) and the characters
+    left over.
+    """
+    chars -= len(header) + 1
+    taken = []
+    for line in lines:
+        if len(line) + 1 <= chars:
+            taken.append(line)
+            chars -= len(line) + 1
+            continue
+        if chars > 40:
+            taken.append(line[:chars - 2] + "…")
+            chars = 0
+        break
+    if not taken:
+        return [], chars + len(header) + 1
+    return [header] + taken, chars
+
+def _context_insights(backend: MemoryBackend, query: Optional[str]) -> List[Dict[str, Any]]:
+    """Insights worth including: best matches for ``query`` first, then the newest."""
+    ranked: List[Dict[str, Any]] = []
+    if query:
+        if np is not None:
+            ranked = [record for record in recall(query, CONTEXT_INSIGHTS)
+                      if record["score"] >= CONTEXT_MIN_SIMILARITY]
+        else:
+            ranked = search_insights(query, CONTEXT_INSIGHTS)
+    seen = {record["id"] for record in ranked}
+    start = max(0, backend.next_insight_id() - CONTEXT_INSIGHTS)
+    recent = [dict(record, id=insight_id) for insight_id, record in backend.iter_insight_entries(start)]
+    ranked.extend(record for record in reversed(recent) if record["id"] not in seen)
+    return ranked
+
+def _assemble_context(max_tokens: int, active: Dict[str, Any], project_name: str,
+                      project: Dict[str, Any], insights: List[Dict[str, Any]]) -> str:
+    chars = max_tokens * CONTEXT_CHARS_PER_TOKEN
+    sections: List[List[str]] = []
+    for header, values in (("## Session", active.get("current_session") or {}),
+                           ("## User Preferences", active.get("user_preferences") or {})):
+        section, chars = _fit_lines(header, _context_lines(values), chars)
+        sections.append(section)
+    insight_lines = [f"- [{record.get('category', 'general')}] {record.get('insight', '')}" for record in insights]
+    # The project may use half of what is left while insights compete for it
+    project_chars = chars // 2 if insight_lines else chars
+    section, unused = _fit_lines(f"## Project: {project_name}", _context_lines(project), project_chars)
+    sections.append(section)
+    chars -= project_chars - unused
+    section, chars = _fit_lines("## Insights", insight_lines, chars)
+    sections.append(section)
+    return "\n".join(line for section in sections for line in section)
+
+_context_cache: "OrderedDict[str, str]" = OrderedDict()
+_context_cache_lock = threading.Lock()
+
+@_instrument
+def build_agent_context(max_tokens: int = 2000, query: Optional[str] = None) -> str:
+    """Assemble one compact context block for the start of an agent session.
+
+    Combines ``current_session`` and ``user_preferences`` from active memory,
+    the current project's context and insights, the best matches for
+    ``query`` (by recall() when numpy is available, else search_insights())
+    followed by the most recent, as markdown sections in that order of
+    priority. Lines are dropped or shortened so the block stays within
+    ``max_tokens`` (estimated at CONTEXT_CHARS_PER_TOKEN characters each);
+    the project gets at most half of the budget the insights could use.
+
+    Results are cached, in memory and in ``.context_cache/``, under a hash
+    of the inputs (active memory, project document and the insight log
+    position), so an unchanged memory is not ranked or assembled again.
+    """
+    backend = get_backend()
+    active = get_active_memory() or {}
+    project_name = (active.get("current_session") or {}).get("project") or ""
+    project = get_project_context(project_name) if project_name else {}
+    key_source = [CONTEXT_CACHE_VERSION, max_tokens, query,
+                  {name: active.get(name) for name in ("current_session", "user_preferences")},
+                  project_name, project, backend.name, str(backend.insight_log_token()),
+                  backend.next_insight_id()]
+    key = hashlib.sha1(_SERIALIZERS["json"].dumps(key_source)).hexdigest()
+
+    cache_dir = backend.memory_dir / ".context_cache"
+    with _context_cache_lock:
+        context = _context_cache.get(key)
+        if context is not None:
+            _context_cache.move_to_end(key)
+            if _metrics is not None:
+                _metrics.add("cache_hits")
+            return context
+    try:
+        context = (cache_dir / f"{key}.md").read_text(encoding="utf-8")
+        if _metrics is not None:
+            _metrics.add("cache_hits")
+    except FileNotFoundError:
+        if _metrics is not None:
+            _metrics.add("cache_misses")
+        context = _assemble_context(max_tokens, active, project_name, project,
+                                    _context_insights(backend, query))
+        cache_dir.mkdir(exist_ok=True)
+        tmp_file = cache_dir / f".{key}.{os.getpid()}.tmp"
+        tmp_file.write_text(context, encoding="utf-8")
+        os.replace(tmp_file, cache_dir / f"{key}.md")
+        cached = sorted(cache_dir.glob("*.md"), key=lambda path: path.stat().st_mtime_ns)
+        for path in cached[:-CONTEXT_CACHE_SIZE]:
+            path.unlink(missing_ok=True)
+    with _context_cache_lock:
+        _context_cache[key] = context
+        while len(_context_cache) > CONTEXT_CACHE_SIZE:
+            _context_cache.popitem(last=False)
+    return context
+
+# Arrow schema of each orc_data dataset, inferred from its first rows
+_orc_schemas: Dict[Path, Any] = {}
+
+# Directory name used for a null partition value, as in Hive
+_PARTITION_NULL = "__HIVE_DEFAULT_PARTITION__"
+
+# Types of the partition columns of a dataset, which its directory names lose
+_PARTITION_TYPES_FILE = "_partition_types.json"
+_PARTITION_TYPES: Dict[str, Callable[[str], Any]] = {
+    "int": int, "float": float, "bool": lambda raw: raw == "True", "str": str,
+}
+
+_FILTER_OPS: Dict[str, Callable[[Any, Any], bool]] = {
+    "==": operator.eq, "!=": operator.ne, "<": operator.lt, "<=": operator.le,
+    ">": operator.gt, ">=": operator.ge,
+    "in": lambda value, operand: value in operand,
+    "not in": lambda value, operand: value not in operand,
+}
+
+def _chunked(rows: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    iterator = iter(rows)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def _partition_path(row: Dict[str, Any], partition_by: Tuple[str, ...]) -> str:
+    """Relative directory of a row in a dataset, e.g. ``category=perf/month=2024-08``."""
+    parts = []
+    for column in partition_by:
+        value = row.get(column)
+        parts.append(f"{column}={_PARTITION_NULL if value is None else quote(str(value), safe='')}")
+    return "/".join(parts)
+
+def _note_partition_types(rows: List[Dict[str, Any]], partition_by: Tuple[str, ...],
+                          types: Dict[str, str]) -> None:
+    """Record the type of each partition column; mixed or other types are text."""
+    for row in rows:
+        for column in partition_by:
+            value = row.get(column)
+            if value is None:
+                continue
+            name = type(value).__name__
+            name = name if name in _PARTITION_TYPES else "str"
+            if types.setdefault(column, name) != name:
+                types[column] = "str"
+
+def _load_partition_types(dataset: Path) -> Dict[str, str]:
+    try:
+        return _json_loads((dataset / _PARTITION_TYPES_FILE).read_bytes())
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def _save_partition_types(dataset: Path, types: Dict[str, str], merge: bool) -> None:
+    if merge:
+        for column, name in _load_partition_types(dataset).items():
+            if types.setdefault(column, name) != name:
+                types[column] = "str"
+    if types:
+        _atomic_write_document(dataset / _PARTITION_TYPES_FILE, types, _SERIALIZERS["json"])
+
+def _check_filters(filters: Optional[Iterable[Tuple[str, str, Any]]]) -> List[Tuple[str, str, Any]]:
+    checked = []
+    for condition in filters or ():
+        column, op, operand = condition
+        if op not in _FILTER_OPS:
+            raise ValueError(f"Unknown filter operator {op!r}; expected one of {', '.join(_FILTER_OPS)}")
+        if op in ("in", "not in"):
+            operand = list(operand)
+        checked.append((column, op, operand))
+    return checked
+
+def _value_matches(value: Any, op: str, operand: Any) -> bool:
+    """Apply one filter to a value; nulls and incomparable values never match."""
+    if value is None:
+        return False
+    try:
+        return bool(_FILTER_OPS[op](value, operand))
+    except TypeError:
+        return False
+
+def _coerce_like(value: Any, like: Any) -> Any:
+    """``value`` converted to the type of a filter operand, if it can be."""
+    if value is None or like is None or type(value) is type(like):
+        return value
+    if isinstance(like, bool):
+        return value == "True" if isinstance(value, str) else value
+    try:
+        return type(like)(value)
+    except (TypeError, ValueError):
+        return value
+
+def _partition_matches(column: str, value: Any, filters: List[Tuple[str, str, Any]]) -> bool:
+    for name, op, operand in filters:
+        if name == column:
+            like = (operand[0] if operand else None) if isinstance(operand, list) else operand
+            if not _value_matches(_coerce_like(value, like), op, operand):
+                return False
+    return True
+
+def _dataset_files(root: Path, pattern: str, filters: List[Tuple[str, str, Any]],
+                   partitions: Optional[Dict[str, Any]] = None,
+                   types: Optional[Dict[str, str]] = None) -> Iterator[Tuple[Path, Dict[str, Any]]]:
+    """Files of a partitioned dataset, skipping partitions the filters rule out.
+
+    Partition values come back with the types recorded when they were
+    written; datasets without recorded types give strings.
+    """
+    partitions = partitions or {}
+    if types is None:
+        types = _load_partition_types(root)
+    with os.scandir(root) as scan:
+        entries = sorted(scan, key=lambda entry: entry.name)
+    for entry in entries:
+        if entry.is_dir():
+            column, sep, raw = entry.name.partition("=")
+            if not sep:
+                continue
+            value = None if raw == _PARTITION_NULL else unquote(raw)
+            if value is not None:
+                try:
+                    value = _PARTITION_TYPES[types.get(column, "str")](value)
+                except (KeyError, ValueError):
+                    pass
+            if _partition_matches(column, value, filters):
+                yield from _dataset_files(Path(entry.path), pattern, filters, {**partitions, column: value}, types)
+        elif fnmatch.fnmatch(entry.name, pattern):
+            yield Path(entry.path), partitions
+
+def _stats_may_match(stats: List[Any], op: str, operand: Any) -> bool:
+    """Whether a stripe with column statistics ``[min, max, nulls]`` can match."""
+    low, high = stats[0], stats[1]
+    if low is None:
+        return False  # only nulls
+    try:
+        if op == "==":
+            return low <= operand <= high
+        if op == "!=":
+            return not low == high == operand
+        if op in ("<", "<="):
+            return _FILTER_OPS[op](low, operand)
+        if op in (">", ">="):
+            return _FILTER_OPS[op](high, operand)
+        if op == "in":
+            return any(low <= value <= high for value in operand)
+        return not (low == high and low in operand)
+    except TypeError:
+        return True
+
+def _orc_stats_file(orc_file: Path) -> Path:
+    return orc_file.with_name(orc_file.name[:-len(".orc")] + ".stats.json")
+
+def _orc_stripe_stats(orc_file: Path) -> Dict[str, Any]:
+    """Min, max and null count of the scalar columns of every stripe in a file."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.orc as orc
+
+    reader = orc.ORCFile(str(orc_file))
+    columns = [field.name for field in reader.schema
+               if pa.types.is_integer(field.type) or pa.types.is_floating(field.type)
+               or pa.types.is_string(field.type) or pa.types.is_boolean(field.type)]
+    stripes = []
+    for index in range(reader.nstripes):
+        batch = reader.read_stripe(index, columns=columns)
+        stripe: Dict[str, Any] = {"rows": batch.num_rows, "columns": {}}
+        for name, column in zip(batch.schema.names, batch.columns):
+            bounds = pc.min_max(column)
+            low, high = bounds["min"].as_py(), bounds["max"].as_py()
+            if low != low or high != high:
+                continue  # NaN has no order; leave the column unpruned
+            stripe["columns"][name] = [low, high, column.null_count]
+        stripes.append(stripe)
+    return {"rows": reader.nrows, "stripes": stripes}
+
+class _OrcPartWriter:
+    """Writes one part file of a dataset directory and its stripe statistics."""
+
+    def __init__(self, directory: Path, schema: Any):
+        import pyarrow.orc as orc
+
+        directory.mkdir(parents=True, exist_ok=True)
+        parts = sorted(directory.glob("part-*.orc"))
+        index = int(parts[-1].name[5:10]) + 1 if parts else 0
+        self.path = directory / f"part-{index:05d}.orc"
+        self.tmp_file = directory / f".{self.path.name}.{os.getpid()}.tmp"
+        self.schema = schema
+        self.writer = orc.ORCWriter(str(self.tmp_file), stripe_size=ORC_STRIPE_BYTES)
+
+    def write(self, rows: List[Dict]) -> None:
+        import pyarrow as pa
+
+        batch = pa.RecordBatch.from_pylist(rows, schema=self.schema)
+        self.writer.write(pa.Table.from_batches([batch]))
+
+    def close(self) -> None:
+        self.writer.close()
+
+    def commit(self, path: Optional[Path] = None) -> None:
+        path = path or self.path
+        stats = _orc_stripe_stats(self.tmp_file)
+        _atomic_write_document(_orc_stats_file(path), stats, _SERIALIZERS["json"])
+        os.replace(self.tmp_file, path)
+
+    def discard(self) -> None:
+        self.tmp_file.unlink(missing_ok=True)
+
+def _orc_schema(dataset: Path, first_rows: List[Dict], partition_by: Tuple[str, ...]) -> Any:
+    """Schema for new rows of a dataset: the existing one, else inferred."""
+    import pyarrow as pa
+    import pyarrow.orc as orc
+
+    schema = _orc_schemas.get(dataset)
+    if schema is None:
+        existing = next(iter(sorted(dataset.rglob("part-*.orc"))), None) if dataset.is_dir() else None
+        if existing is not None:
+            schema = orc.ORCFile(str(existing)).schema
+        else:
+            # Inferred as one struct so every key of the chunk becomes a column,
+            # not just the first row's
+            schema = pa.schema(list(pa.array(first_rows).type)) if first_rows else pa.schema([])
+            for column in partition_by:
+                if column in schema.names:
+                    schema = schema.remove(schema.get_field_index(column))
+            # ORC has no null type; a column with no values yet is stored as text
+            for index, field in enumerate(schema):
+                if pa.types.is_null(field.type):
+                    schema = schema.set(index, field.with_type(pa.string()))
+        _orc_schemas[dataset] = schema
+    return schema
+
+def _write_orc_dataset(orc_dir: Path, filename: str, chunks: Iterator[List[Dict]], append: bool,
+                       partition_by: Tuple[str, ...]) -> Path:
+    single = orc_dir / f"{filename}.orc"
+    dataset = orc_dir / filename
+    first = next(chunks, None)
+    if first is None and (append or partition_by):
+        if not append:
+            _remove_orc_dataset(orc_dir, filename)
+            dataset.mkdir()
+        return dataset
+    if append:
+        root = dataset
+        root.mkdir(exist_ok=True)
+        if single.exists():
+            if _orc_stats_file(single).exists():
+                os.replace(_orc_stats_file(single), root / "part-00000.stats.json")
+            os.replace(single, root / "part-00000.orc")
+    else:
+        _orc_schemas.pop(dataset, None)
+        root = orc_dir / f".{filename}.{os.getpid()}.tmp"
+        shutil.rmtree(root, ignore_errors=True)
+    schema = _orc_schema(dataset, first or [], partition_by)
+
+    writers: Dict[str, _OrcPartWriter] = {}
+    types: Dict[str, str] = {}
+    try:
+        if first is None:
+            writers[""] = _OrcPartWriter(root, schema)
+            writers[""].writer.write(schema.empty_table())
+        known = set(schema.names).union(partition_by)
+        for chunk in itertools.chain([first] if first else [], chunks):
+            unknown = {key for row in chunk for key in row}.difference(known)
+            if unknown:
+                raise ValueError(f"Columns {sorted(unknown)} are not in the schema of ORC dataset "
+                                 f"{filename!r} ({schema.names}); write it again without append to add them")
+            _note_partition_types(chunk, partition_by, types)
+            groups: Dict[str, List[Dict]] = {}
+            for row in chunk:
+                groups.setdefault(_partition_path(row, partition_by), []).append(row)
+            for relative, rows in groups.items():
+                writer = writers.get(relative)
+                if writer is None:
+                    writer = writers[relative] = _OrcPartWriter(root / relative if relative else root, schema)
+                writer.write(rows)
+        for writer in writers.values():
+            writer.close()
+        if append:
+            for writer in writers.values():
+                writer.commit()
+            _save_partition_types(root, types, merge=True)
+            return dataset
+        if partition_by:
+            for writer in writers.values():
+                writer.commit()
+            _save_partition_types(root, types, merge=False)
+            _remove_orc_dataset(orc_dir, filename)
+            os.replace(root, dataset)
+            return dataset
+        writers[""].commit(single)
+        _remove_orc_dataset(orc_dir, filename, keep_single=True)
+        return single
+    except BaseException:
+        for writer in writers.values():
+            writer.discard()
+        raise
+    finally:
+        if not append:
+            shutil.rmtree(root, ignore_errors=True)
+
+def _remove_orc_dataset(orc_dir: Path, filename: str, keep_single: bool = False) -> None:
+    if (orc_dir / filename).is_dir():
+        shutil.rmtree(orc_dir / filename)
+    if not keep_single:
+        for path in (orc_dir / f"{filename}.orc", orc_dir / f"{filename}.stats.json"):
+            path.unlink(missing_ok=True)
+
+def _write_json_array(path: Path, chunks: Iterable[List[Dict]], append: bool) -> None:
+    """Stream rows into a JSON array file, extending it in place if ``append``."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if append and path.exists():
+        f = open(path, 'r+b')
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) != b"]":
+            f.close()
+            raise ValueError(f"{path} is not a JSON array")
+        f.seek(-1, os.SEEK_END)
+        empty = f.tell() == 1
+        f.truncate()
+    else:
+        f = open(path, 'wb')
+        f.write(b"[")
+        empty = True
+    with f:
+        for chunk in chunks:
+            body = _encode_record(chunk)[1:-1].encode("utf-8")
+            if body:
+                f.write(body if empty else b"," + body)
+                empty = False
+        f.write(b"]")
+    _note_file_write(path)
+
+def _write_json_fallback(orc_dir: Path, filename: str, chunks: Iterator[List[Dict]], append: bool,
+                         partition_by: Tuple[str, ...]) -> Path:
+    if not partition_by:
+        json_file = orc_dir / f"{filename}_fallback.json"
+        _write_json_array(json_file, chunks, append)
+        return json_file
+    dataset = orc_dir / f"{filename}_fallback"
+    if not append and dataset.is_dir():
+        shutil.rmtree(dataset)
+    dataset.mkdir(exist_ok=True)
+    types: Dict[str, str] = {}
+    for chunk in chunks:
+        _note_partition_types(chunk, partition_by, types)
+        groups: Dict[str, List[Dict]] = {}
+        for row in chunk:
+            groups.setdefault(_partition_path(row, partition_by), []).append(row)
+        for relative, rows in groups.items():
+            _write_json_array(dataset / relative / "data.json", [rows], append=True)
+    _save_partition_types(dataset, types, merge=append)
+    return dataset
+
+@_instrument
+def create_orc_data(data: Iterable[Dict], filename: str, chunk_size: int = ORC_CHUNK_ROWS,
+                    append: bool = False, partition_by: Iterable[str] = ()) -> None:
+    """Create ORC file for analytical data (requires pyarrow).
+
+    ``data`` may be any iterable of dicts, including a generator: rows are
+    converted to Arrow record batches ``chunk_size`` at a time and written
+    through ``pyarrow.orc.ORCWriter``, so memory stays bounded however long
+    the history is; ``chunk_size`` must be at least 1. The schema is
+    inferred from all keys of the first chunk and cached for the dataset; a
+    later row with a key outside it raises ValueError. With ``append=True``
+    the rows are added to an existing dataset as a new part file instead of
+    replacing it.
+
+    ``partition_by`` names columns to split the dataset on, Hive style:
+    ``partition_by=("category", "month")`` writes
+    ``orc_data/<filename>/category=perf/month=2024-08/part-00000.orc``. Each
+    part file gets per-stripe min/max statistics in a ``.stats.json``
+    sidecar, which read_orc_data() uses to skip stripes.
+    """
+    if chunk_size < 1:
+        raise ValueError(f"chunk_size must be at least 1, not {chunk_size!r}")
     # Ensure directory exists
     orc_dir = MEMORY_DIR / "orc_data"
     orc_dir.mkdir(parents=True, exist_ok=True)
+    chunks = _chunked(data, chunk_size)
+    partition_by = tuple(partition_by)
     
     try:
-        import pyarrow as pa
-        import pyarrow.orc as orc
-        import pandas as pd
-        
-        df = pd.DataFrame(data)
-        table = pa.Table.from_pandas(df)
-        
-        orc_file = orc_dir / f"{filename}.orc"
-        with open(orc_file, 'wb') as f:
-            orc.write_table(table, f)
-        
-        print(f"ORC file created: {orc_file}")
-        
+        import pyarrow  # noqa: F401
+        import pyarrow.orc  # noqa: F401
     except ImportError:
         print("PyArrow not available. Install with: pip install pyarrow")
         # Fallback to JSON
-        json_file = orc_dir / f"{filename}_fallback.json"
-        with open(json_file, 'w') as f:
-            json.dump(data, f, indent=2)
+        json_file = _write_json_fallback(orc_dir, filename, chunks, append, partition_by)
         print(f"Fallback JSON created: {json_file}")
+        return
 
-def memory_summary() -> Dict[str, Any]:
-    """Get a summary of all memory data."""
-    summary = {
+    orc_file = _write_orc_dataset(orc_dir, filename, chunks, append, partition_by)
+    print(f"ORC file created: {orc_file}")
+
+def _project_row(row: Dict[str, Any], columns: Optional[List[str]]) -> Dict[str, Any]:
+    if columns is None:
+        return row
+    return {column: row.get(column) for column in columns}
+
+def _read_orc_file(orc_file: Path, partitions: Dict[str, Any], columns: Optional[List[str]],
+                   filters: List[Tuple[str, str, Any]]) -> Iterator[Dict[str, Any]]:
+    """Rows of one ORC file, reading only the stripes and columns needed."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.orc as orc
+
+    row_filters = [f for f in filters if f[0] not in partitions]
+    reader = orc.ORCFile(str(orc_file))
+    names = reader.schema.names
+    if any(column not in names for column, _, _ in row_filters):
+        return  # a filter on a column the file lacks matches only nulls
+    wanted = names if columns is None else [c for c in columns if c in names]
+    read = list(dict.fromkeys(wanted + [column for column, _, _ in row_filters]))
+
+    stripes: Optional[List[Dict[str, Any]]] = None
+    try:
+        stats = _json_loads(_orc_stats_file(orc_file).read_bytes())
+        if stats["rows"] == reader.nrows and len(stats["stripes"]) == reader.nstripes:
+            stripes = stats["stripes"]
+    except (FileNotFoundError, ValueError, KeyError):
+        pass
+
+    expression = None
+    for column, op, operand in row_filters:
+        field = pc.field(column)
+        if op == "in":
+            term = field.isin(operand)
+        elif op == "not in":
+            term = ~field.isin(operand) & field.is_valid()
+        else:
+            term = _FILTER_OPS[op](field, operand)
+        expression = term if expression is None else expression & term
+
+    extra = {key: value for key, value in partitions.items() if columns is None or key in columns}
+    for index in range(reader.nstripes):
+        if stripes is not None:
+            stripe_columns = stripes[index]["columns"]
+            if not all(column not in stripe_columns or _stats_may_match(stripe_columns[column], op, operand)
+                       for column, op, operand in row_filters):
+                continue
+        table = pa.Table.from_batches([reader.read_stripe(index, columns=read)])
+        if expression is not None:
+            table = table.filter(expression)
+        for row in table.select(wanted).to_pylist():
+            if extra:
+                row.update(extra)
+            yield _project_row(row, columns)
+
+@_instrument
+def read_orc_data(name: str, columns: Optional[Iterable[str]] = None,
+                  filters: Optional[Iterable[Tuple[str, str, Any]]] = None) -> List[Dict[str, Any]]:
+    """Read rows of an orc_data dataset written by create_orc_data().
+
+    ``columns`` limits the fields returned (and read). ``filters`` is a list of
+    ``(column, op, value)`` conditions that must all hold, with ``op`` one of
+    ``==``, ``!=``, ``<``, ``<=``, ``>``, ``>=``, ``in`` and ``not in``; rows
+    where the column is null never match. Partition directories that cannot
+    match are skipped without being opened, and in ORC files so are stripes
+    whose statistics rule them out. Partition columns come back with the
+    type they were written with (int, float, bool or str), and are compared
+    to a filter value after conversion to its type. Without pyarrow, the
+    JSON fallback written by create_orc_data() is read and filtered the same
+    way.
+    """
+    orc_dir = MEMORY_DIR / "orc_data"
+    columns = None if columns is None else list(columns)
+    filters = _check_filters(filters)
+
+    single = orc_dir / f"{name}.orc"
+    dataset = orc_dir / name
+    if single.exists() or dataset.is_dir():
+        try:
+            import pyarrow.orc  # noqa: F401
+        except ImportError:
+            raise ImportError("Reading ORC data requires pyarrow. Install with: pip install pyarrow") from None
+        files = [(single, {})] if single.exists() else []
+        if dataset.is_dir():
+            files.extend(_dataset_files(dataset, "part-*.orc", filters))
+        return [row for path, partitions in files for row in _read_orc_file(path, partitions, columns, filters)]
+
+    single = orc_dir / f"{name}_fallback.json"
+    dataset = orc_dir / f"{name}_fallback"
+    if not single.exists() and not dataset.is_dir():
+        raise FileNotFoundError(f"No orc_data dataset named {name!r}")
+    files = [(single, {})] if single.exists() else []
+    if dataset.is_dir():
+        files.extend(_dataset_files(dataset, "data.json", filters))
+    rows = []
+    for path, partitions in files:
+        row_filters = [f for f in filters if f[0] not in partitions]
+        for row in _json_loads(path.read_bytes()):
+            if all(_value_matches(row.get(column), op, operand) for column, op, operand in row_filters):
+                rows.append(_project_row(row, columns))
+    return rows
+
+@_instrument
+def export_pretty(dest_dir: Optional[Path] = None) -> Path:
+    """Write indented JSON copies of all memory for reading and debugging.
+
+    Works with any backend and serializer. The export mirrors the directory
+    layout under ``dest_dir`` (default: MEMORY_DIR/export), with the insight
+    log written as a ``{"insights": [...]}`` document. Returns the export
+    directory.
+    """
+    dest = Path(dest_dir) if dest_dir else Path(MEMORY_DIR) / "export"
+    pretty = _SERIALIZERS["pretty"]
+    backend = get_backend()
+    
+    active = get_active_memory()
+    if active is not None:
+        _atomic_write_document(dest / "active_memory.json", active, pretty)
+    for project_key in backend.list_projects():
+        _atomic_write_document(dest / "project_memory" / f"{project_key}.json",
+                               backend.load_project(project_key), pretty)
+    _atomic_write_document(dest / "learning_memory" / LEGACY_INSIGHTS_FILE, load_session_insights(), pretty)
+    return dest
+
+class DirectoryManifest:
+    """Cached listings (file sizes and mtimes) of the memory directories.
+
+    A listing covers the regular files of a directory and of all its
+    subdirectories, keyed by relative path, and records the mtime of each
+    directory in the tree. It is reused while none of those mtimes change,
+    which holds until a file is created, removed or atomically replaced, so
+    a summary of an idle tree costs one ``stat`` per directory. Changed
+    trees are re-read with ``os.scandir``. A listing taken within
+    ``_RACY_WINDOW_NS`` of a directory's mtime is not trusted, since a
+    later change could share the same timestamp. Files appended to in place
+    keep their directory's mtime, so appends through this module update the
+    listing directly. Listings persist in ``directory_manifest.json``.
+    """
+
+    _RACY_WINDOW_NS = 2_000_000_000
+
+    def __init__(self, memory_dir: Path):
+        self.memory_dir = memory_dir
+        self.manifest_file = memory_dir / DIRECTORY_MANIFEST_FILE
+        self._lock = threading.Lock()
+        self._listings: Optional[Dict[str, Dict[str, Any]]] = None
+        self._dirty = False
+
+    def _loaded(self) -> Dict[str, Dict[str, Any]]:
+        if self._listings is None:
+            try:
+                stored = _read_document(self.manifest_file)
+            except (FileNotFoundError, ValueError):
+                stored = {}
+            # Version 1 listings did not cover subdirectories
+            directories = stored.get("directories", {}) if stored.get("version") == 2 else {}
+            self._listings = {name: dict(listing) for name, listing in directories.items()}
+        return self._listings
+
+    def _current(self, name: str, listing: Dict[str, Any]) -> bool:
+        """Whether no directory of a listed tree changed since it was scanned."""
+        for relative, mtime_ns in listing["dirs"].items():
+            try:
+                current = os.stat(self.memory_dir / name / relative).st_mtime_ns
+            except FileNotFoundError:
+                return False
+            if current != mtime_ns or listing["scanned_ns"] - current < self._RACY_WINDOW_NS:
+                return False
+        return True
+
+    def listing(self, name: str) -> Optional[Dict[str, Any]]:
+        """Listing of one directory tree, or None if it does not exist."""
+        with self._lock:
+            listings = self._loaded()
+            try:
+                mtime_ns = os.stat(self.memory_dir / name).st_mtime_ns
+            except FileNotFoundError:
+                self._dirty |= listings.pop(name, None) is not None
+                return None
+            listing = listings.get(name)
+            if listing is None or listing["mtime_ns"] != mtime_ns or not self._current(name, listing):
+                listing = listings[name] = self._scan(name, mtime_ns)
+                self._dirty = True
+            return listing
+
+    def _scan(self, name: str, mtime_ns: int) -> Dict[str, Any]:
+        scanned_ns = time.time_ns()
+        files: Dict[str, List[int]] = {}
+        dirs: Dict[str, int] = {".": mtime_ns}
+        pending = [""]
+        while pending:
+            prefix = pending.pop()
+            try:
+                scan = os.scandir(self.memory_dir / name / prefix)
+            except FileNotFoundError:
+                continue
+            with scan as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            dirs[prefix + entry.name] = entry.stat(follow_symlinks=False).st_mtime_ns
+                            pending.append(prefix + entry.name + "/")
+                        elif entry.is_file():
+                            stat = entry.stat()
+                            files[prefix + entry.name] = [stat.st_size, stat.st_mtime_ns]
+                    except FileNotFoundError:
+                        continue
+        return {"mtime_ns": mtime_ns, "scanned_ns": scanned_ns, "dirs": dirs, "files": files}
+
+    def note_write(self, path: Path) -> None:
+        """Refresh the size and mtime of a listed file after an in-place write."""
+        try:
+            name, *rest = path.relative_to(self.memory_dir).parts
+        except ValueError:
+            return
+        relative = "/".join(rest)
+        with self._lock:
+            listing = (self._listings or {}).get(name)
+            if listing is None or relative not in listing["files"]:
+                return
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                return
+            listing["files"][relative] = [stat.st_size, stat.st_mtime_ns]
+            self._dirty = True
+
+    def save(self) -> None:
+        with self._lock:
+            if self._dirty and self.memory_dir.exists():
+                _atomic_write_document(self.manifest_file, {"version": 2, "directories": self._listings})
+                self._dirty = False
+
+_directory_manifests: Dict[Path, DirectoryManifest] = {}
+
+def _directory_manifest(memory_dir: Path) -> DirectoryManifest:
+    with _backends_lock:
+        manifest = _directory_manifests.get(memory_dir)
+        if manifest is None:
+            manifest = _directory_manifests[memory_dir] = DirectoryManifest(memory_dir)
+        return manifest
+
+def _note_file_write(path: Path) -> None:
+    """Keep summary listings current for files appended to in place."""
+    for memory_dir in path.parents:
+        manifest = _directory_manifests.get(memory_dir)
+        if manifest is not None:
+            manifest.note_write(path)
+            return
+
+@_instrument
+def memory_summary(fields: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+    """Get a summary of all memory data.
+
+    ``fields`` selects the sections to compute, from SUMMARY_FIELDS:
+    ``"backend"``, ``"insight_log"``, ``"directories"`` (file count, total
+    bytes and last modification per directory), ``"files"`` (file names per
+    directory) and ``"active"`` (current session, user preferences and the
+    other active memory keys). All sections are included by default.
+    Directory sections come from the cached DirectoryManifest.
+    """
+    fields = set(SUMMARY_FIELDS if fields is None else fields)
+    unknown = fields.difference(SUMMARY_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown summary fields {sorted(unknown)}; choose from {list(SUMMARY_FIELDS)}")
+
+    summary: Dict[str, Any] = {
         "memory_directory": str(MEMORY_DIR),
         "last_updated": datetime.utcnow().isoformat(),
-        "files": {}
     }
-    
-    for category_dir in ["project_memory", "learning_memory", "orc_data", "session_logs"]:
-        category_path = MEMORY_DIR / category_dir
-        if category_path.exists():
-            files = list(category_path.glob("*"))
-            summary["files"][category_dir] = [str(f.name) for f in files]
-    
-    # Add active memory status and merge all keys into summary
-    active = get_active_memory()
-    if active:
-        summary["current_session"] = active.get("current_session", {})
-        summary["user_preferences"] = active.get("user_preferences", {})
-        # Merge all active memory keys into summary for easy access
-        for key, value in active.items():
-            if key not in ["current_session", "user_preferences", "last_updated"]:
-                summary[key] = value
+    if "backend" in fields:
+        summary["backend"] = get_backend().name
+    if "insight_log" in fields:
+        summary["insight_log"] = get_backend().insight_stats()
+
+    if fields & {"directories", "files"}:
+        manifest = _directory_manifest(Path(MEMORY_DIR))
+        listings = {name: manifest.listing(name) for name in SUMMARY_DIRECTORIES}
+        listings = {name: listing for name, listing in listings.items() if listing is not None}
+        manifest.save()
+        if "directories" in fields:
+            summary["directories"] = {
+                name: {
+                    "count": len(listing["files"]),
+                    "bytes": sum(size for size, _ in listing["files"].values()),
+                    "last_modified": time.strftime(
+                        "%Y-%m-%dT%H:%M:%S",
+                        time.gmtime(max((mtime for _, mtime in listing["files"].values()),
+                                        default=listing["mtime_ns"]) // 1_000_000_000),
+                    ),
+                }
+                for name, listing in listings.items()
+            }
+        if "files" in fields:
+            summary["files"] = {name: sorted(listing["files"]) for name, listing in listings.items()}
+
+    if "active" in fields:
+        # Add active memory status and merge all keys into summary
+        active = get_active_memory()
+        if active:
+            summary["current_session"] = active.get("current_session", {})
+            summary["user_preferences"] = active.get("user_preferences", {})
+            # Merge all active memory keys into summary for easy access
+            for key, value in active.items():
+                if key not in ["current_session", "user_preferences", "last_updated"]:
+                    summary[key] = value
     
     return summary
 
+class AsyncMemoryStore:
+    """Coroutine versions of the memory functions for asyncio applications.
+
+    Calls run on a bounded thread pool so file and database I/O never blocks
+    the event loop. Operations on the same file (active memory, one project,
+    the insight log) run in the order they were called: each file has a FIFO
+    lock, and a read waits for writes issued before it. Concurrent reads of
+    the same file that are not separated by a write share a single load; each
+    caller gets its own deep copy of the result.
+
+        async with AsyncMemoryStore(max_workers=4) as memory:
+            await memory.update_active_memory("status", "testing")
+            status = await memory.get_active_memory("status")
+    """
+
+    def __init__(self, max_workers: int = 4):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="memory-io")
+        self._locks: Dict[Any, asyncio.Lock] = {}
+        self._writes: Dict[Any, int] = {}
+        self._loads: Dict[Any, Tuple[int, "asyncio.Future[Any]"]] = {}
+
+    async def __aenter__(self) -> "AsyncMemoryStore":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.close()
+
+    def _lock(self, resource: Any) -> asyncio.Lock:
+        lock = self._locks.get(resource)
+        if lock is None:
+            lock = self._locks[resource] = asyncio.Lock()
+        return lock
+
+    async def _run(self, func: Callable[..., Any], *args: Any) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def _write(self, resource: Any, func: Callable[..., Any], *args: Any) -> Any:
+        self._writes[resource] = self._writes.get(resource, 0) + 1
+        async with self._lock(resource):
+            return await self._run(func, *args)
+
+    async def _read(self, resource: Any, load_key: Any, func: Callable[..., Any], *args: Any) -> Any:
+        writes = self._writes.get(resource, 0)
+        pending = self._loads.get(load_key)
+        if pending is not None and pending[0] == writes:
+            return copy.deepcopy(await asyncio.shield(pending[1]))
+
+        future = asyncio.get_running_loop().create_future()
+        self._loads[load_key] = (writes, future)
+        try:
+            async with self._lock(resource):
+                result = await self._run(func, *args)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            future.exception()  # retrieved here if no other caller is waiting
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            if self._loads.get(load_key, (None, None))[1] is future:
+                del self._loads[load_key]
+        return copy.deepcopy(result)
+
+    async def get_active_memory(self, key: str = None) -> Any:
+        memory = await self._read("active", ("active",), get_active_memory)
+        if key is None or memory is None:
+            return memory
+        return memory.get(key)
+
+    async def update_active_memory(self, key: str, value: Any) -> None:
+        await self._write("active", update_active_memory, key, value)
+
+    async def update_active_memory_many(self, updates: Dict[str, Any]) -> None:
+        await self._write("active", update_active_memory_many, dict(updates))
+
+    async def patch_active_memory(self, key: str, changes: Dict[str, Any]) -> None:
+        await self._write("active", patch_active_memory, key, dict(changes))
+
+    async def get_project_context(self, project_name: str = None,
+                                  path: Union[str, Iterable[Union[str, int]], None] = None) -> Any:
+        if path is not None and not isinstance(path, str):
+            path = tuple(path)
+        resource = ("project", _project_key(project_name) if project_name else None)
+        return await self._read(resource, (resource, path), get_project_context, project_name, path)
+
+    async def save_project_context(self, project_name: str, context: Dict[str, Any]) -> None:
+        await self._write(("project", _project_key(project_name)), save_project_context, project_name, context)
+
+    async def save_session_insight(self, insight: str, category: str = "general") -> None:
+        await self._write("insights", save_session_insight, insight, category)
+
+    async def save_session_insights(self, insights: Iterable[Union[str, Tuple[str, str]]],
+                                    category: str = "general") -> None:
+        await self._write("insights", save_session_insights, list(insights), category)
+
+    async def memory_summary(self, fields: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        fields = None if fields is None else tuple(sorted(fields))
+        return await self._read("summary", ("summary", fields), memory_summary, fields)
+
+    async def flush(self) -> None:
+        await self._write("active", flush_memory)
+
+    async def close(self) -> None:
+        """Flush active memory and shut the thread pool down."""
+        await self.flush()
+        await asyncio.get_running_loop().run_in_executor(None, self._executor.shutdown)
+
 if __name__ == "__main__":
-    print("AI Agent Memory System")
-    print("===================")
-    print(json.dumps(memory_summary(), indent=2))
+    parser = argparse.ArgumentParser(description="AI Agent Memory System")
+    subcommands = parser.add_subparsers(dest="command")
+    migrate = subcommands.add_parser("migrate", help="import the JSON memory tree into SQLite")
+    migrate.add_argument("--memory-dir", type=Path, default=None)
+    migrate.add_argument("--no-switch", action="store_true",
+                         help="import only; keep using the JSON backend")
+    export = subcommands.add_parser("export", help="write a pretty-printed JSON copy of all memory")
+    export.add_argument("--dest", type=Path, default=None)
+    compact = subcommands.add_parser("compact", help="apply insight retention and merge old segments")
+    compact.add_argument("--max-age-days", type=float, default=None)
+    compact.add_argument("--max-per-category", type=int, default=None)
+    tier = subcommands.add_parser("tier", help="compress idle memory into the archive/ directory")
+    tier.add_argument("--max-idle-days", type=float, default=None)
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        counts = migrate_to_sqlite(args.memory_dir, switch_backend=not args.no_switch)
+        print(f"Imported {counts['active_keys']} active keys, {counts['projects']} projects "
+              f"and {counts['insights']} insights into SQLite")
+    elif args.command == "export":
+        print(f"Exported memory to {export_pretty(args.dest)}")
+    elif args.command == "compact":
+        stats = compact_insights(args.max_age_days, args.max_per_category)
+        print(f"Removed {stats['records_removed']} insights, merged {stats['segments_merged']} segments "
+              f"and reclaimed {stats['bytes_reclaimed']} bytes")
+    elif args.command == "tier":
+        stats = tier_memory(args.max_idle_days)
+        print(f"Archived {stats['projects']} projects, {stats['insight_segments']} insight segments "
+              f"and {stats['session_logs']} session logs ({stats['bytes_before']} -> {stats['bytes_after']} bytes)")
+    else:
+        print("AI Agent Memory System")
+        print("===================")
+        print(json.dumps(memory_summary(), indent=2))